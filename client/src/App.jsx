@@ -33,6 +33,7 @@ function App() {
   const [errors, setErrors] = useState({});
 
   const abortControllerRef = useRef(null);
+  const reportVersionRef = useRef(0);
 
   const API_URL = `${import.meta.env.VITE_API_URL || 'http://localhost:8000'}/plan-trip-stream`;
 
@@ -40,6 +41,7 @@ function App() {
 
     setErrors({});
     setReportData({ markdown: '', map: null });
+    reportVersionRef.current = 0;
     setAgentStatus('Connecting to the AI Travel Agent...'); 
     setIsLoading(true);
 
@@ -75,6 +77,8 @@ function App() {
           if (response.ok && response.headers.get('content-type')?.startsWith('text/event-stream')) {
             console.log("Stream connection successfully established.");
             return; 
+          } else if (response.status === 429) {
+            throw new Error("The server is busy. Please try again in a few seconds.");
           } else {
             console.error(`Stream connection failed. Status: ${response.status}`);
             throw new Error(`Server connection error. Status: ${response.status}`);
@@ -86,12 +90,25 @@ function App() {
              if (event.event === 'status') {
                const data = JSON.parse(event.data);
                setAgentStatus(data.message);
+             } else if (event.event === 'queue_position') {
+               const data = JSON.parse(event.data);
+               setAgentStatus(`High demand right now. You are number ${data.position} in the queue...`);
              } else if (event.event === 'final_report') {
                const data = JSON.parse(event.data);
+               const version = data.version ?? 1;
+               if (version < reportVersionRef.current) {
+                 return;
+               }
+               reportVersionRef.current = version;
                setReportData({
                  markdown: data.markdown_report,
                  map: data.map_html
                });
+               if (data.draft) {
+                 // Keep the stream open: the refined report replaces the draft.
+                 setAgentStatus('Here is a first draft. Refining it with live prices...');
+                 return;
+               }
                setAgentStatus('Your itinerary is ready!');
                setIsLoading(false);
                abortControllerRef.current?.abort();
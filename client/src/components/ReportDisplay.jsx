@@ -5,7 +5,9 @@ import './ReportDisplay.css';
 
 function ReportDisplay({ isLoading, error, reportData, agentStatus }) {
 
-  if (isLoading) {
+  const hasReport = reportData && (reportData.markdown || reportData.map);
+
+  if (isLoading && !hasReport) {
     return (
       <div className="report-status-container">
         <div className="loading-spinner"></div>
@@ -23,12 +25,20 @@ function ReportDisplay({ isLoading, error, reportData, agentStatus }) {
     );
   }
 
-  if (!reportData || (!reportData.markdown && !reportData.map)) {
+  if (!hasReport) {
     return null;
   }
 
   return (
     <div className="report-display-container">
+
+      {/* A draft report is shown while the refined one is being prepared. */}
+      {isLoading && (
+        <div className="report-status-container">
+          <div className="loading-spinner"></div>
+          <p className="status-text">{agentStatus}</p>
+        </div>
+      )}
       
       {reportData.markdown && (
         <div className="markdown-content">
@@ -95,7 +95,7 @@ for service in "${services[@]}"; do
   
   echo "Processing: $name"
   
-  docker build -t $image_name $folder > /dev/null
+  docker build -t $image_name -f $folder/Dockerfile server > /dev/null
   docker push $image_name > /dev/null
   oc apply -f $yaml
   
@@ -0,0 +1,173 @@
+"""
+Admission control for graph runs.
+
+At most ADMISSION_MAX_ACTIVE_RUNS graphs run at the same time. Further requests wait
+in a bounded queue (ADMISSION_MAX_QUEUE, and ADMISSION_MAX_QUEUED_PER_CLIENT per
+client). When a slot frees up, waiting clients are served round-robin, so one client
+submitting many trips can't starve the others. Requests that don't fit in the queue
+are rejected immediately (HTTP 429) instead of slowing every run down.
+"""
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Optional
+from metrics import ADMISSION_ACTIVE_RUNS, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTIONS, ADMISSION_QUEUE_WAIT_SECONDS
+
+
+ADMISSION_MAX_ACTIVE_RUNS = int(os.getenv("ADMISSION_MAX_ACTIVE_RUNS", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_MAX_QUEUED_PER_CLIENT = int(os.getenv("ADMISSION_MAX_QUEUED_PER_CLIENT", "4"))
+QUEUE_POSITION_INTERVAL_SECONDS = 5.0
+
+
+class AdmissionRejected(Exception):
+    """The wait queue (or the client's share of it) is full."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server is busy ({reason}). Please retry in {retry_after} seconds.")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+
+    def __init__(self, client_id: str):
+        self.client_id = client_id
+        self.enqueued_at = time.monotonic()
+        self.admitted = False
+        self.released = False
+
+
+class AdmissionController:
+
+    def __init__(self, max_active: int = ADMISSION_MAX_ACTIVE_RUNS, max_queue: int = ADMISSION_MAX_QUEUE,
+                 max_queued_per_client: int = ADMISSION_MAX_QUEUED_PER_CLIENT):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.max_queued_per_client = max_queued_per_client
+        self.active = 0
+        # client_id -> deque of waiting tickets; the dict order is the round-robin order.
+        self._queues = OrderedDict()
+        self._changed: Optional[asyncio.Condition] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    def _update_gauges(self):
+        ADMISSION_ACTIVE_RUNS.set(self.active)
+        ADMISSION_QUEUE_DEPTH.set(self.queue_depth)
+
+    async def _notify(self):
+        self._update_gauges()
+        condition = self._condition()
+        async with condition:
+            condition.notify_all()
+
+    def enqueue(self, client_id: str, bounded: bool = True) -> Ticket:
+        """
+        Admits the request right away if a slot is free, otherwise queues it. Raises
+        AdmissionRejected if the queue is full. `bounded=False` skips the queue limits,
+        for callers that already limit themselves (batch runs).
+        """
+        ticket = Ticket(client_id)
+        if self.active < self.max_active and not self.queue_depth:
+            self._admit(ticket)
+            self._update_gauges()
+            return ticket
+
+        if bounded:
+            retry_after = max(1, int(QUEUE_POSITION_INTERVAL_SECONDS))
+            if self.queue_depth >= self.max_queue:
+                ADMISSION_REJECTIONS.labels(reason="queue_full").inc()
+                raise AdmissionRejected("queue full", retry_after)
+            if len(self._queues.get(client_id, ())) >= self.max_queued_per_client:
+                ADMISSION_REJECTIONS.labels(reason="client_limit").inc()
+                raise AdmissionRejected("too many queued requests for this client", retry_after)
+
+        self._queues.setdefault(client_id, deque()).append(ticket)
+        self._update_gauges()
+        return ticket
+
+    def _admit(self, ticket: Ticket):
+        ticket.admitted = True
+        self.active += 1
+        ADMISSION_QUEUE_WAIT_SECONDS.observe(time.monotonic() - ticket.enqueued_at)
+
+    def _admit_waiting(self):
+        while self.active < self.max_active and self._queues:
+            client_id, queue = next(iter(self._queues.items()))
+            self._admit(queue.popleft())
+            # The served client moves to the back of the round-robin order.
+            del self._queues[client_id]
+            if queue:
+                self._queues[client_id] = queue
+
+    def position(self, ticket: Ticket) -> int:
+        """1-based place of the ticket in the round-robin service order, 0 once admitted."""
+        if ticket.admitted:
+            return 0
+        queues = [list(queue) for queue in self._queues.values()]
+        position = 0
+        for round_index in range(max((len(q) for q in queues), default=0)):
+            for queue in queues:
+                if round_index < len(queue):
+                    position += 1
+                    if queue[round_index] is ticket:
+                        return position
+        return position
+
+    async def wait(self, ticket: Ticket) -> AsyncIterator[int]:
+        """Yields the ticket's queue position whenever it changes (and periodically) until it is admitted."""
+        last_position = None
+        last_sent = 0.0
+        condition = self._condition()
+        while not ticket.admitted:
+            position = self.position(ticket)
+            if position != last_position or time.monotonic() - last_sent >= QUEUE_POSITION_INTERVAL_SECONDS:
+                last_position, last_sent = position, time.monotonic()
+                yield position
+            async with condition:
+                # Re-checked under the lock: admission may have happened while the caller held our yield.
+                if ticket.admitted:
+                    break
+                try:
+                    await asyncio.wait_for(condition.wait(), timeout=QUEUE_POSITION_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def acquire(self, client_id: str) -> Ticket:
+        """Waits (unbounded) for a slot; used by batch runs."""
+        ticket = self.enqueue(client_id, bounded=False)
+        try:
+            async for _ in self.wait(ticket):
+                pass
+        except BaseException:
+            await self.release(ticket)
+            raise
+        return ticket
+
+    async def release(self, ticket: Ticket):
+        """Frees the ticket's slot, or removes it from the queue if it was never admitted."""
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.admitted:
+            self.active -= 1
+        else:
+            queue = self._queues.get(ticket.client_id)
+            if queue and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[ticket.client_id]
+        self._admit_waiting()
+        await self._notify()
+
+
+admission = AdmissionController()
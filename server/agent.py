@@ -1,11 +1,16 @@
 from langgraph.graph import StateGraph, START, END
 from state import TripState
+from checkpointing import memo_policy, ConditionalCache, has_activities
+from revisions import skip_if_reused
+from service_client import PRICE_CACHE_TTL_SECONDS
 from nodes import (
     planner_agent,
+    date_grid_agent,
     flight_agent,
     hotel_agent,
     event_agent,
     data_aggregator_agent,
+    selection_agent,
     activity_extraction_agent,
     geocoding_agent,
     activity_scheduling_agent,
@@ -18,15 +23,19 @@ from nodes import (
 
 workflow = StateGraph(TripState)
 
-workflow.add_node("planner", planner_agent)
+workflow.add_node("planner", skip_if_reused("planner", planner_agent), cache_policy=memo_policy("planner"))
+# Not memoized: prices change, and the service clients cache the searches behind it.
+workflow.add_node("date_grid", skip_if_reused("date_grid", date_grid_agent))
 
-workflow.add_node("flight_agent", flight_agent)
-workflow.add_node("hotel_agent", hotel_agent)
-workflow.add_node("event_agent", event_agent)
+# Flights and hotels carry prices: memoized no longer than the service clients cache them.
+workflow.add_node("flight_agent", skip_if_reused("flight_agent", flight_agent), cache_policy=memo_policy("flight_agent", ttl=PRICE_CACHE_TTL_SECONDS))
+workflow.add_node("hotel_agent", skip_if_reused("hotel_agent", hotel_agent), cache_policy=memo_policy("hotel_agent", ttl=PRICE_CACHE_TTL_SECONDS))
+workflow.add_node("event_agent", skip_if_reused("event_agent", event_agent), cache_policy=memo_policy("event_agent"))
 workflow.add_node("aggregator", data_aggregator_agent)
-workflow.add_node("activity_extractor", activity_extraction_agent)
-workflow.add_node("geocoding_agent", geocoding_agent)
-workflow.add_node("scheduler", activity_scheduling_agent)
+workflow.add_node("selector", selection_agent)
+workflow.add_node("activity_extractor", skip_if_reused("activity_extractor", activity_extraction_agent), cache_policy=memo_policy("activity_extractor"))
+workflow.add_node("geocoding_agent", skip_if_reused("geocoding_agent", geocoding_agent), cache_policy=memo_policy("geocoding_agent"))
+workflow.add_node("scheduler", skip_if_reused("scheduler", activity_scheduling_agent), cache_policy=memo_policy("scheduler"))
 workflow.add_node("evaluator", evaluator_agent)
 workflow.add_node("map_generator", map_generator_node)
 workflow.add_node("report_formatter", report_formattor_node)
@@ -34,15 +43,19 @@ workflow.add_node("report_formatter", report_formattor_node)
 
 workflow.add_edge(START, "planner")
 
-workflow.add_edge("planner", "flight_agent")
-workflow.add_edge("planner", "hotel_agent")
-workflow.add_edge("planner", "event_agent")
+workflow.add_edge("planner", "date_grid")
+
+workflow.add_edge("date_grid", "flight_agent")
+workflow.add_edge("date_grid", "hotel_agent")
+workflow.add_edge("date_grid", "event_agent")
 
 workflow.add_edge("flight_agent", "aggregator")
 workflow.add_edge("hotel_agent", "aggregator")
 workflow.add_edge("event_agent", "aggregator")
 
-workflow.add_edge("aggregator", "activity_extractor")
+workflow.add_edge("aggregator", "selector")
+
+workflow.add_edge("selector", "activity_extractor")
 
 workflow.add_edge("activity_extractor", "geocoding_agent")
 
@@ -64,4 +77,27 @@ workflow.add_conditional_edges(
 workflow.add_edge("map_generator", "report_formatter")
 workflow.add_edge("report_formatter", END)
 
-app = workflow.compile()
\ No newline at end of file
+def compile_app(checkpointer=None, cache=None):
+    """Compiles the workflow with an optional checkpointer (resumable runs) and node cache (memoization)."""
+    return workflow.compile(checkpointer=checkpointer, cache=cache)
+
+
+def compile_warm_app(cache=None):
+    """
+    Graph used by the cache warmer. It runs the activity extraction and geocoding nodes
+    under the same names and memo policies as the main workflow, so with the same
+    node cache their results are reused by the next real run for that destination.
+    Cached entries include the writes that route to the next node, so the warmed
+    nodes keep the same successors here; "scheduler" is a stand-in that does nothing.
+    Only results with activities are stored: a failed warm pass must not leave empty
+    activities for a popular destination to the real runs.
+    """
+    warm_workflow = StateGraph(TripState)
+    warm_workflow.add_node("activity_extractor", activity_extraction_agent, cache_policy=memo_policy("activity_extractor"))
+    warm_workflow.add_node("geocoding_agent", geocoding_agent, cache_policy=memo_policy("geocoding_agent"))
+    warm_workflow.add_node("scheduler", lambda state: {})
+    warm_workflow.add_edge(START, "activity_extractor")
+    warm_workflow.add_edge("activity_extractor", "geocoding_agent")
+    warm_workflow.add_edge("geocoding_agent", "scheduler")
+    warm_workflow.add_edge("scheduler", END)
+    return warm_workflow.compile(cache=ConditionalCache(cache, cache_if=has_activities) if cache is not None else None)
@@ -0,0 +1,130 @@
+"""
+Memory-bounded store for large per-run artifacts (map HTML, report HTML, raw web search text).
+
+TripState only carries references ("artifact:<run_id>:<name>"); the content lives here.
+When the in-memory total exceeds ARTIFACT_MEMORY_LIMIT_MB the least recently used
+artifacts are spilled to ARTIFACT_DIR and read back from disk on demand. Spilled
+files older than ARTIFACT_TTL_SECONDS are purged.
+"""
+import os
+import time
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Optional
+from metrics import ARTIFACT_MEMORY_BYTES, ARTIFACT_SPILLS, TRIP_ARTIFACT_BYTES
+
+
+ARTIFACT_MEMORY_LIMIT_BYTES = int(float(os.getenv("ARTIFACT_MEMORY_LIMIT_MB", "64")) * 1024 * 1024)
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "output/artifacts")
+ARTIFACT_TTL_SECONDS = int(os.getenv("ARTIFACT_TTL_SECONDS", str(24 * 3600)))
+PURGE_INTERVAL_SECONDS = 600
+
+REF_PREFIX = "artifact:"
+
+
+class ArtifactStore:
+
+    def __init__(self, memory_limit_bytes: int = ARTIFACT_MEMORY_LIMIT_BYTES, spill_dir: str = ARTIFACT_DIR):
+        self.memory_limit_bytes = memory_limit_bytes
+        self.spill_dir = spill_dir
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._run_bytes = {}
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+
+    def _path(self, run_id: str, name: str) -> str:
+        return os.path.join(self.spill_dir, run_id, name)
+
+    def _spill(self, ref: str, content: bytes):
+        _, run_id, name = ref.split(":", 2)
+        path = self._path(run_id, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+        ARTIFACT_SPILLS.inc()
+
+    def put(self, run_id: str, name: str, content: str) -> str:
+        """Stores `content` for the run and returns the reference to keep in TripState."""
+        run_id = run_id or "adhoc"
+        ref = f"{REF_PREFIX}{run_id}:{name}"
+        data = content.encode("utf-8")
+
+        to_spill = []
+        with self._lock:
+            previous = self._memory.pop(ref, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+                self._run_bytes[run_id] = self._run_bytes.get(run_id, 0) - len(previous)
+
+            self._memory[ref] = data
+            self._memory_bytes += len(data)
+            self._run_bytes[run_id] = self._run_bytes.get(run_id, 0) + len(data)
+
+            while self._memory_bytes > self.memory_limit_bytes and len(self._memory) > 1:
+                old_ref, old_data = self._memory.popitem(last=False)
+                self._memory_bytes -= len(old_data)
+                to_spill.append((old_ref, old_data))
+            ARTIFACT_MEMORY_BYTES.set(self._memory_bytes)
+
+        for old_ref, old_data in to_spill:
+            self._spill(old_ref, old_data)
+
+        self._maybe_purge()
+        return ref
+
+    def get(self, ref: Optional[str]) -> Optional[str]:
+        """Returns the content behind `ref`, or None if it is empty, unknown or expired."""
+        if not ref or not ref.startswith(REF_PREFIX):
+            return None
+        with self._lock:
+            data = self._memory.get(ref)
+            if data is not None:
+                self._memory.move_to_end(ref)
+                return data.decode("utf-8")
+
+        _, run_id, name = ref.split(":", 2)
+        try:
+            with open(self._path(run_id, name), "rb") as f:
+                return f.read().decode("utf-8")
+        except FileNotFoundError:
+            return None
+
+    def run_bytes(self, run_id: str) -> int:
+        return self._run_bytes.get(run_id, 0)
+
+    def release_run(self, run_id: str):
+        """
+        Called when a run has delivered its result: its artifacts are moved out of
+        memory (kept on disk so the run can still be resumed) and its size is recorded.
+        """
+        with self._lock:
+            refs = [ref for ref in self._memory if ref.startswith(f"{REF_PREFIX}{run_id}:")]
+            released = [(ref, self._memory.pop(ref)) for ref in refs]
+            for _, data in released:
+                self._memory_bytes -= len(data)
+            ARTIFACT_MEMORY_BYTES.set(self._memory_bytes)
+            total = self._run_bytes.pop(run_id, 0)
+
+        for ref, data in released:
+            self._spill(ref, data)
+        TRIP_ARTIFACT_BYTES.observe(total)
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge < PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = now
+        if not os.path.isdir(self.spill_dir):
+            return
+        for run_id in os.listdir(self.spill_dir):
+            run_dir = os.path.join(self.spill_dir, run_id)
+            try:
+                if now - os.path.getmtime(run_dir) > ARTIFACT_TTL_SECONDS:
+                    shutil.rmtree(run_dir, ignore_errors=True)
+            except OSError:
+                continue
+
+
+artifact_store = ArtifactStore()
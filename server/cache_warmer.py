@@ -0,0 +1,99 @@
+"""
+Background job that keeps the caches warm for the most requested destinations.
+
+Every CACHE_WARMER_INTERVAL_SECONDS the query log is aggregated into the top
+CACHE_WARMER_TOP_N destinations. For each of them the warmer pre-fetches:
+- the IATA codes (flight service) and location id (hotel service) lookups;
+- the web search results and extracted activities, by running the activity
+  extraction and geocoding nodes through the shared node cache (warm graph);
+- the geocodes of those activities (geocoding service cache);
+- the events of the most requested upcoming date windows.
+
+Flight and hotel search results themselves are not pre-fetched: prices are only
+cached for a few minutes. The job runs at low priority: it waits while user runs
+are queued or more than half of the run slots are busy, makes one upstream call at
+a time and pauses CACHE_WARMER_PACING_SECONDS between calls.
+"""
+import os
+import logging
+import time
+import asyncio
+from datetime import datetime
+from schemas import TripRequest
+from query_log import popular_trips
+from admission import admission
+from service_client import flight_warm_service, hotel_warm_service, event_service
+from metrics import CACHE_WARMER_RUNS, CACHE_WARMER_CALLS
+from common.log import bind_run_id
+
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_WARMER_ENABLED = os.getenv("CACHE_WARMER", "True") == "True"
+CACHE_WARMER_INITIAL_DELAY_SECONDS = int(os.getenv("CACHE_WARMER_INITIAL_DELAY_SECONDS", "300"))
+CACHE_WARMER_INTERVAL_SECONDS = int(os.getenv("CACHE_WARMER_INTERVAL_SECONDS", "3600"))
+CACHE_WARMER_TOP_N = int(os.getenv("CACHE_WARMER_TOP_N", "20"))
+CACHE_WARMER_LOOKBACK_DAYS = int(os.getenv("CACHE_WARMER_LOOKBACK_DAYS", "7"))
+CACHE_WARMER_DATE_WINDOWS = int(os.getenv("CACHE_WARMER_DATE_WINDOWS", "2"))
+CACHE_WARMER_PACING_SECONDS = float(os.getenv("CACHE_WARMER_PACING_SECONDS", "2"))
+IDLE_POLL_SECONDS = 5
+
+
+def _wait_until_idle():
+    """Blocks while user traffic needs the capacity; warming is only done with spare room."""
+    while admission.queue_depth > 0 or admission.active > admission.max_active // 2:
+        time.sleep(IDLE_POLL_SECONDS)
+
+
+def _call(step: str, fn, *args):
+    _wait_until_idle()
+    try:
+        fn(*args)
+        CACHE_WARMER_CALLS.labels(step=step, result="ok").inc()
+    except Exception as e:
+        CACHE_WARMER_CALLS.labels(step=step, result="error").inc()
+        logger.warning("Cache warmer: %s failed: %s", step, e)
+    time.sleep(CACHE_WARMER_PACING_SECONDS)
+
+
+def warm_once(warm_app) -> int:
+    """Warms the caches for the current top destinations; returns how many were warmed."""
+    bind_run_id("cache-warmer")
+    trips = popular_trips(CACHE_WARMER_TOP_N, CACHE_WARMER_LOOKBACK_DAYS, CACHE_WARMER_DATE_WINDOWS)
+    logger.info("Cache warmer: warming %s popular destinations.", len(trips))
+
+    for trip in trips:
+        destination = trip["destination"]
+        _call("iata_codes", flight_warm_service.post, {"cities": [trip["origin"], destination]})
+        _call("location_id", hotel_warm_service.post, {"destinations": [destination]})
+
+        if trip["interests"]:
+            # Extraction and geocoding only depend on destination and interests; the dates just fill the plan.
+            today = datetime.now().strftime("%Y-%m-%d")
+            start_date, end_date = trip["date_windows"][0] if trip["date_windows"] else (today, today)
+            trip_plan = TripRequest(
+                origin=trip["origin"], destination=destination, start_date=start_date, end_date=end_date,
+                person=trip["person"], budget=None, interests=trip["interests"], daily_spending_budget=None
+            )
+            _call("activities", warm_app.invoke, {"run_id": "cache-warmer", "trip_plan": trip_plan})
+
+        for start_date, end_date in trip["date_windows"]:
+            _call("events", event_service.post, {"city": destination, "start_date": start_date, "end_date": end_date, "interests": trip["interests"]})
+
+    return len(trips)
+
+
+async def run_cache_warmer(warm_app):
+    """Runs warm_once() periodically in a worker thread for the lifetime of the app."""
+    await asyncio.sleep(CACHE_WARMER_INITIAL_DELAY_SECONDS)
+    while True:
+        started = time.perf_counter()
+        try:
+            warmed = await asyncio.to_thread(warm_once, warm_app)
+            CACHE_WARMER_RUNS.labels(result="ok").inc()
+            logger.info("Cache warmer: %s destinations warmed in %.0fs.", warmed, time.perf_counter() - started)
+        except Exception as e:
+            CACHE_WARMER_RUNS.labels(result="error").inc()
+            logger.warning("Cache warmer run failed: %s", e)
+        await asyncio.sleep(CACHE_WARMER_INTERVAL_SECONDS)
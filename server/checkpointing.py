@@ -0,0 +1,190 @@
+import os
+import json
+import hashlib
+from typing import Any, Callable, Mapping, Optional, Sequence, Tuple
+from datetime import datetime
+from contextlib import asynccontextmanager
+from pydantic import BaseModel
+from langgraph.cache.base import BaseCache
+from deadlines import has_time, GEOCODE_ALL_MIN_SECONDS
+
+
+CHECKPOINTER = os.getenv("CHECKPOINTER", "sqlite")          # sqlite | memory | none
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", "output/checkpoints.sqlite")
+
+NODE_CACHE = os.getenv("NODE_CACHE", "sqlite")              # sqlite | memory | none
+NODE_CACHE_DB_PATH = os.getenv("NODE_CACHE_DB_PATH", "output/node_cache.sqlite")
+NODE_CACHE_TTL_SECONDS = int(os.getenv("NODE_CACHE_TTL_SECONDS", str(6 * 3600)))
+
+
+# The slice of TripState each memoized node actually reads: fields of `trip_plan`
+# plus other top-level state keys. Two runs that agree on a node's slice get the
+# node's previous output back instead of repeating its service and LLM calls.
+# (date_grid is not memoized; its entry is for revisions.py.)
+NODE_INPUTS = {
+    "planner": {
+        "trip_plan": [],
+        "state": ["user_request"],
+    },
+    "date_grid": {
+        "trip_plan": ["origin", "destination", "start_date", "end_date", "person", "flexible_days"],
+        "state": [],
+    },
+    "flight_agent": {
+        "trip_plan": ["origin", "destination", "start_date", "end_date", "person", "budget"],
+        "state": ["refinement_count"],
+    },
+    "hotel_agent": {
+        "trip_plan": ["destination", "start_date", "end_date", "person", "budget"],
+        "state": ["refinement_count", "evaluation_result", "hotel_options"],
+    },
+    "event_agent": {
+        "trip_plan": ["destination", "start_date", "end_date", "interests"],
+        "state": [],
+    },
+    "activity_extractor": {
+        "trip_plan": ["destination", "interests"],
+        "state": [],
+    },
+    "geocoding_agent": {
+        "trip_plan": ["destination"],
+        "state": ["extracted_activities"],
+    },
+    "scheduler": {
+        "trip_plan": ["destination", "start_date", "end_date"],
+        "state": ["extracted_activities", "events", "selected_flight", "selected_hotel"],
+    },
+}
+
+
+def _jsonable(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    return value
+
+
+def input_slice(node_name: str, state: dict) -> dict:
+    """Returns the part of `state` that `node_name` depends on, as plain JSON data."""
+    inputs = NODE_INPUTS[node_name]
+    trip_plan = state.get("trip_plan")
+    return {
+        "trip_plan": {field: getattr(trip_plan, field, None) for field in inputs["trip_plan"]},
+        "state": {key: _jsonable(state.get(key)) for key in inputs["state"]},
+    }
+
+
+def reused(node_name: str, state: dict) -> bool:
+    """
+    True if `node_name` keeps its output from the run being revised instead of running
+    (see revisions.py). Refinement loops after the first evaluation run every node.
+    """
+    return node_name in (state.get("reused_nodes") or ()) and not state.get("refinement_count")
+
+
+def _memo_key(node_name: str):
+    def key_func(state: dict) -> str:
+        key_data = input_slice(node_name, state)
+        if node_name == "planner":
+            # Relative dates ("next Friday") are resolved against today's date.
+            key_data["today"] = datetime.now().strftime("%Y-%m-%d")
+        if node_name == "geocoding_agent" and not has_time(state, GEOCODE_ALL_MIN_SECONDS):
+            # A deadline-shortened geocoding pass must not be served to runs with time to spare.
+            key_data["partial"] = True
+        if reused(node_name, state):
+            # The skipped node writes nothing; that must not be served to a real run.
+            key_data["reused"] = True
+        encoded = json.dumps(key_data, sort_keys=True, default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+    return key_func
+
+
+def memo_policy(node_name: str, ttl: Optional[int] = None):
+    """
+    CachePolicy memoizing `node_name` on its input slice for `ttl` seconds
+    (NODE_CACHE_TTL_SECONDS by default), or None if caching is disabled.
+    """
+    if NODE_CACHE == "none":
+        return None
+    from langgraph.types import CachePolicy
+    return CachePolicy(key_func=_memo_key(node_name), ttl=ttl or NODE_CACHE_TTL_SECONDS)
+
+
+def not_degraded(writes) -> bool:
+    """False for the writes of a node that recorded a degradation (a failed or cut-down step)."""
+    return not any(channel == "degradations" and value for channel, value in writes)
+
+
+def has_activities(writes) -> bool:
+    """True for the undegraded writes of a node that found activities (the cache warmer's nodes)."""
+    return not_degraded(writes) and any(channel == "extracted_activities" and value for channel, value in writes)
+
+
+class ConditionalCache(BaseCache):
+    """
+    Node cache that only stores the writes for which `cache_if(writes)` is true, so
+    the empty fallbacks a node returns when a service call fails are not served to
+    later runs (like common.cache.async_cached does for the services).
+    """
+
+    def __init__(self, cache: BaseCache, cache_if: Callable[[Sequence[Tuple[str, Any]]], bool] = not_degraded):
+        super().__init__(serde=cache.serde)
+        self.cache = cache
+        self.cache_if = cache_if
+
+    def _cacheable(self, pairs: Mapping) -> dict:
+        return {key: (writes, ttl) for key, (writes, ttl) in pairs.items() if self.cache_if(writes)}
+
+    def get(self, keys):
+        return self.cache.get(keys)
+
+    async def aget(self, keys):
+        return await self.cache.aget(keys)
+
+    def set(self, pairs):
+        if pairs := self._cacheable(pairs):
+            self.cache.set(pairs)
+
+    async def aset(self, pairs):
+        if pairs := self._cacheable(pairs):
+            await self.cache.aset(pairs)
+
+    def clear(self, namespaces=None):
+        self.cache.clear(namespaces)
+
+    async def aclear(self, namespaces=None):
+        await self.cache.aclear(namespaces)
+
+
+def build_node_cache():
+    if NODE_CACHE == "sqlite":
+        from langgraph.cache.sqlite import SqliteCache
+        os.makedirs(os.path.dirname(NODE_CACHE_DB_PATH) or ".", exist_ok=True)
+        return ConditionalCache(SqliteCache(path=NODE_CACHE_DB_PATH))
+    if NODE_CACHE == "memory":
+        from langgraph.cache.memory import InMemoryCache
+        return ConditionalCache(InMemoryCache())
+    return None
+
+
+@asynccontextmanager
+async def open_checkpointer():
+    """Yields the configured LangGraph checkpointer (or None) for the lifetime of the app."""
+    if CHECKPOINTER == "sqlite":
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        os.makedirs(os.path.dirname(CHECKPOINT_DB_PATH) or ".", exist_ok=True)
+        async with AsyncSqliteSaver.from_conn_string(CHECKPOINT_DB_PATH) as saver:
+            yield saver
+    elif CHECKPOINTER == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+        yield InMemorySaver()
+    else:
+        yield None
+
+
+def run_config(run_id: str) -> dict:
+    """LangGraph config addressing the checkpoints of one trip-planning run."""
+    return {"configurable": {"thread_id": run_id}}
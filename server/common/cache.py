@@ -0,0 +1,90 @@
+"""
+Small in-process caches shared by the orchestrator and the microservices.
+
+TTLCache is a thread-safe LRU with per-entry expiry. `async_cached` wraps an async
+function so concurrent calls with the same arguments share one upstream request
+and successful results are reused until they expire.
+"""
+import time
+import asyncio
+import functools
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+MISSING = object()
+
+
+class TTLCache:
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, MISSING) is not MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def async_cached(cache: TTLCache, key: Optional[Callable[..., Hashable]] = None,
+                 cache_if: Callable[[Any], bool] = bool):
+    """
+    Caches an async function's results in `cache` and coalesces concurrent calls.
+    Only results for which `cache_if(result)` is true are stored, so empty
+    fallbacks returned on upstream errors are retried on the next call.
+    """
+    def decorator(func):
+        inflight = {}
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            value = cache.get(cache_key, MISSING)
+            if value is not MISSING:
+                return value
+
+            task = inflight.get(cache_key)
+            if task is None:
+                async def fetch():
+                    result = await func(*args, **kwargs)
+                    if cache_if(result):
+                        cache.set(cache_key, result)
+                    return result
+
+                task = inflight[cache_key] = asyncio.ensure_future(fetch())
+                task.add_done_callback(lambda _: inflight.pop(cache_key, None))
+
+            return await asyncio.shield(task)
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
@@ -0,0 +1,161 @@
+"""
+Structured, non-blocking logging shared by the orchestrator and the microservices.
+
+configure_logging() sends every record through a bounded queue. The calling thread only
+merges the message arguments and attaches the current run id. A background listener
+thread formats each record as one JSON line and writes it to stdout.
+
+LOG_LEVEL filters records before any formatting happens, so debug detail costs one
+level check when it is off. Per-item messages (such as "Geocoded: X") are logged with
+`extra=SAMPLED` and only a LOG_SAMPLE_RATE fraction of them is kept. If the queue is
+full, records are dropped instead of blocking the request path; the drops are counted
+in log_records_dropped_total (when prometheus_client is installed) and reported by a
+warning once the queue has room again.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+try:
+    from prometheus_client import Counter
+except ImportError:
+    Counter = None
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+RUN_ID_HEADER = "X-Run-Id"
+
+# Pass as `extra=SAMPLED` for high-volume, per-item messages.
+SAMPLED = {"sampled": True}
+
+run_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("run_id", default=None)
+
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "Log records dropped because the log queue was full.",
+    ["service"]
+) if Counter is not None else None
+
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "run_id", "service"}
+_listener: Optional[QueueListener] = None
+
+
+def bind_run_id(run_id: Optional[str]) -> contextvars.Token:
+    """Tags every record logged from the current context (and tasks / threads copying it) with `run_id`."""
+    return run_id_var.set(run_id)
+
+
+class _ContextFilter(logging.Filter):
+    """Runs in the calling thread: drops unsampled per-item records and captures the run id."""
+
+    def __init__(self, service: str, sample_rate: float):
+        super().__init__()
+        self.service = service
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "sampled", False) and random.random() >= self.sample_rate:
+            return False
+        record.run_id = run_id_var.get()
+        record.service = self.service
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    Drops records instead of blocking when the queue is full. Drops are counted in
+    log_records_dropped_total, and the next record that fits is preceded by a
+    warning with the number of records lost since the last one.
+    """
+
+    def __init__(self, log_queue: queue.Queue, service: str):
+        super().__init__(log_queue)
+        self.service = service
+        self.dropped = 0
+        self._unreported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the cheap parts happen here; JSON encoding and the write are left to the listener.
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if self._unreported:
+                self.queue.put_nowait(self._dropped_warning(record))
+                self._unreported = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+            if LOG_RECORDS_DROPPED is not None:
+                LOG_RECORDS_DROPPED.labels(self.service).inc()
+
+    def _dropped_warning(self, record: logging.LogRecord) -> logging.LogRecord:
+        warning = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                    f"Log queue was full: dropped {self._unreported} log records.", None, None)
+        warning.message = warning.msg
+        warning.run_id = None
+        warning.service = self.service
+        return warning
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "service": getattr(record, "service", None),
+            "logger": record.name,
+            "run_id": getattr(record, "run_id", None),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in entry and key != "sampled":
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging(service: str, level: str = LOG_LEVEL, sample_rate: float = LOG_SAMPLE_RATE):
+    """Installs the queue handler on the root logger once per process."""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = _NonBlockingQueueHandler(log_queue, service)
+    queue_handler.addFilter(_ContextFilter(service, sample_rate))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+async def run_id_middleware(request, call_next):
+    """HTTP middleware for the services: binds the run id the orchestrator sends in X-Run-Id."""
+    bind_run_id(request.headers.get(RUN_ID_HEADER))
+    return await call_next(request)
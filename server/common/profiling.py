@@ -0,0 +1,191 @@
+"""
+Opt-in sampling profiler for single runs / endpoint calls, shared by the orchestrator
+and the microservices.
+
+A request is profiled when it carries `X-Profile: <PROFILE_TOKEN>` or is picked by
+PROFILE_SAMPLE_RATE. While it runs, a background thread snapshots the stacks of all
+threads (sys._current_frames) every PROFILE_INTERVAL_SECONDS. The samples are written
+as folded stacks ("thread;outer;...;inner <count>", the input format of flamegraph.pl
+and speedscope) to PROFILE_DIR/<run id>.folded. The profile is process-wide, so work
+of concurrent requests shows up in it too. Work handed to worker processes can be
+sampled there with profiled_call() and merged back with SamplingProfiler.merge().
+
+When profiling is off, the only cost is a header lookup and, with a sample rate set,
+one random() call per request.
+"""
+import os
+import re
+import sys
+import time
+import random
+import logging
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+from common.log import RUN_ID_HEADER, run_id_var
+
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "600"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "output/profiles")
+PROFILE_HEADER = "X-Profile"
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+RUN_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+
+# The profiler of the current request, if it is being profiled. The service client then
+# asks the services to profile their side too.
+active_profiler: contextvars.ContextVar[Optional["SamplingProfiler"]] = contextvars.ContextVar("active_profiler", default=None)
+
+logger = logging.getLogger(__name__)
+
+
+def should_profile(headers) -> bool:
+    """True for requests with the privileged profiling header, or picked by the sample rate."""
+    if PROFILE_TOKEN and headers.get(PROFILE_HEADER) == PROFILE_TOKEN:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def is_admin(headers) -> bool:
+    return bool(PROFILE_TOKEN) and headers.get(ADMIN_TOKEN_HEADER) == PROFILE_TOKEN
+
+
+def profile_path(run_id: str) -> Optional[str]:
+    """Path of the run's folded stacks, or None for ids that can't be a file name."""
+    if not RUN_ID_PATTERN.match(run_id or ""):
+        return None
+    return os.path.join(PROFILE_DIR, f"{run_id}.folded")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_SECONDS, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _sample(self):
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own_ident = threading.get_ident()
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            stack.append(thread_names.get(ident, f"thread-{ident}"))
+            stacks.append(";".join(reversed(stack)))
+        with self._lock:
+            self.samples.update(stacks)
+            self.sample_count += 1
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def merge(self, samples: Counter, root: str):
+        """Adds samples taken elsewhere (e.g. a worker process) under the `root` frame."""
+        with self._lock:
+            for stack, count in samples.items():
+                self.samples[f"{root};{stack}"] += count
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.samples
+
+
+def write_folded(run_id: str, samples: Counter) -> Optional[str]:
+    path = profile_path(run_id)
+    if path is None:
+        return None
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    return path
+
+
+def profiled_call(fn, *args):
+    """Runs `fn(*args)` under a profiler in this process; returns (result, samples)."""
+    profiler = SamplingProfiler()
+    profiler.start()
+    try:
+        result = fn(*args)
+    finally:
+        samples = profiler.stop()
+    return result, samples
+
+
+@contextmanager
+def profile_run(run_id: str):
+    """Samples all threads while the block runs and stores the folded stacks under `run_id`."""
+    profiler = SamplingProfiler()
+    active_profiler.set(profiler)
+    started = time.perf_counter()
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        samples = profiler.stop()
+        path = write_folded(run_id, samples)
+        logger.info("Profiled %.1fs (%s samples) into %s", time.perf_counter() - started, profiler.sample_count, path)
+
+
+def install_profiling(app):
+    """
+    For the microservices: profiles selected endpoint calls (stored under the caller's
+    X-Run-Id, or a new id returned in X-Profile-Id) and adds GET /admin/profiles/{run_id}.
+    """
+    import uuid
+    from fastapi import Request
+
+    @app.middleware("http")
+    async def profiling_middleware(request: Request, call_next):
+        if not should_profile(request.headers):
+            return await call_next(request)
+        run_id = request.headers.get(RUN_ID_HEADER) or run_id_var.get() or uuid.uuid4().hex
+        with profile_run(run_id):
+            response = await call_next(request)
+        response.headers["X-Profile-Id"] = run_id
+        return response
+
+    @app.get("/admin/profiles/{run_id}", include_in_schema=False)
+    async def download_profile(run_id: str, request: Request):
+        return profile_response(run_id, request.headers)
+
+
+def profile_response(run_id: str, headers):
+    """Body of the admin download endpoints: the folded stacks as a text file, for admins only."""
+    from fastapi import HTTPException
+    from fastapi.responses import FileResponse
+
+    if not is_admin(headers):
+        raise HTTPException(status_code=403, detail="Admin token required.")
+    path = profile_path(run_id)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"No profile stored for run '{run_id}'.")
+    return FileResponse(path, media_type="text/plain", filename=os.path.basename(path))
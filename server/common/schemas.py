@@ -0,0 +1,124 @@
+"""
+Wire schemas shared by the orchestrator and the microservices.
+
+These are the models the services return and the orchestrator works with, defined
+once for every container. SCHEMA_VERSION is sent with every service response
+(X-Schema-Version). Bump the major part for changes that old readers can't handle
+(removed or retyped fields) and the minor part for additive ones. Only responses with
+the same major version are decoded without validation, see construct_trusted().
+"""
+from functools import lru_cache
+from typing import List, Optional, Type, TypeVar, Union, get_args, get_origin
+from pydantic import BaseModel, Field
+
+
+SCHEMA_VERSION = "1.0"
+
+
+class FlightLeg(BaseModel):
+    """Schema for a single leg of a flight (either departure or return)."""
+    departure_time: str = Field(description="Departure time in HH:MM format.")
+    arrival_time: str = Field(description="Arrival time in HH:MM format.")
+    departure_airport: str = Field(description="Full name and IATA code of the departure airport.")
+    arrival_airport: str = Field(description="Full name and IATA code of the arrival airport.")
+    duration_minutes: int = Field(description="Duration of this specific leg in minutes.")
+    airline: str = Field(description="The name of the airline for this leg.")
+    flight_number: str = Field(description="The flight number, e.g., 'TK1857'.")
+    aircraft_type: str = Field(description="The type of aircraft, e.g., 'Boeing 737'.")
+    is_layover: bool = Field(default=False, description="True if this journey has a layover.")
+    layover_airport: Optional[str] = Field(default=None, description="The airport where the layover occurs.")
+    layover_duration_minutes: Optional[int] = Field(default=None, description="The duration of the layover in minutes.")
+
+class FlightInfo(BaseModel):
+    """Schema for flight information, now with detailed legs."""
+    price: float = Field(description="The total price of the round-trip flight for all passengers.")
+    departure_leg: FlightLeg
+    return_leg: FlightLeg
+    total_duration_minutes: int = Field(description="The total round-trip duration in minutes.")
+
+
+class HotelInfo(BaseModel):
+    """Schema for hotel information."""
+    hotel_name: str = Field(description="The name of the hotel.")
+    price_per_night: float = Field(description="The price per night.")
+    total_price: float = Field(description="The total price for the entire stay.")
+    rating: float = Field(description="The hotel's rating out of 9.")
+    review_count: int = Field(description="Total number of reviews for the hotel.")
+    rating_word: str = Field(description="The rating described as a word, e.g., 'Exceptional'.")
+    main_photo_url: Optional[str] = Field(default=None, description="URL of the hotel's main photo.")
+    static_map_url: Optional[str] = Field(default=None, description="URL of a static map image showing the hotel's location.")
+
+
+class EventInfo(BaseModel):
+    """Schema for a single event."""
+    name: str = Field(description="The name of the event.")
+    date: str = Field(description="The date of the event in YYYY-MM-DD format.")
+    venue: str = Field(description="The name of the venue where the event is held.")
+    url: str = Field(description="A direct URL to the event page for more details and tickets.")
+
+
+class ActivityPassage(BaseModel):
+    """A deduplicated, cleaned web search passage returned by the Activity Microservice."""
+    title: str
+    url: str
+    content: str
+    interests: List[str] = Field(description="The user interests whose searches returned this passage.")
+
+class InterestSection(BaseModel):
+    """The passages found for one of the user's interests."""
+    interest: str
+    passages: List[ActivityPassage]
+
+class ActivitySearchResult(BaseModel):
+    """Schema for the Activity Microservice response."""
+    destination: str
+    sections: List[InterestSection]
+
+
+M = TypeVar("M", bound=BaseModel)
+
+
+def is_compatible(version: Optional[str]) -> bool:
+    """True if a response written with schema `version` can be read by this code without validation."""
+    return bool(version) and version.split(".")[0] == SCHEMA_VERSION.split(".")[0]
+
+
+def _nested_model(annotation):
+    """(model, is_list) for an annotation holding a model, a list of models or an Optional of those."""
+    origin = get_origin(annotation)
+    if origin is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return _nested_model(args[0]) if len(args) == 1 else None
+    if origin is list:
+        args = get_args(annotation)
+        return (args[0], True) if args and isinstance(args[0], type) and issubclass(args[0], BaseModel) else None
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, False
+    return None
+
+
+@lru_cache(maxsize=None)
+def _nested_fields(model: Type[BaseModel]) -> dict:
+    nested = {}
+    for name, field in model.model_fields.items():
+        found = _nested_model(field.annotation)
+        if found is not None:
+            nested[name] = found
+    return nested
+
+
+def construct_trusted(model: Type[M], data: dict) -> M:
+    """
+    Builds `model` from a response of one of our own services without validating it
+    again: the service already validated it against the same schema (response_model).
+    Nested models and lists of models are constructed recursively.
+    """
+    if not isinstance(data, dict):
+        return model.model_validate(data)
+    values = dict(data)
+    for name, (nested, is_list) in _nested_fields(model).items():
+        value = values.get(name)
+        if value is None:
+            continue
+        values[name] = [construct_trusted(nested, item) for item in value] if is_list else construct_trusted(nested, value)
+    return model.model_construct(**values)
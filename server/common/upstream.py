@@ -0,0 +1,152 @@
+"""
+Shared async HTTP client for calls from the microservices to third-party APIs
+(Booking.com via RapidAPI, Ticketmaster, Tavily, Nominatim).
+
+One pooled httpx.AsyncClient per process keeps TCP/TLS connections alive between
+requests, negotiates HTTP/2 when the `h2` package is installed, caps the number of
+concurrent requests per upstream host and applies the same timeout handling everywhere.
+Requests from the orchestrator carry the run's deadline (X-Request-Deadline, epoch
+seconds); deadline_middleware binds it and upstream timeouts never run past it.
+"""
+import os
+import time
+import asyncio
+import contextvars
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_TIMEOUT_SECONDS", "20"))
+CONNECT_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT_SECONDS", "5"))
+MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+PER_HOST_CONCURRENCY = int(os.getenv("UPSTREAM_PER_HOST_CONCURRENCY", "10"))
+DEADLINE_HEADER = "X-Request-Deadline"
+
+deadline_var: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class UpstreamError(Exception):
+    """Raised for any failed upstream call: timeout, transport error or non-2xx status."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _HostPolicy:
+    def __init__(self, concurrency: int, min_interval: float = 0.0):
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self.semaphore = None
+        self.last_request_at = 0.0
+
+
+class UpstreamClient:
+
+    def __init__(self):
+        self._client = None
+        self._policies: Dict[str, _HostPolicy] = {}
+
+    def configure_host(self, host: str, concurrency: int = PER_HOST_CONCURRENCY, min_interval: float = 0.0):
+        """Overrides the concurrency limit (and optional minimum spacing between requests) for one host."""
+        self._policies[host] = _HostPolicy(concurrency, min_interval)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=_http2_available(),
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(DEFAULT_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS)
+            )
+        return self._client
+
+    def _policy(self, host: str) -> _HostPolicy:
+        policy = self._policies.get(host)
+        if policy is None:
+            policy = self._policies[host] = _HostPolicy(PER_HOST_CONCURRENCY)
+        if policy.semaphore is None:
+            policy.semaphore = asyncio.Semaphore(policy.concurrency)
+        return policy
+
+    async def request_json(self, method: str, url: str, *, params: Optional[dict] = None,
+                           json: Optional[dict] = None, headers: Optional[dict] = None,
+                           timeout: Optional[float] = None) -> Any:
+        policy = self._policy(urlsplit(url).hostname or "")
+
+        async with policy.semaphore:
+            if policy.min_interval:
+                # Reserve the next slot before sleeping, so concurrent requests queue up
+                # min_interval apart instead of all waiting for the same one.
+                now = time.monotonic()
+                slot = max(now, policy.last_request_at + policy.min_interval)
+                policy.last_request_at = slot
+                if slot > now:
+                    await asyncio.sleep(slot - now)
+
+            deadline = deadline_var.get()
+            if deadline is not None:
+                left = deadline - time.time()
+                if left <= 0:
+                    raise UpstreamError(f"Request deadline passed before calling {url}")
+                timeout = min(timeout if timeout is not None else DEFAULT_TIMEOUT_SECONDS, left)
+
+            try:
+                response = await self.client.request(
+                    method, url, params=params, json=json, headers=headers,
+                    timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+                )
+                response.raise_for_status()
+                return response.json()
+            except httpx.TimeoutException as e:
+                raise UpstreamError(f"Timeout calling {url}: {e!r}") from e
+            except httpx.HTTPStatusError as e:
+                raise UpstreamError(f"HTTP {e.response.status_code} from {url}", e.response.status_code) from e
+            except httpx.HTTPError as e:
+                raise UpstreamError(f"Transport error calling {url}: {e!r}") from e
+
+    async def get_json(self, url: str, **kwargs) -> Any:
+        return await self.request_json("GET", url, **kwargs)
+
+    async def post_json(self, url: str, **kwargs) -> Any:
+        return await self.request_json("POST", url, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+upstream = UpstreamClient()
+
+
+async def deadline_middleware(request, call_next):
+    """HTTP middleware binding the caller's X-Request-Deadline for the upstream calls of this request."""
+    value = request.headers.get(DEADLINE_HEADER)
+    try:
+        deadline_var.set(float(value) if value else None)
+    except ValueError:
+        deadline_var.set(None)
+    return await call_next(request)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """FastAPI lifespan that closes the pooled connections on shutdown."""
+    yield
+    await upstream.aclose()
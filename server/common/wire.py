@@ -0,0 +1,63 @@
+"""
+Wire format negotiation between the orchestrator and the microservices.
+
+The orchestrator asks for msgpack (`Accept: application/msgpack`) when the `msgpack`
+package is installed; services answer in msgpack if they have it too, and JSON
+otherwise. Every response carries the shared SCHEMA_VERSION so the client knows
+whether it can build its models without validating them again.
+"""
+import json
+from typing import Any
+from pydantic import BaseModel
+
+from common.schemas import SCHEMA_VERSION
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+JSON_MEDIA_TYPE = "application/json"
+SCHEMA_VERSION_HEADER = "X-Schema-Version"
+
+
+def accept_header() -> str:
+    """Accept header for requests to the services."""
+    if msgpack is not None:
+        return f"{MSGPACK_MEDIA_TYPE}, {JSON_MEDIA_TYPE};q=0.9"
+    return JSON_MEDIA_TYPE
+
+
+def _plain(content: Any) -> Any:
+    if isinstance(content, BaseModel):
+        return content.model_dump()
+    if isinstance(content, (list, tuple)):
+        return [_plain(item) for item in content]
+    return content
+
+
+def wire_response(request, content: Any):
+    """
+    Response for a service endpoint: msgpack if the caller accepts it, JSON otherwise.
+    `content` is a model, a list of models or plain data built from our own models,
+    so it is dumped as-is instead of being validated again against the response_model.
+    """
+    from fastapi.responses import Response
+
+    data = _plain(content)
+    headers = {SCHEMA_VERSION_HEADER: SCHEMA_VERSION, "Vary": "Accept"}
+    if msgpack is not None and MSGPACK_MEDIA_TYPE in request.headers.get("accept", ""):
+        return Response(msgpack.packb(data, use_bin_type=True), media_type=MSGPACK_MEDIA_TYPE, headers=headers)
+    body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return Response(body, media_type=JSON_MEDIA_TYPE, headers=headers)
+
+
+def decode_body(content_type: str, body: bytes) -> Any:
+    """Decodes a service response body according to its Content-Type."""
+    if (content_type or "").startswith(MSGPACK_MEDIA_TYPE):
+        if msgpack is None:
+            raise ValueError("Received a msgpack response but the msgpack package is not installed.")
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
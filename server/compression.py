@@ -0,0 +1,77 @@
+"""
+Content-Encoding negotiation for the orchestrator's streaming responses (SSE, NDJSON).
+
+The encoding is chosen once from the request's Accept-Encoding: brotli when the
+`brotli` package is installed, otherwise gzip. Every frame is compressed as soon as it
+is produced and the compressor is flushed after it, so events still reach the client
+one by one. Large frames (the final report with the map HTML) shrink several times;
+short status frames cost a few bytes of flush overhead.
+"""
+import os
+import zlib
+from typing import AsyncIterator, Optional, Union
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+STREAM_COMPRESSION = os.getenv("STREAM_COMPRESSION", "True") == "True"
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _FrameCompressor:
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            # wbits=31: gzip container
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def frame(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+async def _compress(stream: AsyncIterator[Union[str, bytes]], encoding: str) -> AsyncIterator[bytes]:
+    compressor = _FrameCompressor(encoding)
+    try:
+        async for chunk in stream:
+            data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+            compressed = compressor.frame(data)
+            if compressed:
+                yield compressed
+        yield compressor.finish()
+    finally:
+        # Runs the wrapped stream's cleanup (e.g. releasing the run slot) when the client leaves.
+        await stream.aclose()
+
+
+def streaming_response(stream: AsyncIterator[Union[str, bytes]], http_request: Request, media_type: str) -> StreamingResponse:
+    """StreamingResponse for `stream`, compressed frame by frame if the client accepts it."""
+    encoding = negotiate(http_request.headers.get("accept-encoding")) if STREAM_COMPRESSION else None
+    if encoding is None:
+        return StreamingResponse(stream, media_type=media_type)
+    headers = {"Content-Encoding": encoding, "Vary": "Accept-Encoding", "Cache-Control": "no-transform"}
+    return StreamingResponse(_compress(stream, encoding), media_type=media_type, headers=headers)
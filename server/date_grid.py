@@ -0,0 +1,165 @@
+"""
+Flexible dates: "what if we leave a day earlier?" answered within one run.
+
+With `flexible_days` = N in the TripRequest, the date_grid node prices every
+departure / return pair within ±N days (at most FLEX_MAX_DAYS) of the requested
+dates before the flight and hotel searches run, and moves the trip to the cheapest
+pair. Each pair costs a flight and a hotel search, sent FLEX_CONCURRENCY at a time
+through the service clients. Their caches make repeated grids cheap, and they turn
+the searches the flight and hotel nodes then make for the chosen dates into hits.
+
+Pairs are priced nearest to the requested dates first, within FLEX_MAX_CALLS
+service calls per request (cached responses are free); pairs beyond the budget,
+without a night at the destination or departing in the past stay unpriced. The
+cheapest pair is the arg-min of the flight + hotel price matrix. The grid goes to
+the client with the final report as `date_grid`:
+
+    {"departure_dates": [...], "return_dates": [...],   # the requested dates ± N
+     "flight_prices": [[...]], "hotel_prices": [[...]], "total_prices": [[...]],
+                                                        # [departure][return], null if unpriced
+     "requested": {"start_date", "end_date", "total_price"},
+     "best": {"start_date", "end_date", "flight_price", "hotel_price", "total_price"},
+     "calls": ..., "unpriced_pairs": ...}
+"""
+import os
+import logging
+import contextvars
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+import numpy as np
+import requests
+from schemas import TripRequest, FlightInfo, HotelInfo
+from service_client import flight_service, hotel_service
+
+
+FLEX_MAX_DAYS = 3
+FLEX_MAX_CALLS = int(os.getenv("FLEX_MAX_CALLS", "30"))
+FLEX_CONCURRENCY = int(os.getenv("FLEX_CONCURRENCY", "6"))
+DATE_FORMAT = "%Y-%m-%d"
+
+logger = logging.getLogger(__name__)
+
+
+def flight_payload(trip_plan: TripRequest, start_date: str, end_date: str) -> dict:
+    return {
+        "origin": trip_plan.origin,
+        "destination": trip_plan.destination,
+        "start_date": start_date,
+        "end_date": end_date,
+        "person": trip_plan.person
+    }
+
+
+def hotel_payload(trip_plan: TripRequest, start_date: str, end_date: str) -> dict:
+    return {
+        "destination": trip_plan.destination,
+        "start_date": start_date,
+        "end_date": end_date,
+        "person": trip_plan.person
+    }
+
+
+def candidate_pairs(days: int, nights: int, earliest_offset: int) -> List[Tuple[int, int]]:
+    """
+    (departure, return) offsets in [-days, days] from the requested dates, nearest
+    first. Pairs without a night at the destination (the requested stay has `nights`)
+    or departing before `earliest_offset` are left out.
+    """
+    offsets = range(-days, days + 1)
+    pairs = [
+        (dep, ret) for dep in offsets for ret in offsets
+        if nights + ret - dep >= 1 and dep >= earliest_offset
+    ]
+    return sorted(pairs, key=lambda pair: (abs(pair[0]) + abs(pair[1]), abs(pair[0]), pair))
+
+
+def _price_pair(trip_plan: TripRequest, start_date: str, end_date: str, deadline: Optional[float]) -> Tuple[float, float]:
+    """Cheapest flight and hotel for the dates; NaN where the search failed or found nothing."""
+    try:
+        flights = flight_service.post_models(flight_payload(trip_plan, start_date, end_date), FlightInfo, many=True, deadline=deadline)
+        flight_price = min((flight.price for flight in flights), default=np.nan)
+    except requests.exceptions.RequestException as e:
+        logger.warning("Flight search for %s - %s failed: %s", start_date, end_date, e)
+        flight_price = np.nan
+    try:
+        hotels = hotel_service.post_models(hotel_payload(trip_plan, start_date, end_date), HotelInfo, many=True, deadline=deadline)
+        hotel_price = min((hotel.total_price for hotel in hotels), default=np.nan)
+    except requests.exceptions.RequestException as e:
+        logger.warning("Hotel search for %s - %s failed: %s", start_date, end_date, e)
+        hotel_price = np.nan
+    return flight_price, hotel_price
+
+
+def _rows(matrix: np.ndarray) -> List[List[Optional[float]]]:
+    return [[None if np.isnan(value) else round(float(value), 2) for value in row] for row in matrix]
+
+
+def search_date_grid(trip_plan: TripRequest, deadline: Optional[float] = None) -> Optional[dict]:
+    """The price grid around the trip's dates (see the module docstring), or None if nothing could be priced."""
+    days = min(trip_plan.flexible_days or 0, FLEX_MAX_DAYS)
+    if days <= 0:
+        return None
+    start = datetime.strptime(trip_plan.start_date, DATE_FORMAT)
+    end = datetime.strptime(trip_plan.end_date, DATE_FORMAT)
+    departure_dates = [(start + timedelta(days=offset)).strftime(DATE_FORMAT) for offset in range(-days, days + 1)]
+    return_dates = [(end + timedelta(days=offset)).strftime(DATE_FORMAT) for offset in range(-days, days + 1)]
+
+    budget = FLEX_MAX_CALLS
+    priced, unpriced = [], 0
+    for dep, ret in candidate_pairs(days, (end - start).days, (date.today() - start.date()).days):
+        i, j = dep + days, ret + days
+        cost = (
+            (not flight_service.is_cached(flight_payload(trip_plan, departure_dates[i], return_dates[j])))
+            + (not hotel_service.is_cached(hotel_payload(trip_plan, departure_dates[i], return_dates[j])))
+        )
+        if cost > budget:
+            unpriced += 1
+            continue
+        budget -= cost
+        priced.append((i, j))
+
+    flight_prices = np.full((len(departure_dates), len(return_dates)), np.nan)
+    hotel_prices = np.full_like(flight_prices, np.nan)
+    with ThreadPoolExecutor(max_workers=FLEX_CONCURRENCY, thread_name_prefix="date-grid") as pool:
+        # Each search runs in a copy of this context, which carries the run id to the service call.
+        futures = {
+            (i, j): pool.submit(contextvars.copy_context().run, _price_pair, trip_plan, departure_dates[i], return_dates[j], deadline)
+            for i, j in priced
+        }
+        for (i, j), future in futures.items():
+            flight_prices[i, j], hotel_prices[i, j] = future.result()
+
+    # NaN in either matrix leaves the pair out of the arg-min.
+    total_prices = flight_prices + hotel_prices
+    if np.isnan(total_prices).all():
+        logger.info("No date pair around %s - %s could be priced.", trip_plan.start_date, trip_plan.end_date)
+        return None
+    best_i, best_j = np.unravel_index(np.nanargmin(total_prices), total_prices.shape)
+    requested_total = total_prices[days, days]
+
+    logger.info(
+        "Priced %s date pairs with %s service calls (%s left unpriced); cheapest: %s - %s.",
+        len(priced), FLEX_MAX_CALLS - budget, unpriced, departure_dates[best_i], return_dates[best_j]
+    )
+    return {
+        "departure_dates": departure_dates,
+        "return_dates": return_dates,
+        "flight_prices": _rows(flight_prices),
+        "hotel_prices": _rows(hotel_prices),
+        "total_prices": _rows(total_prices),
+        "requested": {
+            "start_date": trip_plan.start_date,
+            "end_date": trip_plan.end_date,
+            "total_price": None if np.isnan(requested_total) else round(float(requested_total), 2),
+        },
+        "best": {
+            "start_date": departure_dates[best_i],
+            "end_date": return_dates[best_j],
+            "flight_price": round(float(flight_prices[best_i, best_j]), 2),
+            "hotel_price": round(float(hotel_prices[best_i, best_j]), 2),
+            "total_price": round(float(total_prices[best_i, best_j]), 2),
+        },
+        "calls": FLEX_MAX_CALLS - budget,
+        "unpriced_pairs": unpriced,
+    }
@@ -0,0 +1,76 @@
+"""
+End-to-end deadlines for trip-planning runs.
+
+/plan-trip-stream sets an absolute deadline (epoch seconds) in TripState: the client's
+`deadline_seconds`, or REQUEST_DEADLINE_SECONDS by default. Nodes read the remaining
+budget to pick their behaviour:
+- service calls use it as their timeout and forward it in X-Request-Deadline, so
+  the services stop waiting on their upstream APIs in time too;
+- the flexible-dates grid is not searched;
+- geocoding only covers the first activities when time runs short;
+- the scheduler stops retrying a failed LLM call;
+- the evaluator skips a refinement loop it can no longer afford;
+- the map is left out and the report is rendered without HTML at the very end.
+Every such decision is recorded in `degradations` and returned with the final report,
+as are service calls that failed. A node that records a degradation is not memoized
+(see checkpointing.ConditionalCache), so its fallback isn't served to later runs.
+"""
+import os
+import time
+from typing import Optional
+from metrics import DEADLINE_DEGRADATIONS
+
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "150"))
+MAX_DEADLINE_SECONDS = float(os.getenv("MAX_REQUEST_DEADLINE_SECONDS", "600"))
+# The stream gives up this long after the deadline if a node overruns it anyway.
+DEADLINE_GRACE_SECONDS = float(os.getenv("DEADLINE_GRACE_SECONDS", "10"))
+
+# Remaining budget (seconds) each optional step needs; below it the step is cut down.
+DATE_GRID_MIN_SECONDS = 90.0
+GEOCODE_ALL_MIN_SECONDS = 45.0
+GEOCODE_MIN_SECONDS = 25.0
+GEOCODE_PRIORITY_ACTIVITIES = 6
+SCHEDULER_RETRY_MIN_SECONDS = 40.0
+REFINEMENT_MIN_SECONDS = 60.0
+MAP_MIN_SECONDS = 5.0
+# Shortest budget a render in the pool is given; with less, the map is left out and
+# the report is rendered as Markdown only, in-process.
+RENDER_MIN_SECONDS = 2.0
+# What the steps after a service call need; a service call never uses this part of the budget.
+SERVICE_CALL_RESERVE_SECONDS = 20.0
+# Shortest time the service calls of a run get; with less, every search would fail at once.
+MIN_SERVICE_BUDGET_SECONDS = 25.0
+MIN_DEADLINE_SECONDS = SERVICE_CALL_RESERVE_SECONDS + MIN_SERVICE_BUDGET_SECONDS
+
+
+def new_deadline(requested_seconds: Optional[float] = None) -> float:
+    """Absolute deadline for a run starting now, clamped to [MIN, MAX]_DEADLINE_SECONDS."""
+    seconds = requested_seconds if requested_seconds is not None else REQUEST_DEADLINE_SECONDS
+    return time.time() + min(max(seconds, MIN_DEADLINE_SECONDS), MAX_DEADLINE_SECONDS)
+
+
+def remaining(state) -> Optional[float]:
+    """Seconds left before the run's deadline, or None for runs without one."""
+    deadline = state.get("deadline") if state else None
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+
+def has_time(state, seconds: float) -> bool:
+    left = remaining(state)
+    return left is None or left >= seconds
+
+
+def service_deadline(state) -> Optional[float]:
+    """Deadline for a service call: the run's deadline minus what the later nodes need."""
+    deadline = state.get("deadline") if state else None
+    if deadline is None:
+        return None
+    return deadline - SERVICE_CALL_RESERVE_SECONDS
+
+
+def degradation(node: str, message: str) -> str:
+    DEADLINE_DEGRADATIONS.labels(node=node).inc()
+    return f"{node}: {message}"
@@ -0,0 +1,120 @@
+"""
+Draft reports for the "draft then refine" delivery of /plan-trip-stream.
+
+As soon as the planner has parsed the request, a draft itinerary is built from data
+this process already has: the last known flight, hotel and event responses of the
+service clients (peek(), no network calls) and the activities of the last run to the
+same destination. Flight and hotel are picked deterministically, the activities are
+spread over the days without an LLM and the Markdown report is rendered in-process,
+so the draft is ready in milliseconds. The refined, live-priced report replaces it
+when the graph finishes. Without a last known flight and hotel there is no draft.
+"""
+import os
+import logging
+from typing import List, Optional
+from common.cache import TTLCache
+from schemas import TripRequest, Activity, DailyPlan, Itinerary, FlightInfo, HotelInfo, EventInfo
+from service_client import flight_service, hotel_service, event_service, LAST_KNOWN_TTL_SECONDS
+from preselection import flight_objectives, hotel_objectives
+from rendering import render_report_markdown
+
+
+DRAFT_REPORTS = os.getenv("DRAFT_REPORTS", "True") == "True"
+DRAFT_MAX_EVENTS = 5
+ACTIVITIES_PER_DAY = 3
+TIME_SLOTS = ["morning", "afternoon", "evening"]
+
+DRAFT_NOTICE = (
+    "> ⏳ **Draft:** based on recently seen prices and activities. "
+    "The live-priced plan replaces it in a moment.\n\n"
+)
+
+# destination -> activities of the last run there (geocoded where possible).
+_recent_activities = TTLCache(maxsize=256, ttl=LAST_KNOWN_TTL_SECONDS)
+
+logger = logging.getLogger(__name__)
+
+
+def _destination_key(destination: str) -> str:
+    return (destination or "").strip().lower()
+
+
+def remember_activities(destination: str, activities: List[Activity]):
+    """Keeps a run's activities for the drafts of later runs to the same destination."""
+    if destination and activities:
+        _recent_activities.set(_destination_key(destination), [act.model_copy() for act in activities])
+
+
+def _slot(activity: Activity) -> int:
+    """Index of the activity's time of day in TIME_SLOTS; unknown times sort last."""
+    time_of_day = (activity.time_of_day or "").strip().lower()
+    return TIME_SLOTS.index(time_of_day) if time_of_day in TIME_SLOTS else len(TIME_SLOTS)
+
+
+def deterministic_schedule(activities: List[Activity], days: int) -> List[DailyPlan]:
+    """
+    Spreads `activities` (best first) over `days`: one morning, afternoon and evening
+    activity per day where possible, filled up to ACTIVITIES_PER_DAY with the rest.
+    """
+    left = list(activities)
+    daily_plans = []
+    for day in range(1, max(days, 1) + 1):
+        planned = []
+        for slot in range(len(TIME_SLOTS)):
+            index = next((i for i, act in enumerate(left) if _slot(act) == slot), None)
+            if index is not None:
+                planned.append(left.pop(index))
+        while len(planned) < ACTIVITIES_PER_DAY and left:
+            planned.append(left.pop(0))
+        if planned:
+            planned.sort(key=_slot)
+            daily_plans.append(DailyPlan(day=day, activities=planned))
+    return daily_plans
+
+
+def build_draft(trip_plan: TripRequest) -> Optional[str]:
+    """Markdown draft report for `trip_plan`, or None if no flight or hotel has been seen for it."""
+    flights = flight_service.peek_models({
+        "origin": trip_plan.origin,
+        "destination": trip_plan.destination,
+        "start_date": trip_plan.start_date,
+        "end_date": trip_plan.end_date,
+        "person": trip_plan.person
+    }, FlightInfo, many=True)
+    hotels = hotel_service.peek_models({
+        "destination": trip_plan.destination,
+        "start_date": trip_plan.start_date,
+        "end_date": trip_plan.end_date,
+        "person": trip_plan.person
+    }, HotelInfo, many=True)
+    if not flights or not hotels:
+        logger.info("No last known flight and hotel for %s. Skipping the draft.", trip_plan.destination)
+        return None
+
+    events = event_service.peek_models({
+        "city": trip_plan.destination,
+        "start_date": trip_plan.start_date,
+        "end_date": trip_plan.end_date,
+        "interests": trip_plan.interests
+    }, EventInfo, many=True) or []
+    activities = _recent_activities.get(_destination_key(trip_plan.destination)) or []
+
+    flight = min(flights, key=flight_objectives)
+    hotel = min(hotels, key=hotel_objectives)
+    itinerary = Itinerary(
+        selected_flight=flight,
+        selected_hotel=hotel,
+        daily_plans=deterministic_schedule(activities, trip_plan.days)
+    )
+    daily_spending = (trip_plan.daily_spending_budget or 0) * trip_plan.person * trip_plan.days
+
+    report = {
+        "trip_plan": trip_plan.model_dump(),
+        "itinerary": itinerary.model_dump(),
+        "events": [event.model_dump() for event in events[:DRAFT_MAX_EVENTS]],
+        "total_cost": flight.price + hotel.total_price + daily_spending,
+        "has_flight_options": True,
+        "has_hotel_options": True,
+    }
+    logger.info("Built a draft for %s from %s flights, %s hotels and %s activities.", trip_plan.destination, len(flights), len(hotels), len(activities))
+    return DRAFT_NOTICE + render_report_markdown(report)
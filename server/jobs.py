@@ -0,0 +1,392 @@
+"""
+Job queue and per-job event channels for EXECUTION_MODE=queue.
+
+The web process enqueues a run and streams the job's events to the client; workers
+(worker.py) claim jobs, execute the graph and publish its events. A claimed job holds
+a lease that its worker renews; when a worker dies (crash, rolling deploy) the lease
+runs out and another worker takes the job over, resuming it from its checkpoint.
+Backends (JOB_QUEUE):
+- redis: Redis lists/sorted sets for the queue and a stream per job for its events,
+  shared by any number of API and worker pods (JOB_QUEUE_URL);
+- sqlite: one database file (JOB_DB_PATH) shared by processes on the same host, for
+  local development with separate `uvicorn` and `python worker.py` processes;
+- memory: in-process, for tests; the web process then runs the workers itself.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from typing import AsyncIterator, List, Optional, Tuple
+from metrics import JOB_QUEUE_DEPTH, JOBS
+
+
+JOB_QUEUE = os.getenv("JOB_QUEUE", "sqlite")                  # redis | sqlite | memory
+JOB_QUEUE_URL = os.getenv("JOB_QUEUE_URL", "redis://localhost:6379/0")
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "output/jobs.sqlite")
+JOB_QUEUE_MAX_DEPTH = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "200"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = 3
+# Events and finished jobs are kept this long, for clients that reconnect late.
+JOB_RETENTION_SECONDS = 3600
+EVENT_POLL_SECONDS = 0.2
+QUEUE_POSITION_INTERVAL_SECONDS = 5.0
+# Published after a job's last event; ends the subscriptions to it.
+DONE_EVENT = "done"
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """More than JOB_QUEUE_MAX_DEPTH jobs are waiting."""
+
+    def __init__(self, depth: int, retry_after: int = 10):
+        super().__init__(f"Server is busy ({depth} trips waiting). Please retry in {retry_after} seconds.")
+        self.retry_after = retry_after
+
+
+class Job:
+
+    def __init__(self, job_id: str, run_id: str, payload: dict, attempts: int, created_at: float):
+        self.job_id = job_id
+        self.run_id = run_id
+        self.payload = payload
+        self.attempts = attempts
+        self.created_at = created_at
+
+
+def _failed_events(job_id: str, run_id: str) -> List[Tuple[str, dict]]:
+    logger.error("Job %s (run %s) failed %s times. Giving up.", job_id, run_id, JOB_MAX_ATTEMPTS)
+    JOBS.labels("abandoned").inc()
+    return [("error", {"message": "The trip plan could not be finished. Please try again.", "run_id": run_id}), (DONE_EVENT, {})]
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+class SqliteJobQueue:
+    """SQLite backend; `path=":memory:"` keeps everything in this process."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._shared = None
+        if path == ":memory:":
+            self._shared = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connection() as db:
+            db.executescript(_SQLITE_SCHEMA)
+
+    @contextmanager
+    def _connection(self):
+        if self._shared is not None:
+            with self._lock:
+                yield self._shared
+            return
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connection() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def enqueue(self, run_id: str, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO jobs (job_id, run_id, payload, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, run_id, json.dumps(payload), time.time())
+            )
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        """The oldest waiting job (or one whose worker's lease ran out), leased to `worker_id`."""
+        now = time.time()
+        with self._transaction() as db:
+            while True:
+                row = db.execute(
+                    "SELECT job_id, run_id, payload, attempts, created_at FROM jobs "
+                    "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1", (now,)
+                ).fetchone()
+                if row is None:
+                    return None
+                job_id, run_id, payload, attempts, created_at = row
+                if attempts >= JOB_MAX_ATTEMPTS:
+                    db.execute("UPDATE jobs SET status = 'failed', finished_at = ? WHERE job_id = ?", (now, job_id))
+                    for event, data in _failed_events(job_id, run_id):
+                        self._publish(db, job_id, event, data)
+                    continue
+                db.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, lease_until = ? WHERE job_id = ?",
+                    (worker_id, now + JOB_LEASE_SECONDS, job_id)
+                )
+                return Job(job_id, run_id, json.loads(payload), attempts + 1, created_at)
+
+    def heartbeat(self, job: Job, worker_id: str):
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                (time.time() + JOB_LEASE_SECONDS, job.job_id, worker_id)
+            )
+
+    def finish(self, job: Job):
+        with self._transaction() as db:
+            db.execute("UPDATE jobs SET status = 'done', lease_until = NULL, finished_at = ? WHERE job_id = ?", (time.time(), job.job_id))
+
+    def release(self, job: Job):
+        """Puts an unfinished job back in the queue (in its original place) without counting the attempt."""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'queued', attempts = attempts - 1, worker = NULL, lease_until = NULL WHERE job_id = ?",
+                (job.job_id,)
+            )
+
+    def depth(self) -> int:
+        with self._connection() as db:
+            return db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based position of a waiting job in the queue; None once a worker has it."""
+        with self._connection() as db:
+            row = db.execute("SELECT status, created_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None or row[0] != "queued":
+                return None
+            return db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at <= ?", (row[1],)).fetchone()[0]
+
+    @staticmethod
+    def _publish(db, job_id: str, event: str, data: dict):
+        db.execute(
+            "INSERT INTO job_events (job_id, seq, event, data, created_at) "
+            "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ? FROM job_events WHERE job_id = ?",
+            (job_id, event, json.dumps(data), time.time(), job_id)
+        )
+
+    def publish(self, job_id: str, event: str, data: dict):
+        with self._transaction() as db:
+            self._publish(db, job_id, event, data)
+
+    def read_events(self, job_id: str, cursor=None) -> Tuple[List[Tuple[str, dict]], int]:
+        """Events published after `cursor` (None: from the start) and the cursor to continue from."""
+        with self._connection() as db:
+            rows = db.execute(
+                "SELECT seq, event, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT 100",
+                (job_id, cursor or 0)
+            ).fetchall()
+        if not rows:
+            return [], cursor
+        return [(event, json.loads(data)) for _, event, data in rows], rows[-1][0]
+
+    def purge(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        with self._transaction() as db:
+            db.execute("DELETE FROM job_events WHERE created_at < ?", (cutoff,))
+            db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+
+
+class RedisJobQueue:
+    """
+    Redis backend. Waiting job ids sit in a list (taken from the right), claimed ones
+    in a sorted set scored by lease expiry; each job's events go to a Redis stream.
+    Every key expires JOB_RETENTION_SECONDS after its last use.
+    """
+
+    PENDING = "travel:jobs:pending"
+    LEASES = "travel:jobs:leases"
+
+    # Moving a job between the list and the lease set is one atomic step, so a worker
+    # that dies in between can't lose it.
+    CLAIM_SCRIPT = """
+    local job_id = redis.call('RPOP', KEYS[1])
+    if job_id then
+        redis.call('ZADD', KEYS[2], ARGV[1], job_id)
+    end
+    return job_id
+    """
+    REQUEUE_SCRIPT = """
+    if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+        return 0
+    end
+    if ARGV[2] == '1' then
+        redis.call('HINCRBY', KEYS[3], 'attempts', -1)
+    end
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    return 1
+    """
+
+    def __init__(self, url: str):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self._register_scripts()
+
+    def _register_scripts(self):
+        self._claim_script = self.redis.register_script(self.CLAIM_SCRIPT)
+        self._requeue_script = self.redis.register_script(self.REQUEUE_SCRIPT)
+
+    def _requeue(self, job_id: str, refund_attempt: bool = False) -> bool:
+        """Puts a leased job back at the head of the queue; False if its lease is gone already."""
+        keys = [self.LEASES, self.PENDING, self._job_key(job_id)]
+        return bool(self._requeue_script(keys=keys, args=[job_id, "1" if refund_attempt else "0"]))
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"travel:job:{job_id}"
+
+    @staticmethod
+    def _events_key(job_id: str) -> str:
+        return f"travel:job:{job_id}:events"
+
+    def enqueue(self, run_id: str, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        pipe = self.redis.pipeline()
+        pipe.hset(self._job_key(job_id), mapping={"run_id": run_id, "payload": json.dumps(payload), "attempts": 0, "created_at": time.time()})
+        pipe.expire(self._job_key(job_id), JOB_RETENTION_SECONDS)
+        pipe.lpush(self.PENDING, job_id)
+        pipe.execute()
+        return job_id
+
+    def _requeue_expired(self):
+        for job_id in self.redis.zrangebyscore(self.LEASES, 0, time.time()):
+            # Only the caller that removes the lease puts the job back.
+            self._requeue(job_id.decode())
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        self._requeue_expired()
+        while True:
+            job_id = self._claim_script(keys=[self.PENDING, self.LEASES], args=[time.time() + JOB_LEASE_SECONDS])
+            if job_id is None:
+                return None
+            job_id = job_id.decode()
+            key = self._job_key(job_id)
+            attempts = self.redis.hincrby(key, "attempts", 1)
+            run_id, payload, created_at = self.redis.hmget(key, "run_id", "payload", "created_at")
+            if run_id is None:
+                # Expired while waiting; nobody is listening any more.
+                self.redis.zrem(self.LEASES, job_id)
+                continue
+            run_id = run_id.decode()
+            if attempts > JOB_MAX_ATTEMPTS:
+                self.redis.zrem(self.LEASES, job_id)
+                for event, data in _failed_events(job_id, run_id):
+                    self.publish(job_id, event, data)
+                continue
+            self.redis.hset(key, "worker", worker_id)
+            return Job(job_id, run_id, json.loads(payload), attempts, float(created_at))
+
+    def heartbeat(self, job: Job, worker_id: str):
+        self.redis.zadd(self.LEASES, {job.job_id: time.time() + JOB_LEASE_SECONDS}, xx=True)
+        self.redis.expire(self._job_key(job.job_id), JOB_RETENTION_SECONDS)
+
+    def finish(self, job: Job):
+        self.redis.zrem(self.LEASES, job.job_id)
+
+    def release(self, job: Job):
+        self._requeue(job.job_id, refund_attempt=True)
+
+    def depth(self) -> int:
+        return self.redis.llen(self.PENDING)
+
+    def position(self, job_id: str) -> Optional[int]:
+        index = self.redis.lpos(self.PENDING, job_id)
+        if index is None:
+            return None
+        return self.redis.llen(self.PENDING) - index
+
+    def publish(self, job_id: str, event: str, data: dict):
+        key = self._events_key(job_id)
+        pipe = self.redis.pipeline()
+        pipe.xadd(key, {"event": event, "data": json.dumps(data)})
+        pipe.expire(key, JOB_RETENTION_SECONDS)
+        pipe.execute()
+
+    def read_events(self, job_id: str, cursor=None) -> Tuple[List[Tuple[str, dict]], str]:
+        entries = self.redis.xread({self._events_key(job_id): cursor or "0-0"}, count=100)
+        if not entries:
+            return [], cursor
+        messages = entries[0][1]
+        events = [(fields[b"event"].decode(), json.loads(fields[b"data"])) for _, fields in messages]
+        return events, messages[-1][0].decode()
+
+    def purge(self):
+        """Nothing to do: Redis expires the keys."""
+
+
+def build_job_queue():
+    if JOB_QUEUE == "redis":
+        return RedisJobQueue(JOB_QUEUE_URL)
+    if JOB_QUEUE == "memory":
+        return SqliteJobQueue(":memory:")
+    return SqliteJobQueue(JOB_DB_PATH)
+
+
+def submit(queue, run_id: str, payload: dict) -> str:
+    """Enqueues a run; raises JobQueueFull if too many runs are waiting already."""
+    depth = queue.depth()
+    JOB_QUEUE_DEPTH.set(depth)
+    if depth >= JOB_QUEUE_MAX_DEPTH:
+        JOBS.labels("rejected").inc()
+        raise JobQueueFull(depth)
+    return queue.enqueue(run_id, payload)
+
+
+async def subscribe(queue, job_id: str) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Yields the events published for `job_id` until its worker is done with it. While
+    the job waits for a worker, a `queue_position` event is sent every few seconds.
+    """
+    cursor = None
+    next_position_at = 0.0
+    while True:
+        events, cursor = await asyncio.to_thread(queue.read_events, job_id, cursor)
+        for event, data in events:
+            if event == DONE_EVENT:
+                return
+            yield event, data
+        if events:
+            continue
+
+        if time.monotonic() >= next_position_at:
+            next_position_at = time.monotonic() + QUEUE_POSITION_INTERVAL_SECONDS
+            position = await asyncio.to_thread(queue.position, job_id)
+            if position is not None:
+                depth = await asyncio.to_thread(queue.depth)
+                JOB_QUEUE_DEPTH.set(depth)
+                yield "queue_position", {"position": position, "queue_depth": depth}
+        await asyncio.sleep(EVENT_POLL_SECONDS)
@@ -1,19 +1,89 @@
+from startup import startup_phase, startup_report
 import json
+import logging
+import uuid
 import asyncio
-from fastapi import FastAPI, Request
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, Request, HTTPException
+from pydantic import BaseModel, Field
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
 from prometheus_fastapi_instrumentator import Instrumentator
 import os
 
 
-from agent import app as travel_agent_app
+from checkpointing import open_checkpointer, build_node_cache, run_config
+from artifacts import artifact_store
+from admission import admission, AdmissionRejected, Ticket
+from common.log import configure_logging, bind_run_id
+from common.profiling import should_profile, profile_response
+from compression import streaming_response
+from deadlines import new_deadline
+from jobs import JOB_QUEUE, JobQueueFull, build_job_queue, submit, subscribe
+from runs import graph_events
+from revisions import RevisionError, build_revision
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+configure_logging("orchestrator")
+logger = logging.getLogger(__name__)
+
+
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "True") == "True"
+# inline: graphs run in this process. queue: runs are handed to the workers (worker.py) through jobs.py.
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", "inline")
+
+travel_agent_app = None
+job_queue = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Builds the graph once the server process is up. In MOCK_MODE nothing heavy is loaded.
+    LLM clients and rendering libraries are warmed up in the background after the server
+    starts accepting requests, so readiness isn't delayed by them.
+    """
+    global travel_agent_app, job_queue
+    if os.getenv("MOCK_MODE") == "True":
+        yield
+        return
+
+    with startup_phase("import agent graph"):
+        from agent import compile_app, compile_warm_app
+        from cache_warmer import CACHE_WARMER_ENABLED, run_cache_warmer
+        import nodes
+
+    async with open_checkpointer() as checkpointer:
+        with startup_phase("compile graph"):
+            node_cache = build_node_cache()
+            travel_agent_app = compile_app(checkpointer=checkpointer, cache=node_cache)
+
+        background_tasks = []
+        if WARMUP_ON_STARTUP:
+            background_tasks.append(asyncio.create_task(asyncio.to_thread(nodes.warm_up)))
+        if CACHE_WARMER_ENABLED and node_cache is not None:
+            background_tasks.append(asyncio.create_task(run_cache_warmer(compile_warm_app(cache=node_cache))))
+        if EXECUTION_MODE == "queue":
+            job_queue = build_job_queue()
+            if JOB_QUEUE == "memory":
+                # Nobody else can see an in-process queue, so this process works it off too.
+                from worker import run_workers
+                background_tasks.append(asyncio.create_task(run_workers(travel_agent_app, job_queue, asyncio.Event())))
+        yield
+        for task in background_tasks:
+            task.cancel()
+        nodes.render_pool.shutdown()
 
 
 app = FastAPI(
     title="AI Travel Agent API",
-    description="An API to generate travel itineraries using a multi-agent system."
+    description="An API to generate travel itineraries using a multi-agent system.",
+    lifespan=lifespan
 )
 
 
@@ -34,68 +104,285 @@ app.add_middleware(
 
 Instrumentator().instrument(app).expose(app)
 
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "500"))
+
 class PlanRequest(BaseModel):
     user_query: str
+    deadline_seconds: Optional[float] = Field(default=None, gt=0, description="Time budget for the run. Parts of the plan are cut down to deliver a report within it.")
+
+class RevisionRequest(BaseModel):
+    """The TripRequest fields to change; fields left out keep their value."""
+    origin: Optional[str] = None
+    destination: Optional[str] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    person: Optional[int] = None
+    budget: Optional[float] = None
+    interests: Optional[List[str]] = None
+    daily_spending_budget: Optional[float] = None
+    flexible_days: Optional[int] = Field(default=None, ge=0)
+    deadline_seconds: Optional[float] = Field(default=None, gt=0, description="Time budget for the revised run.")
+
+    def changes(self) -> dict:
+        return self.model_dump(exclude_unset=True, exclude={"deadline_seconds"})
+
+class BatchPlanRequest(BaseModel):
+    requests: List[PlanRequest] = Field(min_length=1, max_length=BATCH_MAX_SIZE)
+    max_concurrency: Optional[int] = Field(default=None, ge=1, description="Lower the server's batch concurrency limit for this batch.")
 
 @app.get("/")
 def read_root():
     return {"status": "AI Travel Agent API is running."}
 
 
+@app.get("/admin/profiles/{run_id}", include_in_schema=False)
+def download_profile(run_id: str, http_request: Request):
+    """Folded stacks of a profiled run (flamegraph.pl / speedscope input). Requires X-Admin-Token."""
+    return profile_response(run_id, http_request.headers)
+
+
+@app.get("/startup-report")
+def get_startup_report():
+    """Time spent in each startup and warm-up phase of this process."""
+    return startup_report()
+
+
+def client_id_for(http_request: Request) -> str:
+    """Identifies the client for per-client queue fairness."""
+    return http_request.headers.get("X-Client-Id") or (http_request.client.host if http_request.client else "anonymous")
+
+
+def admit_or_reject(http_request: Request) -> Ticket:
+    try:
+        return admission.enqueue(client_id_for(http_request))
+    except AdmissionRejected as e:
+        logger.warning("Rejecting request from %s: %s", client_id_for(http_request), e)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+async def admitted_stream(ticket: Ticket, stream):
+    """
+    Sends `queue_position` events while the request waits for a run slot, then the
+    frames of `stream`. The slot is released when the stream ends or the client leaves.
+    """
+    try:
+        async for position in admission.wait(ticket):
+            yield sse_event("queue_position", {"position": position, "queue_depth": admission.queue_depth})
+        async for frame in stream:
+            yield frame
+    finally:
+        await admission.release(ticket)
+
+
 @app.post("/plan-trip-stream")
-async def plan_trip_stream(request: PlanRequest):
+async def plan_trip_stream(request: PlanRequest, http_request: Request):
+
+    if EXECUTION_MODE == "queue" and os.getenv("MOCK_MODE") != "True":
+        run_id = uuid.uuid4().hex
+        return await queued_run_response(run_id, initial_state_for(run_id, request), http_request)
+
+    ticket = admit_or_reject(http_request)
 
     if os.getenv("MOCK_MODE") == "True":
         async def mock_event_stream():
-            yield f"event: status\ndata: {json.dumps({'message': 'TEST MODE: Planning trip...'})}\n\n"
+            yield sse_event("status", {'message': 'TEST MODE: Planning trip...'})
             await asyncio.sleep(0.5)
             
-            yield f"event: status\ndata: {json.dumps({'message': 'TEST MODE: Calling Flight Service...'})}\n\n"
+            yield sse_event("status", {'message': 'TEST MODE: Calling Flight Service...'})
             await asyncio.sleep(0.5)
 
-            yield f"event: status\ndata: {json.dumps({'message': 'TEST MODE: Generating report...'})}\n\n"
+            yield sse_event("status", {'message': 'TEST MODE: Generating report...'})
             await asyncio.sleep(0.5)
 
             final_data = {
                 "markdown_report": "# Test Report\n\nThis is a generated response for Load Testing.",
-                "map_html": None
+                "map_html": None,
+                "version": 1,
+                "draft": False
             }
-            yield f"event: final_report\ndata: {json.dumps(final_data)}\n\n"
+            yield sse_event("final_report", final_data)
 
-        return StreamingResponse(mock_event_stream(), media_type="text/event-stream")
+        return streaming_response(admitted_stream(ticket, mock_event_stream()), http_request, "text/event-stream")
 
-    initial_state = {"user_request": request.user_query}
+    run_id = uuid.uuid4().hex
+    initial_state = initial_state_for(run_id, request)
+    stream = stream_graph_run(initial_state, run_id, profile=should_profile(http_request.headers))
 
-    async def event_stream():
-        try:
-           
-            async for chunk in travel_agent_app.astream(initial_state):
-                for key, value in chunk.items():
-                    node_name = key
-                    node_output = value
-                    
-                    status_message = f"Working on: {node_name.replace('_', ' ').title()}"
-                    print(f"Streaming status: {status_message}")
-
-                    yield f"event: status\ndata: {json.dumps({'message': status_message})}\n\n"
-                    await asyncio.sleep(0.1) 
-
-            final_state = node_output 
-            final_report_markdown = final_state.get("markdown_report")
-            map_html_content = final_state.get("map_html")
+    return streaming_response(admitted_stream(ticket, stream), http_request, "text/event-stream")
 
-            final_data = {
-                "markdown_report": final_report_markdown,
-                "map_html": map_html_content
-            }
-            yield f"event: final_report\ndata: {json.dumps(final_data)}\n\n"
 
-        except Exception as e:
-            print(f"AN ERROR OCCURRED during stream: {e}")
-            error_message = f"An error occurred: {e}"
-            yield f"event: error\ndata: {json.dumps({'message': error_message})}\n\n"
+@app.post("/plan-trip/{run_id}/resume")
+async def resume_trip_stream(run_id: str, http_request: Request):
+    """
+    Continues a failed or interrupted run from its last checkpoint. Nodes that already
+    completed (planner, searches, extraction, geocoding...) are not executed again.
+    """
+    if travel_agent_app.checkpointer is None:
+        raise HTTPException(status_code=409, detail="Checkpointing is disabled on this server.")
+
+    snapshot = await travel_agent_app.aget_state(run_config(run_id))
+    if not snapshot.values:
+        raise HTTPException(status_code=404, detail=f"No checkpoint found for run '{run_id}'.")
+
+    ticket = admit_or_reject(http_request) if EXECUTION_MODE != "queue" else None
+    try:
+        # A resumed run gets a fresh time budget; the one it started with is most likely spent.
+        await travel_agent_app.aupdate_state(run_config(run_id), {"deadline": new_deadline()})
+    except BaseException:
+        if ticket is not None:
+            await admission.release(ticket)
+        raise
+    logger.info("Resuming run %s before: %s", run_id, ', '.join(snapshot.next) or 'nothing (already finished)')
+    if EXECUTION_MODE == "queue":
+        return await queued_run_response(run_id, None, http_request)
+    stream = stream_graph_run(None, run_id, profile=should_profile(http_request.headers))
+    return streaming_response(admitted_stream(ticket, stream), http_request, "text/event-stream")
+
+
+@app.post("/plan-trip/{run_id}/revise")
+async def revise_trip_stream(run_id: str, revision: RevisionRequest, http_request: Request):
+    """
+    Replans a finished run with some trip fields changed, as a new run (streamed like
+    /plan-trip-stream). Only the nodes that depend on the changed fields run again;
+    the other results are taken over from `run_id`, see revisions.py.
+    """
+    changes = revision.changes()
+    if not changes:
+        raise HTTPException(status_code=400, detail="The revision changes no trip fields.")
+
+    new_run_id = uuid.uuid4().hex
+    deadline = new_deadline(revision.deadline_seconds)
+    try:
+        graph_input, rerun = await build_revision(travel_agent_app, run_id, changes, new_run_id, deadline)
+    except RevisionError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    logger.info("Revising run %s as %s (%s changed). Rerunning: %s", run_id, new_run_id, ', '.join(changes), ', '.join(rerun) or 'evaluation only')
+
+    if EXECUTION_MODE == "queue":
+        # The worker rebuilds the input from the shared checkpoints; it is not JSON data.
+        revision_spec = {"run_id": run_id, "changes": changes, "deadline": deadline}
+        return await queued_run_response(new_run_id, None, http_request, revision=revision_spec)
+
+    ticket = admit_or_reject(http_request)
+    stream = stream_graph_run(graph_input, new_run_id, profile=should_profile(http_request.headers))
+    return streaming_response(admitted_stream(ticket, stream), http_request, "text/event-stream")
+
+
+async def queued_run_response(run_id: str, graph_input: Optional[dict], http_request: Request, revision: Optional[dict] = None):
+    """
+    EXECUTION_MODE=queue: hands the run to the workers and streams the events they
+    publish for it. Waiting clients get `queue_position` events, as with admission.
+    """
+    payload = {"graph_input": graph_input, "revision": revision, "profile": should_profile(http_request.headers)}
+    try:
+        job_id = await asyncio.to_thread(submit, job_queue, run_id, payload)
+    except JobQueueFull as e:
+        logger.warning("Rejecting request from %s: %s", client_id_for(http_request), e)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    async def job_stream():
+        async for event, data in subscribe(job_queue, job_id):
+            yield sse_event(event, data)
+
+    return streaming_response(job_stream(), http_request, "text/event-stream")
+
+
+async def queued_run_result(run_id: str, graph_input: dict) -> dict:
+    """EXECUTION_MODE=queue: waits for the workers to finish the run; returns its report fields or `error`."""
+    try:
+        job_id = await asyncio.to_thread(submit, job_queue, run_id, {"graph_input": graph_input, "profile": False})
+    except JobQueueFull as e:
+        return {"error": str(e)}
+    result = {"error": "The run ended without a report."}
+    async for event, data in subscribe(job_queue, job_id):
+        if event == "final_report" and not data.get("draft"):
+            result = {key: data.get(key) for key in ("markdown_report", "map_html", "degradations", "date_grid")}
+        elif event == "error":
+            result = {"error": data.get("message")}
+    return result
+
+
+def initial_state_for(run_id: str, request: PlanRequest) -> dict:
+    return {
+        "run_id": run_id,
+        "user_request": request.user_query,
+        "deadline": new_deadline(request.deadline_seconds),
+        "degradations": []
+    }
+
+
+def dumps(data) -> str:
+    """orjson when installed (several times faster on the large report frames), json otherwise."""
+    if orjson is not None:
+        return orjson.dumps(data).decode("utf-8")
+    return json.dumps(data)
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {dumps(data)}\n\n"
+
+
+async def stream_graph_run(graph_input, run_id: str, profile: bool = False):
+    """SSE frames of a run executed in this process, see runs.graph_events()."""
+    async for event, data in graph_events(travel_agent_app, graph_input, run_id, profile):
+        yield sse_event(event, data)
+
+@app.post("/plan-trips/batch")
+async def plan_trips_batch(batch: BatchPlanRequest, http_request: Request):
+    """
+    Plans many trips in one call, running at most BATCH_MAX_CONCURRENCY graphs at a time.
+    Each run also takes a slot from the global admission controller, where the batch
+    counts as a single client so interactive users are served in between.
+    Trips to the same destination share their microservice lookups through the
+    service clients' caches. Results are streamed as NDJSON, one line per trip, in
+    completion order; `index` points back into the request list.
+    With EXECUTION_MODE=queue the trips are handed to the workers instead.
+    """
+    concurrency = min(batch.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(concurrency)
+    batch_client_id = f"batch:{uuid.uuid4().hex}"
+    logger.info("Received batch of %s trips (concurrency %s).", len(batch.requests), concurrency)
+
+    async def run_one(index: int, plan_request: PlanRequest) -> dict:
+        async with semaphore:
+            run_id = uuid.uuid4().hex
+            bind_run_id(run_id)
+            result = {"index": index, "run_id": run_id, "user_query": plan_request.user_query}
+            if EXECUTION_MODE == "queue" and os.getenv("MOCK_MODE") != "True":
+                result.update(await queued_run_result(run_id, initial_state_for(run_id, plan_request)))
+                return result
+
+            ticket = await admission.acquire(batch_client_id)
+            try:
+                if os.getenv("MOCK_MODE") == "True":
+                    await asyncio.sleep(0.5)
+                    final_state = {"markdown_report": "# Test Report\n\nThis is a generated response for Load Testing.", "map_html": None}
+                else:
+                    final_state = await travel_agent_app.ainvoke(initial_state_for(run_id, plan_request), run_config(run_id))
+
+                result["markdown_report"] = final_state.get("markdown_report")
+                result["map_html"] = artifact_store.get(final_state.get("map_html_ref"))
+                result["degradations"] = sorted(set(final_state.get("degradations") or []))
+                result["date_grid"] = final_state.get("date_grid")
+                artifact_store.release_run(run_id)
+            except Exception as e:
+                logger.exception("An error occurred in batch item %s: %s", index, e)
+                result["error"] = f"An error occurred: {e}"
+            finally:
+                await admission.release(ticket)
+            return result
+
+    async def ndjson_stream():
+        tasks = [asyncio.create_task(run_one(i, r)) for i, r in enumerate(batch.requests)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield dumps(await next_done) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
 
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+    return streaming_response(ndjson_stream(), http_request, "application/x-ndjson")
 
 """
 @app.post("/plan-trip")
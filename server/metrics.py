@@ -0,0 +1,170 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+
+SERVICE_LATENCY = Histogram(
+    "service_client_latency_seconds",
+    "Latency of successful orchestrator-to-microservice calls.",
+    ["service"]
+)
+
+SERVICE_HEDGED_REQUESTS = Counter(
+    "service_client_hedged_requests_total",
+    "Number of hedged (second) requests sent to a microservice.",
+    ["service"]
+)
+
+SERVICE_FAILURES = Counter(
+    "service_client_failures_total",
+    "Number of failed microservice calls, including calls rejected by an open circuit.",
+    ["service", "reason"]
+)
+
+SERVICE_CIRCUIT_OPEN = Gauge(
+    "service_client_circuit_open",
+    "1 if the circuit breaker for the service is open, 0 otherwise.",
+    ["service"]
+)
+
+SERVICE_CACHE_LOOKUPS = Counter(
+    "service_client_cache_lookups_total",
+    "Shared-lookup cache results for microservice calls (hit, miss or coalesced onto an in-flight call).",
+    ["service", "result"]
+)
+
+STARTUP_PHASE_SECONDS = Gauge(
+    "orchestrator_startup_phase_seconds",
+    "Wall-clock time spent in each orchestrator startup / warm-up phase.",
+    ["phase"]
+)
+
+ARTIFACT_MEMORY_BYTES = Gauge(
+    "artifact_store_memory_bytes",
+    "Bytes of run artifacts (map/report HTML, raw search text) currently held in memory."
+)
+
+ARTIFACT_SPILLS = Counter(
+    "artifact_store_spills_total",
+    "Number of artifacts written out of memory to the spill directory."
+)
+
+TRIP_ARTIFACT_BYTES = Histogram(
+    "trip_artifact_bytes",
+    "Total size of the artifacts produced by one trip-planning run.",
+    buckets=(16e3, 64e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6)
+)
+
+PRESELECTION_DECISIONS = Counter(
+    "selection_preselection_decisions_total",
+    "Pareto preselection outcomes: the LLM was skipped (one option dominates) or called on the frontier.",
+    ["kind", "outcome"]
+)
+
+PRESELECTION_FRONTIER_SIZE = Histogram(
+    "selection_pareto_frontier_size",
+    "Number of options left on the Pareto frontier and sent to the LLM.",
+    ["kind"],
+    buckets=(1, 2, 3, 4, 5, 8, 10, 15, 20, 30)
+)
+
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+LLM_PROMPT_TOKENS = Histogram(
+    "llm_prompt_tokens",
+    "Prompt (input) tokens per LLM call, as reported by the provider.",
+    ["node"],
+    buckets=TOKEN_BUCKETS
+)
+
+LLM_COMPLETION_TOKENS = Histogram(
+    "llm_completion_tokens",
+    "Completion (output) tokens per LLM call, as reported by the provider.",
+    ["node"],
+    buckets=TOKEN_BUCKETS
+)
+
+PROMPT_SECTION_TOKENS = Histogram(
+    "llm_prompt_section_tokens_estimated",
+    "Estimated tokens of each prompt section after budget enforcement.",
+    ["node", "section"],
+    buckets=TOKEN_BUCKETS
+)
+
+PROMPT_TRUNCATIONS = Counter(
+    "llm_prompt_truncations_total",
+    "Number of prompt sections shortened to fit the node's token budget.",
+    ["node", "section"]
+)
+
+ADMISSION_ACTIVE_RUNS = Gauge(
+    "admission_active_runs",
+    "Graph runs currently admitted and executing."
+)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth",
+    "Requests waiting in the admission queue for a free run slot."
+)
+
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total",
+    "Requests rejected with HTTP 429 because the admission queue was full.",
+    ["reason"]
+)
+
+ADMISSION_QUEUE_WAIT_SECONDS = Histogram(
+    "admission_queue_wait_seconds",
+    "Time requests spent in the admission queue before their run started.",
+    buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+
+RENDER_SECONDS = Histogram(
+    "render_task_seconds",
+    "Wall-clock time of map / report rendering, including the hop to the render process pool.",
+    ["task"]
+)
+
+RENDER_FAILURES = Counter(
+    "render_task_failures_total",
+    "Rendering tasks that timed out or lost their worker process.",
+    ["task", "reason"]
+)
+
+CACHE_WARMER_RUNS = Counter(
+    "cache_warmer_runs_total",
+    "Completed cache warmer passes over the popular destinations.",
+    ["result"]
+)
+
+CACHE_WARMER_CALLS = Counter(
+    "cache_warmer_calls_total",
+    "Pre-fetch calls made by the cache warmer, by step.",
+    ["step", "result"]
+)
+
+DEADLINE_DEGRADATIONS = Counter(
+    "deadline_degradations_total",
+    "Steps cut down or skipped because the run's deadline was close or a service call failed, by node.",
+    ["node"]
+)
+
+DEADLINE_EXCEEDED = Counter(
+    "deadline_exceeded_total",
+    "Runs stopped because they overran their deadline (plus grace period)."
+)
+
+JOB_QUEUE_DEPTH = Gauge(
+    "job_queue_depth",
+    "Runs waiting in the job queue for a worker (EXECUTION_MODE=queue). Scale workers on this."
+)
+
+JOBS = Counter(
+    "jobs_total",
+    "Queued runs handled by workers, by outcome.",
+    ["result"]
+)
+
+JOB_QUEUE_WAIT_SECONDS = Histogram(
+    "job_queue_wait_seconds",
+    "Time runs spent in the job queue before a worker picked them up.",
+    buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
@@ -1,35 +1,85 @@
 import os
 import requests
+import re
 import json
-import markdown2
-import folium
-from folium import plugins
-from langchain_groq import ChatGroq
-from langchain_google_genai import ChatGoogleGenerativeAI
+import logging
+import unicodedata
+from functools import lru_cache
+from typing import List, Optional
 from state import TripState
 from dotenv import load_dotenv
-from datetime import datetime, timedelta 
+from datetime import datetime
 from schemas import * 
+from service_client import (
+    flight_service, hotel_service, event_service,
+    activity_service, geocoding_service
+)
+from startup import startup_phase
+from artifacts import artifact_store
+from preselection import preselect, flight_objectives, hotel_objectives
+from prompts import PromptBuilder, invoke_llm, batch_llm, rank_by_interests
+from rendering import render_map, render_report, render_report_markdown
+from render_pool import render_pool
+from query_log import record_trip_request
+from drafts import remember_activities
+from date_grid import search_date_grid
+import deadlines
+from deadlines import has_time, remaining, service_deadline, degradation
+from common.log import SAMPLED
 
 load_dotenv()
 
-groq_api_key = os.getenv("GROQ_API_KEY")
-gemini_api_key = os.getenv("GEMINI_API_KEY")
+logger = logging.getLogger(__name__)
 
-if not all([groq_api_key, gemini_api_key]):
-    raise ValueError("GROQ_API_KEY or GEMINI_API_KEY is missing from .env file!")
+# When enabled, flight/hotel/event choices are made together by selection_agent in one LLM call.
+CONSOLIDATED_SELECTION = os.getenv("CONSOLIDATED_SELECTION", "False") == "True"
 
-llm = ChatGroq(
-    model="llama-3.3-70b-versatile", 
-    api_key=groq_api_key, 
-    max_retries=3
-)
 
-llm_gemini = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash", 
-    temperature=0.1,
-    google_api_key=gemini_api_key
-)
+# LLM clients are expensive to import, so they are loaded on first use (or by warm_up()
+# once the server is ready) rather than when this module is imported. The rendering
+# libraries (folium, markdown2) are only loaded by the render pool workers.
+
+@lru_cache(maxsize=None)
+def get_llm():
+    from langchain_groq import ChatGroq
+
+    groq_api_key = os.getenv("GROQ_API_KEY")
+    if not groq_api_key:
+        raise ValueError("GROQ_API_KEY is missing from .env file!")
+
+    return ChatGroq(
+        model="llama-3.3-70b-versatile", 
+        api_key=groq_api_key, 
+        max_retries=3
+    )
+
+
+@lru_cache(maxsize=None)
+def get_gemini_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    gemini_api_key = os.getenv("GEMINI_API_KEY")
+    if not gemini_api_key:
+        raise ValueError("GEMINI_API_KEY is missing from .env file!")
+
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash", 
+        temperature=0.1,
+        google_api_key=gemini_api_key
+    )
+
+
+def warm_up():
+    """Loads the lazily imported modules and LLM clients so the first trip doesn't pay for them."""
+    with startup_phase("warmup: render pool"):
+        render_pool.warm_up()
+    try:
+        with startup_phase("warmup: groq client"):
+            get_llm()
+        with startup_phase("warmup: gemini client"):
+            get_gemini_llm()
+    except Exception as e:
+        logger.warning("Warm-up of LLM clients failed: %s", e)
 
 
 def planner_agent(state: TripState) -> dict:
@@ -37,20 +87,22 @@ def planner_agent(state: TripState) -> dict:
     Takes the user request and converts it into a structured TripRequest object
     using the robust .bind_tools() method.
     """
-    print("--- Running Planner Agent ---")
+    logger.info("Running Planner Agent")
     
-    planner_llm = llm.bind_tools([TripRequest])
+    planner_llm = get_llm().bind_tools([TripRequest])
     
-    prompt = f"""
+    builder = PromptBuilder("planner").text("user_request", state['user_request'])
+    prompt = builder.render(lambda s: f"""
     You are an expert at parsing user travel requests.
     Parse the following user request into a structured TripRequest object.
     Extract the origin, destination, start date, end date, number of people, budget, and key interests.
+    If the user says their dates are flexible (e.g. "give or take two days"), set flexible_days.
     Today's date is {datetime.now().strftime('%Y-%m-%d')}. Dates must be in YYYY-MM-DD format.
 
-    User Request: "{state['user_request']}"
-    """
+    User Request: "{s['user_request']}"
+    """)
     
-    ai_message = planner_llm.invoke(prompt)
+    ai_message = invoke_llm("planner", planner_llm, prompt)
     
     if not ai_message.tool_calls:
         raise ValueError("Planner agent failed to parse the user request into a structured plan.")
@@ -58,17 +110,41 @@ def planner_agent(state: TripState) -> dict:
     tool_call = ai_message.tool_calls[0]
     plan = TripRequest(**tool_call['args'])
     
-    print(f"-> Structured Plan: {plan.model_dump_json(indent=2)}")
+    logger.debug("Structured plan: %s", plan)
+    record_trip_request(plan)
     
     return {"trip_plan": plan, "refinement_count": 0}
 
 
+def date_grid_agent(state: TripState) -> dict:
+    """
+    For flexible dates, prices the flight + hotel grid around the requested dates
+    (see date_grid.py) and moves the trip to the cheapest pair.
+    """
+    trip_plan = state['trip_plan']
+    if not trip_plan or not trip_plan.flexible_days: return {}
+
+    logger.info("Running Date Grid Agent (±%s days)", trip_plan.flexible_days)
+    if not has_time(state, deadlines.DATE_GRID_MIN_SECONDS):
+        return {"date_grid": None, "degradations": [degradation("date_grid", "flexible dates not searched")]}
+
+    grid = search_date_grid(trip_plan, deadline=service_deadline(state))
+    if grid is None:
+        return {"date_grid": None}
+
+    best = grid["best"]
+    if (best["start_date"], best["end_date"]) != (trip_plan.start_date, trip_plan.end_date):
+        logger.info("Moving the trip to %s - %s (€%.2f for flight + hotel).", best["start_date"], best["end_date"], best["total_price"])
+        trip_plan = trip_plan.model_copy(update={"start_date": best["start_date"], "end_date": best["end_date"]})
+    return {"trip_plan": trip_plan, "date_grid": grid}
+
+
 
 def flight_agent(state: TripState) -> dict:
     """
     Orchestrates the flight search by calling the dedicated Flight Microservice.
     """
-    print("--- Running Flight Agent (Microservice Proxy) ---")
+    logger.info("Running Flight Agent (Microservice Proxy)")
     trip_plan = state['trip_plan']
     if not trip_plan: return {}
 
@@ -80,57 +156,72 @@ def flight_agent(state: TripState) -> dict:
         "person": trip_plan.person
     }
 
-    service_url = "http://flight-service:8000/search"
-    
     flight_options = []
     
     try:
-        print(f"-> Sending request to Flight Service: {service_url}")
-        response = requests.post(service_url, json=payload, timeout=60)
-        response.raise_for_status()
-        
-        data = response.json()
-        flight_options = [FlightInfo(**item) for item in data]
-        print(f"-> Received {len(flight_options)} flight options from service.")
+        logger.debug("Sending request to Flight Service: %s (timeout %.1fs)", flight_service.url, flight_service.timeout)
+        flight_options = flight_service.post_models(payload, FlightInfo, many=True, deadline=service_deadline(state))
+        logger.info("Received %s flight options from service.", len(flight_options))
         
     except requests.exceptions.RequestException as e:
-        print(f"-> ERROR calling Flight Service: {e}")
-        return {"flight_options": [], "selected_flight": None}
+        logger.warning("Error calling Flight Service: %s", e)
+        return {"flight_options": [], "selected_flight": None, "degradations": [degradation("flight_agent", "flight search failed")]}
 
     if not flight_options:
-        print("-> No flights found via service.")
+        logger.info("No flights found via service.")
         return {"flight_options": [], "selected_flight": None}
 
-    print("-> Step 3: LLM making intelligent selection...")
-    selection_llm = llm.bind_tools([FlightSelection])
+    if CONSOLIDATED_SELECTION:
+        logger.info("Consolidated selection enabled. Leaving the choice to the selector.")
+        return {"flight_options": flight_options, "selected_flight": None}
+
+    return {"flight_options": flight_options, "selected_flight": select_flight(state, flight_options)}
+
 
-    options_text = ""
-    for i, opt in enumerate(flight_options):
-        options_text += f"Option {i}: Airline: {opt.departure_leg.airline}, Price: €{opt.price:.2f}, Duration: {opt.total_duration_minutes}m\n"
+def _flight_prompt_section(trip_plan: TripRequest, flight_options: List[FlightInfo]) -> str:
+    # Options beyond the budget are dropped from the end, so the indices stay valid.
+    builder = PromptBuilder("flight_selection").items("options", [
+        f"Option {i}: Airline: {opt.departure_leg.airline}, Price: €{opt.price:.2f}, Duration: {opt.total_duration_minutes}m"
+        for i, opt in enumerate(flight_options)
+    ])
 
-    prompt = f"""
+    return builder.render(lambda s: f"""
     You are an expert flight travel agent. Select the BEST flight option.
     CRITERIA:
-    1. Budget: {state['trip_plan'].budget}.
+    1. Budget: {trip_plan.budget}.
     2. Convenience: Short duration is better.
     
     Options:
-    {options_text}
-    """
+    {s['options']}
+    """)
+
+
+def _apply_flight_selection(selection: FlightSelection, flight_options: List[FlightInfo]) -> Optional[FlightInfo]:
+    if selection.best_option_index < len(flight_options):
+        selected_flight = flight_options[selection.best_option_index]
+        logger.info("LLM selected: %s", selected_flight.departure_leg.airline)
+        return selected_flight
+    return None
+
+
+def select_flight(state: TripState, flight_options: List[FlightInfo]) -> Optional[FlightInfo]:
+    """Asks the LLM to pick the best flight from the Pareto frontier of the options."""
+    flight_options, chosen = preselect("flight", flight_options, flight_objectives)
+    if chosen is not None:
+        return chosen
+    return _ask_llm_for_flight(state, flight_options)
 
-    ai_message = selection_llm.invoke(prompt)
-    selected_flight = None
+
+def _ask_llm_for_flight(state: TripState, flight_options: List[FlightInfo]) -> Optional[FlightInfo]:
+    logger.info("Step 3: LLM making intelligent selection...")
+    selection_llm = get_llm().bind_tools([FlightSelection])
+
+    ai_message = invoke_llm("flight_selection", selection_llm, _flight_prompt_section(state['trip_plan'], flight_options))
 
     if ai_message.tool_calls:
         tool_call = ai_message.tool_calls[0]
-        selection = FlightSelection(**tool_call['args'])
-        if selection.best_option_index < len(flight_options):
-            selected_flight = flight_options[selection.best_option_index]
-            print(f"-> LLM selected: {selected_flight.departure_leg.airline}")
-    else:
-         selected_flight = flight_options[0] 
-
-    return {"flight_options": flight_options, "selected_flight": selected_flight}
+        return _apply_flight_selection(FlightSelection(**tool_call['args']), flight_options)
+    return flight_options[0]
 
 
 def hotel_agent(state: TripState) -> dict:
@@ -138,14 +229,14 @@ def hotel_agent(state: TripState) -> dict:
     Orchestrates the hotel search via Hotel Microservice.
     Includes refinement check to avoid re-calling API if options exist.
     """
-    print("--- Running Hotel Agent (Microservice Proxy) ---")
+    logger.info("Running Hotel Agent (Microservice Proxy)")
     trip_plan = state['trip_plan']
     if not trip_plan: return {}
 
     hotel_options = []
 
     if state.get("hotel_options") and len(state.get("hotel_options", [])) > 1:
-        print("-> Refinement loop detected. Using existing hotel list (No API Call).")
+        logger.info("Refinement loop detected. Using existing hotel list (No API Call).")
         hotel_options = state["hotel_options"]
     
     else:
@@ -155,72 +246,85 @@ def hotel_agent(state: TripState) -> dict:
             "end_date": trip_plan.end_date,
             "person": trip_plan.person
         }
-        service_url = "http://hotel-service:8001/search"
-        
         try:
-            print(f"-> Sending request to Hotel Service: {service_url}")
-            response = requests.post(service_url, json=payload, timeout=60)
-            response.raise_for_status()
-            data = response.json()
-            hotel_options = [HotelInfo(**item) for item in data]
-            print(f"-> Received {len(hotel_options)} hotel options.")
+            logger.debug("Sending request to Hotel Service: %s (timeout %.1fs)", hotel_service.url, hotel_service.timeout)
+            hotel_options = hotel_service.post_models(payload, HotelInfo, many=True, deadline=service_deadline(state))
+            logger.info("Received %s hotel options.", len(hotel_options))
         except Exception as e:
-            print(f"-> ERROR calling Hotel Service: {e}")
-            return {"hotel_options": [], "selected_hotel": None}
+            logger.warning("Error calling Hotel Service: %s", e)
+            return {"hotel_options": [], "selected_hotel": None, "degradations": [degradation("hotel_agent", "hotel search failed")]}
 
     if not hotel_options:
         return {"hotel_options": [], "selected_hotel": None}
 
-    print("-> Step 3: LLM making a smart selection...")
-    selection_llm = llm.bind_tools([HotelSelection])
+    if CONSOLIDATED_SELECTION:
+        logger.info("Consolidated selection enabled. Leaving the choice to the selector.")
+        return {"hotel_options": hotel_options, "selected_hotel": None}
+
+    return {"hotel_options": hotel_options, "selected_hotel": select_hotel(state, hotel_options)}
 
-    options_text = ""
-    for i, opt in enumerate(hotel_options):
-        options_text += f"Option {i}: Name: {opt.hotel_name}, Rating: {opt.rating}/10, Total Price: €{opt.total_price:.2f}\n"
+
+def _hotel_prompt_section(state: TripState, hotel_options: List[HotelInfo]) -> str:
+    builder = PromptBuilder("hotel_selection").items("options", [
+        f"Option {i}: Name: {opt.hotel_name}, Rating: {opt.rating}/10, Total Price: €{opt.total_price:.2f}"
+        for i, opt in enumerate(hotel_options)
+    ])
 
     refinement_feedback = ""
     if state.get("refinement_count", 0) > 0 and state.get("evaluation_result"):
         refinement_feedback = f"The previous attempt exceeded the budget. Feedback: '{state['evaluation_result'].feedback}'. Please focus on finding a more budget-friendly yet still good option this time."
 
-    prompt = f"""
+    return builder.render(lambda s: f"""
     You are an expert travel advisor. Your task is to select the best hotel for the user from the list below.
     {refinement_feedback}
     The user cares about their budget. Find the best balance between a high rating and a price that reasonably fits the user's budget.
 
     USER PREFERENCES:
-    - Budget: €{trip_plan.budget}
+    - Budget: €{state['trip_plan'].budget}
 
     HOTEL OPTIONS:
-    {options_text}
+    {s['options']}
 
     Analyze the options based on both rating and price. Select the hotel that offers the best value for money.
-    """
+    """)
+
+
+def _apply_hotel_selection(selection: HotelSelection, hotel_options: List[HotelInfo]) -> HotelInfo:
+    if selection.best_option_index < len(hotel_options):
+        selected_hotel = hotel_options[selection.best_option_index]
+        logger.info("LLM reasoning: %s", selection.reasoning)
+        logger.info("LLM selected hotel: %s", selected_hotel.hotel_name)
+        return selected_hotel
+    logger.warning("Invalid index from LLM. Defaulting to first option.")
+    return hotel_options[0]
+
 
-    ai_message = selection_llm.invoke(prompt)
-    selected_hotel = None
+def select_hotel(state: TripState, hotel_options: List[HotelInfo]) -> HotelInfo:
+    """Asks the LLM to pick the best-value hotel from the Pareto frontier, taking evaluator feedback into account."""
+    hotel_options, chosen = preselect("hotel", hotel_options, hotel_objectives)
+    if chosen is not None:
+        return chosen
+    return _ask_llm_for_hotel(state, hotel_options)
+
+
+def _ask_llm_for_hotel(state: TripState, hotel_options: List[HotelInfo]) -> HotelInfo:
+    logger.info("Step 3: LLM making a smart selection...")
+    selection_llm = get_llm().bind_tools([HotelSelection])
+
+    ai_message = invoke_llm("hotel_selection", selection_llm, _hotel_prompt_section(state, hotel_options))
 
     if ai_message.tool_calls:
         tool_call = ai_message.tool_calls[0]
-        selection = HotelSelection(**tool_call['args'])
-        
-        if selection.best_option_index < len(hotel_options):
-            selected_hotel = hotel_options[selection.best_option_index]
-            print(f"-> LLM reasoning: {selection.reasoning}")
-            print(f"-> LLM selected hotel: {selected_hotel.hotel_name}")
-        else:
-            print("-> WARNING: Invalid index from LLM. Defaulting to first option.")
-            selected_hotel = hotel_options[0]
-    else:
-        print("-> WARNING: LLM didn't call tool. Defaulting to first option.")
-        selected_hotel = hotel_options[0]
+        return _apply_hotel_selection(HotelSelection(**tool_call['args']), hotel_options)
 
-    return {"hotel_options": hotel_options, "selected_hotel": selected_hotel}
+    logger.warning("LLM didn't call tool. Defaulting to first option.")
+    return hotel_options[0]
 
 
 
 def event_agent(state: TripState) -> dict:
     """Finds events via Microservice and then uses an LLM to select the list based on user interests."""
-    print("--- Running Smart Event Agent (Microservice Proxy) ---")
+    logger.info("Running Smart Event Agent (Microservice Proxy)")
 
     trip_plan = state['trip_plan']
     if not trip_plan or not trip_plan.interests: return {"events": []}
@@ -228,104 +332,174 @@ def event_agent(state: TripState) -> dict:
     payload = {
         "city": trip_plan.destination,
         "start_date": trip_plan.start_date,
-        "end_date": trip_plan.end_date
+        "end_date": trip_plan.end_date,
+        "interests": trip_plan.interests
     }
     
-    service_url = "http://event-service:8004/search_events"
-    
     all_events = []
     try:
-        print(f"-> Sending request to Event Service: {service_url}")
-        response = requests.post(service_url, json=payload, timeout=30)
-        response.raise_for_status()
-        
-        data = response.json()
-        all_events = [EventInfo(**item) for item in data]
-        print(f"-> Received {len(all_events)} events from service.")
+        logger.debug("Sending request to Event Service: %s (timeout %.1fs)", event_service.url, event_service.timeout)
+        all_events = event_service.post_models(payload, EventInfo, many=True, deadline=service_deadline(state))
+        logger.info("Received %s events from service.", len(all_events))
         
     except Exception as e:
-        print(f"-> ERROR calling Event Service: {e}")
-        return {"events": []}
+        logger.warning("Error calling Event Service: %s", e)
+        return {"events": [], "degradations": [degradation("event_agent", "event search failed")]}
     
     if not all_events:
         return {"events": []}
-    
-    selected_llm = llm.bind_tools([SelectedEvents])
-    
-    events_json = json.dumps([event.model_dump() for event in all_events])
 
-    prompt = f"""
+    if CONSOLIDATED_SELECTION:
+        logger.info("Consolidated selection enabled. Leaving the choice to the selector.")
+        return {"event_options": all_events, "events": []}
+
+    return {"events": select_events(state, all_events)}
+
+
+def _events_prompt_section(trip_plan: TripRequest, all_events: List[EventInfo]) -> str:
+    # Events matching the user's interests are listed first, so they survive the token budget.
+    ranked_events = rank_by_interests(all_events, lambda e: f"{e.name} {e.venue}", trip_plan.interests)
+    builder = PromptBuilder("event_selection").items("events", [json.dumps(event.model_dump()) for event in ranked_events])
+
+    return builder.render(lambda s: f"""
     You are an expert event curator. Based on a user's interests, your task is to select the most relevant events from a provided list.
 
     User's Interests: {', '.join(trip_plan.interests)}
 
     Here is a list of events happening during their trip. Please review them, remove any duplicates or near-duplicates (like the same museum entry listed multiple times), and select the top 3-4 most relevant events that best match the user's interests.
 
-    LIST OF AVAILABLE EVENTS:
-    {events_json}
+    LIST OF AVAILABLE EVENTS (one JSON object per line):
+    {s['events']}
+    """)
+
 
+def select_events(state: TripState, all_events: List[EventInfo]) -> List[EventInfo]:
+    """Asks the LLM to keep the few events that best match the user's interests."""
+    selected_llm = get_llm().bind_tools([SelectedEvents])
+
+    prompt = _events_prompt_section(state['trip_plan'], all_events) + """
     Now, call the `SelectedEvents` function with your final, selected list of events.
     """
     
-    ai_message = selected_llm.invoke(prompt)
+    ai_message = invoke_llm("event_selection", selected_llm, prompt)
     
     if not ai_message.tool_calls:
-        print("-> LLM failed to select events. Returning top 5.")
-        return {"events": all_events[:5]} 
+        logger.warning("LLM failed to select events. Returning top 5.")
+        return all_events[:5]
         
     tool_call = ai_message.tool_calls[0]
     selected_list = SelectedEvents(**tool_call['args'])
     
-    print(f"-> LLM select the list down to {len(selected_list.events)} relevant events.")
+    logger.info("LLM select the list down to %s relevant events.", len(selected_list.events))
     
-    return {"events": selected_list.events}
+    return selected_list.events
 
 
 
 def data_aggregator_agent(state: TripState) -> dict:
     """A simple node to act as a synchronization point for parallel branches."""
-    print("--- Aggregating Flight, Hotel, and Event data ---")
+    logger.info("Aggregating Flight, Hotel, and Event data")
    
     return {}
 
 
-
-def activity_extraction_agent(state: TripState) -> dict:
+def selection_agent(state: TripState) -> dict:
     """
-    Analyzes the raw text from Tavily (via Activity Microservice) and extracts a structured list of activities.
+    With CONSOLIDATED_SELECTION enabled, the flight, hotel and event agents only fetch
+    options and this node makes all pending choices in ONE LLM call, with
+    FlightSelection, HotelSelection and SelectedEvents bound as parallel tools.
+    Any choice the combined call doesn't deliver falls back to the per-item selection.
     """
-    print("--- Running Activity Extraction Agent (Microservice Proxy) ---")
+    if not CONSOLIDATED_SELECTION:
+        return {}
+
+    logger.info("Running Consolidated Selection Agent")
     trip_plan = state['trip_plan']
-    
-    payload = {
-        "destination": trip_plan.destination,
-        "interests": trip_plan.interests
-    }
-    
-    service_url = "http://activity-service:8002/search_activities"
-    
-    raw_activity_data = ""
-    
+    flight_options = state.get("flight_options") or []
+    hotel_options = state.get("hotel_options") or []
+    event_options = state.get("event_options") or []
+
+    updates = {}
+    pending = {}
+    if flight_options and not state.get("selected_flight"):
+        flight_options, updates["selected_flight"] = preselect("flight", flight_options, flight_objectives)
+        if updates["selected_flight"] is None:
+            pending["FlightSelection"] = _flight_prompt_section(trip_plan, flight_options)
+    if hotel_options and not state.get("selected_hotel"):
+        hotel_options, updates["selected_hotel"] = preselect("hotel", hotel_options, hotel_objectives)
+        if updates["selected_hotel"] is None:
+            pending["HotelSelection"] = _hotel_prompt_section(state, hotel_options)
+    if event_options and not state.get("events"):
+        pending["SelectedEvents"] = _events_prompt_section(trip_plan, event_options)
+
+    if not pending:
+        return updates
+
+    tool_calls = {}
+    if len(pending) > 1:
+        tools = {"FlightSelection": FlightSelection, "HotelSelection": HotelSelection, "SelectedEvents": SelectedEvents}
+        selection_llm = get_llm().bind_tools([tools[name] for name in pending])
+
+        # Each task section was already fitted to its own node budget.
+        builder = PromptBuilder("selector").text("tasks", "\n".join(
+            f"### TASK {i + 1}: call `{name}`\n{section}" for i, (name, section) in enumerate(pending.items())
+        ))
+        prompt = builder.render(lambda s: f"""
+    You are making several independent selections for the same trip in a single response.
+    Complete EVERY task below and call each of these functions exactly once, in parallel: {', '.join(f'`{name}`' for name in pending)}.
+
+    {s['tasks']}
+    """)
+        try:
+            ai_message = invoke_llm("selector", selection_llm, prompt)
+            tool_calls = {call['name']: call['args'] for call in ai_message.tool_calls}
+            logger.info("Consolidated call returned: %s", ', '.join(tool_calls) or 'no tool calls')
+        except Exception as e:
+            logger.warning("Consolidated selection failed (%s). Falling back to per-item selection.", e)
+
     try:
-        print(f"-> Sending request to Activity Service: {service_url}")
-        response = requests.post(service_url, json=payload, timeout=60)
-        response.raise_for_status()
-        
-        raw_activity_data = response.json()
-        
+        if "FlightSelection" in pending:
+            if "FlightSelection" in tool_calls:
+                updates["selected_flight"] = _apply_flight_selection(FlightSelection(**tool_calls["FlightSelection"]), flight_options)
+            else:
+                updates["selected_flight"] = _ask_llm_for_flight(state, flight_options)
+
+        if "HotelSelection" in pending:
+            if "HotelSelection" in tool_calls:
+                updates["selected_hotel"] = _apply_hotel_selection(HotelSelection(**tool_calls["HotelSelection"]), hotel_options)
+            else:
+                updates["selected_hotel"] = _ask_llm_for_hotel(state, hotel_options)
+
+        if "SelectedEvents" in pending:
+            if "SelectedEvents" in tool_calls:
+                updates["events"] = SelectedEvents(**tool_calls["SelectedEvents"]).events
+                logger.info("LLM select the list down to %s relevant events.", len(updates['events']))
+            else:
+                updates["events"] = select_events(state, event_options)
+
     except Exception as e:
-        print(f"-> ERROR calling Activity Service: {e}")
-        return {"extracted_activities": []}
+        logger.warning("Could not apply consolidated selection (%s). Falling back to per-item selection.", e)
+        if "FlightSelection" in pending:
+            updates["selected_flight"] = _ask_llm_for_flight(state, flight_options)
+        if "HotelSelection" in pending:
+            updates["selected_hotel"] = _ask_llm_for_hotel(state, hotel_options)
+        if "SelectedEvents" in pending:
+            updates["events"] = select_events(state, event_options)
 
-    if not raw_activity_data or "No relevant activities found" in raw_activity_data:
-        print("-> No usable text from web search.")
-        return {"extracted_activities": []}
+    return updates
 
-    extraction_llm = llm.bind_tools([ExtractedActivities])
-    
-    prompt = f"""
+
+
+EXTRACTION_CONCURRENCY = int(os.getenv("EXTRACTION_CONCURRENCY", "4"))
+
+def _extraction_prompt(trip_plan: TripRequest, section: InterestSection) -> str:
+    # Passages come best-first from the service, so the budget drops the lowest-ranked ones.
+    builder = PromptBuilder("activity_extractor").items("search_results", [
+        f"Title: {passage.title}\nContent: {passage.content}\n" for passage in section.passages
+    ])
+    return builder.render(lambda s: f"""
     You are a data extraction expert. Your task is to analyze the provided text from a web search
-    and extract all specific, physical, and geocodable places.
+    about '{section.interest}' in {trip_plan.destination} and extract all specific, physical, and geocodable places.
 
     **CRITICAL INSTRUCTIONS:**
     -   You MUST extract **only real, physical locations** like museums, monuments, parks, squares, famous buildings, or specific neighborhoods.
@@ -338,61 +512,138 @@ def activity_extraction_agent(state: TripState) -> dict:
 
     **RAW SEARCH RESULTS:**
     ---
-    {raw_activity_data}
+    {s['search_results']}
     ---
 
     Now, call the `ExtractedActivities` function with the list of all the **physical places** you found.
+    """)
+
+
+def normalize_place_name(name: str) -> str:
+    """Case-, accent- and punctuation-insensitive key used to merge places found for several interests."""
+    text = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii").lower()
+    text = re.sub(r"[^a-z0-9 ]+", " ", text)
+    words = [word for word in text.split() if word not in ("the", "of")]
+    return " ".join(words)
+
+
+def merge_activities(activity_lists: List[List[Activity]]) -> List[Activity]:
+    """Concatenates the per-interest results in order, keeping the first occurrence of each place."""
+    merged = {}
+    for activities in activity_lists:
+        for activity in activities:
+            key = normalize_place_name(activity.name)
+            if key and key not in merged:
+                merged[key] = activity
+    return list(merged.values())
+
+
+def activity_extraction_agent(state: TripState) -> dict:
+    """
+    Analyzes the deduplicated Tavily passages (via Activity Microservice) and extracts a structured list of activities.
+    Each interest section is extracted by its own LLM call, all running concurrently (map),
+    and the results are merged by normalized place name (reduce).
     """
+    logger.info("Running Activity Extraction Agent (Microservice Proxy)")
+    trip_plan = state['trip_plan']
     
-    ai_message = extraction_llm.invoke(prompt)
+    payload = {
+        "destination": trip_plan.destination,
+        "interests": trip_plan.interests
+    }
     
-    if not ai_message.tool_calls:
-        print("-> LLM failed to extract any activities.")
-        return {"extracted_activities": []}
+    try:
+        logger.debug("Sending request to Activity Service: %s (timeout %.1fs)", activity_service.url, activity_service.timeout)
+        search_result = activity_service.post_models(payload, ActivitySearchResult, deadline=service_deadline(state))
         
-    tool_call = ai_message.tool_calls[0]
-    extracted = ExtractedActivities(**tool_call['args'])
-    
-    print(f"-> Extracted {len(extracted.activities)} specific activities.")
-    return {"extracted_activities": extracted.activities}
+    except Exception as e:
+        logger.warning("Error calling Activity Service: %s", e)
+        return {"extracted_activities": [], "degradations": [degradation("activity_extractor", "activity search failed")]}
+
+    sections = [section for section in search_result.sections if section.passages]
+    if not sections:
+        logger.info("No usable text from web search.")
+        return {"extracted_activities": []}
+
+    logger.info("Received %s deduplicated passages in %s interest sections.", sum(len(s.passages) for s in sections), len(sections))
+    activity_search_ref = artifact_store.put(state.get("run_id"), "activity_search.json", search_result.model_dump_json())
+
+    extraction_llm = get_llm().bind_tools([ExtractedActivities])
+    prompts = [_extraction_prompt(trip_plan, section) for section in sections]
+
+    results = batch_llm("activity_extractor", extraction_llm, prompts, max_concurrency=EXTRACTION_CONCURRENCY)
+
+    activity_lists = []
+    failed = 0
+    for section, ai_message in zip(sections, results):
+        if isinstance(ai_message, Exception):
+            logger.warning("Extraction failed for '%s': %s", section.interest, ai_message)
+            failed += 1
+            continue
+        if not ai_message.tool_calls:
+            logger.warning("LLM failed to extract any activities for '%s'.", section.interest)
+            continue
+        try:
+            extracted = ExtractedActivities(**ai_message.tool_calls[0]['args'])
+        except Exception as e:
+            logger.warning("Invalid extraction for '%s': %s", section.interest, e)
+            continue
+        logger.info("Extracted %s activities for '%s'.", len(extracted.activities), section.interest)
+        activity_lists.append(extracted.activities)
+
+    activities = merge_activities(activity_lists)
+    logger.info("Extracted %s specific activities after merging.", len(activities))
+    degradations = [degradation("activity_extractor", f"extraction failed for {failed} of {len(sections)} interests")] if failed else []
+    return {"extracted_activities": activities, "activity_search_ref": activity_search_ref, "degradations": degradations}
 
 
 def geocoding_agent(state: TripState) -> dict:
     """
     Orchestrates geocoding by calling the dedicated Geocoding Microservice.
     """
-    print("--- Running Geocoding Agent (Microservice Proxy) ---")
+    logger.info("Running Geocoding Agent (Microservice Proxy)")
     activities = state.get("extracted_activities")
     if not activities:
         return {}
 
-    service_url = "http://geocoding-service:8003/geocode"
-    
     updated_activities = []
-    
-    for activity in activities:
+    degradations = []
+    failed = 0
+    # Activities come best-first; when time is short only the first ones get coordinates.
+    to_geocode = len(activities)
+    if not has_time(state, deadlines.GEOCODE_ALL_MIN_SECONDS):
+        to_geocode = min(to_geocode, deadlines.GEOCODE_PRIORITY_ACTIVITIES)
+
+    for index, activity in enumerate(activities):
+        if index >= to_geocode or not has_time(state, deadlines.GEOCODE_MIN_SECONDS):
+            skipped = len(activities) - index
+            degradations.append(degradation("geocoding_agent", f"skipped geocoding of {skipped} of {len(activities)} activities"))
+            updated_activities.extend(activities[index:])
+            break
+
         search_query = f"{activity.name}, {state['trip_plan'].destination}"
         
         payload = {"query": search_query}
         
         try:
-            response = requests.post(service_url, json=payload, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data['latitude'] and data['longitude']:
-                    activity.latitude = data['latitude']
-                    activity.longitude = data['longitude']
-                    print(f"-> Geocoded: {activity.name}")
+            data = geocoding_service.post(payload, deadline=service_deadline(state))
+            if data['latitude'] and data['longitude']:
+                activity.latitude = data['latitude']
+                activity.longitude = data['longitude']
+                logger.info("Geocoded: %s", activity.name, extra=SAMPLED)
             else:
-                print(f"-> Failed to geocode {activity.name}. Status: {response.status_code}")
+                logger.warning("Failed to geocode %s. No coordinates returned.", activity.name, extra=SAMPLED)
                 
         except Exception as e:
-            print(f"-> Error geocoding {activity.name}: {e}")
+            logger.warning("Error geocoding %s: %s", activity.name, e)
+            failed += 1
         
         updated_activities.append(activity)
-    
-    return {"extracted_activities": updated_activities}
+
+    if failed:
+        degradations.append(degradation("geocoding_agent", f"geocoding of {failed} of {len(activities)} activities failed"))
+    remember_activities(state['trip_plan'].destination, updated_activities)
+    return {"extracted_activities": updated_activities, "degradations": degradations}
 
 
 
@@ -402,35 +653,38 @@ def activity_scheduling_agent(state: TripState) -> dict:
     Includes robust error handling for LLM tool call failures.
     And MOST IMPORTANTLY: Re-attaches coordinates to the scheduled activities.
     """
-    print("--- Running Activity Scheduling Agent ---")
+    logger.info("Running Activity Scheduling Agent")
     
     extracted_activities = state.get("extracted_activities", [])
     events = state.get("events", [])
     trip_plan = state["trip_plan"]
 
     if not extracted_activities and not events:
-        print("-> Missing data, cannot schedule.")
+        logger.info("Missing data, cannot schedule.")
         return {"final_itinerary": None}
 
-    print(f"-> Received {len(extracted_activities)} activities and {len(events)} events to schedule.")
+    logger.info("Received %s activities and %s events to schedule.", len(extracted_activities), len(events))
 
     activity_lookup = {act.name: act for act in extracted_activities}
 
-    scheduler_llm = llm.bind_tools([ScheduledActivities])
+    scheduler_llm = get_llm().bind_tools([ScheduledActivities])
     
-    activities_text = "\n".join([f"- {act.name}: {act.description} ({act.time_of_day})" for act in extracted_activities])
-    events_text = "\n".join([f"- {evt.name} on {evt.date} at {evt.venue}" for evt in events])
+    # Geocoded activities can be grouped and mapped, so they are kept first when the prompt is over budget.
+    ranked_activities = sorted(extracted_activities, key=lambda act: not (act.latitude and act.longitude))
+    builder = PromptBuilder("scheduler")
+    builder.items("activities", [f"- {act.name}: {act.description} ({act.time_of_day})" for act in ranked_activities])
+    builder.items("events", [f"- {evt.name} on {evt.date} at {evt.venue}" for evt in events], min_items=len(events))
 
-    prompt = f"""
+    prompt = builder.render(lambda s: f"""
     You are an expert travel planner. Create a day-by-day itinerary for a {trip_plan.days}-day trip to {trip_plan.destination}.
 
     **Inputs:**
     - Trip Duration: {trip_plan.days} days
     - Activities to fit in:
-    {activities_text}
+    {s['activities']}
     
     - Fixed Events (Must happen on their specific date):
-    {events_text}
+    {s['events']}
 
     **Instructions:**
     1. Distribute these activities logically across {trip_plan.days} days.
@@ -438,12 +692,15 @@ def activity_scheduling_agent(state: TripState) -> dict:
     3. Ensure each day has a balanced mix of morning, afternoon, and evening activities.
     4. Call the `ScheduledActivities` tool with your final plan.
     5. IMPORTANT: Use the EXACT activity names provided in the input list.
-    """
+    """)
 
     max_retries = 3
     for attempt in range(max_retries):
+        if attempt and not has_time(state, deadlines.SCHEDULER_RETRY_MIN_SECONDS):
+            logger.warning("No time left for another scheduling attempt.")
+            return {"final_itinerary": None, "degradations": [degradation("scheduler", f"gave up after {attempt} failed scheduling attempt(s)")]}
         try:
-            ai_message = scheduler_llm.invoke(prompt)
+            ai_message = invoke_llm("scheduler", scheduler_llm, prompt)
             
             if ai_message.tool_calls:
                 tool_call = ai_message.tool_calls[0]
@@ -469,23 +726,23 @@ def activity_scheduling_agent(state: TripState) -> dict:
                     selected_hotel=state['selected_hotel'],
                     daily_plans=scheduled_plan.daily_plans
                 )
-                print("-> Final Itinerary Assembled Successfully (Coordinates Preserved).")
+                logger.info("Final Itinerary Assembled Successfully (Coordinates Preserved).")
                 return {"final_itinerary": final_itinerary}
             
             else:
-                print(f"-> Attempt {attempt+1}: LLM did not call tool. Retrying...")
+                logger.info("Attempt %s: LLM did not call tool. Retrying...", attempt+1)
 
         except Exception as e:
-            print(f"-> Attempt {attempt+1} Error: {e}")
+            logger.warning("Attempt %s Error: %s", attempt+1, e)
             continue
 
-    print("-> FAILED: LLM could not generate a valid schedule after retries.")
+    logger.warning("FAILED: LLM could not generate a valid schedule after retries.")
     return {"final_itinerary": None}
     
 
 
 def evaluator_agent(state: TripState) -> dict:
-    print("--- Running Smart Evaluator Agent (High IQ Mode) ---")
+    logger.info("Running Smart Evaluator Agent (High IQ Mode)")
     trip_plan = state['trip_plan']
     selected_flight = state['selected_flight']
     selected_hotel = state['selected_hotel']
@@ -499,6 +756,16 @@ def evaluator_agent(state: TripState) -> dict:
     total_cost = flight_and_hotel_cost + total_daily_spending
     budget = trip_plan.budget
 
+    # The evaluation can only lead to another loop through the searches; without time for it, approve as is.
+    if not has_time(state, deadlines.REFINEMENT_MIN_SECONDS):
+        logger.warning("Not enough time left for a refinement loop (%.0fs). Skipping the evaluation.", remaining(state))
+        over_budget = budget is not None and total_cost > budget
+        return {
+            "evaluation_result": EvaluationResult(action="APPROVE", feedback="Approved without evaluation: not enough time left to refine the plan.", total_cost=total_cost),
+            "refinement_count": refinement_count + 1,
+            "degradations": [degradation("evaluator", "over budget, but no time left for a refinement loop")] if over_budget else []
+        }
+
 
     next_hotel_info = "None"
     if len(hotel_options) > refinement_count + 1:
@@ -524,9 +791,13 @@ def evaluator_agent(state: TripState) -> dict:
         Stops: {'Direct' if not f.departure_leg.is_layover else 'Has Layover'}
         """
 
-    evaluator_llm = llm_gemini.bind_tools([EvaluationResult])
+    evaluator_llm = get_gemini_llm().bind_tools([EvaluationResult])
 
-    prompt = f"""
+    builder = PromptBuilder("evaluator")
+    builder.text("hotel_option", next_hotel_info)
+    builder.text("flight_option", next_flight_info)
+
+    prompt = builder.render(lambda s: f"""
     You are an expert Travel Consultant. Your goal is to maximize the user's experience while trying to respect the budget.
     
     **Current Status:**
@@ -539,8 +810,8 @@ def evaluator_agent(state: TripState) -> dict:
     - Hotel: {selected_hotel.hotel_name}, Rating: {selected_hotel.rating}/10, Price: €{selected_hotel.total_price}
 
     **Alternative Options for Refinement:**
-    - Option A (Cheaper Hotel): {next_hotel_info}
-    - Option B (Cheaper Flight): {next_flight_info}
+    - Option A (Cheaper Hotel): {s['hotel_option']}
+    - Option B (Cheaper Flight): {s['flight_option']}
 
     **Strategic Rules (Think carefully):**
     1. If **Within Budget**: APPROVE immediately.
@@ -554,24 +825,24 @@ def evaluator_agent(state: TripState) -> dict:
     3. **Edge Case:** If the plan is slightly over budget (e.g., <5%) but the cheaper alternatives are terrible (bad ratings, long flights), you can APPROVE it. But explain why in the feedback (e.g., "Slightly over budget, but alternatives compromise quality too much").
 
     Make a decision: APPROVE, REFINE_FLIGHT, or REFINE_HOTEL.
-    """
+    """)
 
     try:
-        ai_message = evaluator_llm.invoke(prompt)
+        ai_message = invoke_llm("evaluator", evaluator_llm, prompt)
         
         if not ai_message.tool_calls:
-            print(f"Gemini Response (No Tool): {ai_message.content}")
+            logger.info("Gemini Response (No Tool): %s", ai_message.content)
             return {"evaluation_result": EvaluationResult(action="APPROVE", feedback="Auto-approved (Gemini didn't invoke tool)", total_cost=total_cost), "refinement_count": refinement_count + 1}
             
         tool_call = ai_message.tool_calls[0]
         result = EvaluationResult(**tool_call['args'])
         result.total_cost = total_cost
         
-        print(f"-> Gemini Decision: {result.action}. Reason: {result.feedback}")
+        logger.info("Gemini Decision: %s. Reason: %s", result.action, result.feedback)
         return {"evaluation_result": result, "refinement_count": refinement_count + 1}
 
     except Exception as e:
-        print(f"Gemini Error: {e}")
+        logger.warning("Gemini Error: %s", e)
         return {"evaluation_result": EvaluationResult(action="APPROVE", feedback="Approved due to evaluator error.", total_cost=total_cost), "refinement_count": refinement_count + 1}
 
 
@@ -582,20 +853,20 @@ def should_refine_or_end(state: TripState):
     """
     Reads the action from the evaluation result to route the graph.
     """
-    print("--- Routing based on Evaluation ---")
+    logger.info("Routing based on Evaluation")
     action = state["evaluation_result"].action
     count = state.get('refinement_count', 0)
 
     if count >= MAX_REFINEMENTS:
-        print(f"-> Maximum refinement count ({MAX_REFINEMENTS}) reached. Finishing.")
+        logger.info("Maximum refinement count (%s) reached. Finishing.", MAX_REFINEMENTS)
         return "end"
     
     if action == "APPROVE":
-        print("-> Plan approved. Finishing.")
+        logger.info("Plan approved. Finishing.")
         return "end"
     
     if action == "REFINE_HOTEL":
-        print(f"-> Plan hotel refinement required. Looping back to hotel_agent (Attempt {count}).")
+        logger.info("Plan hotel refinement required. Looping back to hotel_agent (Attempt %s).", count)
         current_index = state['hotel_options'].index(state['selected_hotel'])
 
         if current_index + 1 < len(state['hotel_options']):
@@ -603,7 +874,7 @@ def should_refine_or_end(state: TripState):
         return "refine_hotel" 
 
     elif action == "REFINE_FLIGHT":
-        print(f"-> Plan flight refinement required. Looping back to flight_agent (Attempt {count}).")
+        logger.info("Plan flight refinement required. Looping back to flight_agent (Attempt %s).", count)
         current_index = state['flight_options'].index(state['selected_flight'])
         if current_index + 1 < len(state['flight_options']):
             state['selected_flight'] = state['flight_options'][current_index + 1]
@@ -611,224 +882,104 @@ def should_refine_or_end(state: TripState):
 
 
 def map_generator_node(state: TripState) -> dict:
-    """Generates an interactive Folium map from the final itinerary and returns its HTML content."""
-    print("--- Running Map Generator ---")
+    """Generates an interactive Folium map from the final itinerary (in the render pool) and stores its HTML."""
+    logger.info("Running Map Generator")
     final_itinerary = state.get("final_itinerary")
 
-    if final_itinerary and final_itinerary.daily_plans:
-        geocoded_count = sum(1 for day in final_itinerary.daily_plans for act in day.activities if act.latitude)
-        print(f"-> Itinerary received. Found {geocoded_count} geocoded activities to plot on the map.")
-    
-    
-
     if not final_itinerary or not final_itinerary.daily_plans:
-        return {"map_html": None} 
-
-    first_coord = None
-    all_coords = [] 
-    for day in final_itinerary.daily_plans:
-        for activity in day.activities:
-            if activity.latitude and activity.longitude:
-                coord = (activity.latitude, activity.longitude)
-                all_coords.append(coord)
-                if first_coord is None:
-                    first_coord = coord
-    
-    if not first_coord:
-        print("-> No coordinates found in the itinerary to create a map.")
-        return {"map_html": None}
+        return {"map_html_ref": None} 
+
+    # Only what the map needs crosses the process boundary.
+    days = [
+        {
+            "day": day_plan.day,
+            "activities": [
+                [act.name, act.description, act.latitude, act.longitude]
+                for act in day_plan.activities if act.latitude and act.longitude
+            ]
+        }
+        for day_plan in final_itinerary.daily_plans
+    ]
+    geocoded_count = sum(len(day["activities"]) for day in days)
+    logger.info("Itinerary received. Found %s geocoded activities to plot on the map.", geocoded_count)
 
-    m = folium.Map(location=first_coord, zoom_start=13)
+    if not geocoded_count:
+        logger.info("No coordinates found in the itinerary to create a map.")
+        return {"map_html_ref": None}
 
-    marker_cluster = folium.plugins.MarkerCluster().add_to(m)
-    
-    colors = ['blue', 'green', 'purple', 'orange', 'darkred', 'cadetblue', 'pink', 'lightgray']
-    
-    activity_counter = 1
-    for i, day_plan in enumerate(final_itinerary.daily_plans):
-        day_color = colors[i % len(colors)] 
-        for activity in day_plan.activities:
-            if activity.latitude and activity.longitude:
-                popup_html = f"<b>Day {day_plan.day}: {activity.name}</b><br>{activity.description}"
-                folium.Marker(
-                    [activity.latitude, activity.longitude],
-                    popup=popup_html,
-                    tooltip=f"Day {day_plan.day} - {activity_counter}. {activity.name}",
-                    icon=folium.Icon(color=day_color, icon='info-sign')
-                ).add_to(marker_cluster) 
-                activity_counter += 1
-
-    if all_coords:
-        m.fit_bounds(m.get_bounds())
-
-    map_html_content = m._repr_html_()
+    if not has_time(state, deadlines.MAP_MIN_SECONDS + deadlines.RENDER_MIN_SECONDS):
+        logger.warning("Deadline reached. Skipping the map.")
+        return {"map_html_ref": None, "degradations": [degradation("map_generator", "map left out")]}
+
+    try:
+        left = remaining(state)
+        map_html = render_pool.run("map", render_map, days, timeout=left - deadlines.MAP_MIN_SECONDS if left is not None else None)
+    except Exception as e:
+        logger.warning("Map rendering failed, continuing without a map: %s", e)
+        return {"map_html_ref": None}
+
+    map_html_ref = artifact_store.put(state.get("run_id"), "map.html", map_html)
     
-    print(f"-> Interactive map HTML generated.")
+    logger.info("Interactive map HTML generated.")
     
-    return {"map_html": map_html_content}
+    return {"map_html_ref": map_html_ref}
 
 
 
 def report_formattor_node(state: TripState) -> dict:
-    """Takes the final trip plan and generates a richly formatted Markdown report with all details."""
-    print("--- Report Formatter is running ---")
+    """Takes the final trip plan and generates a richly formatted Markdown report (in the render pool) with all details."""
+    logger.info("Report Formatter is running")
     itinerary = state.get("final_itinerary")
     trip_plan = state.get("trip_plan")
     evaluation = state.get("evaluation_result")
     events = state.get("events")
-    map_html_content = state.get("map_html") 
-    
-    if not itinerary or not trip_plan or not itinerary.selected_flight or not itinerary.selected_hotel:
-        final_report_md = "# Trip Plan Could Not Be Generated\n\n"
-        if not state.get("flight_options"):
-            final_report_md += "- Sorry, no flights matching your criteria were found.\n"
-        if not state.get("hotel_options"):
-            final_report_md += "- Sorry, no hotels matching your criteria were found.\n"
-        else:
-            final_report_md += "A valid trip plan could not be generated with the available options. Please try modifying your request."
-    else:
-        def format_duration(minutes: int) -> str:
-            if not minutes: return ""
-            hours, mins = divmod(minutes, 60)
-            return f"{hours}h {mins}m"
-            
-        def format_date(date_str: str) -> str:
-            dt_obj = datetime.strptime(date_str, "%Y-%m-%d")
-            return dt_obj.strftime("%B %d, %Y")
-
-        md = f"# Your Trip to {trip_plan.destination} ({format_date(trip_plan.start_date)} - {format_date(trip_plan.end_date)})\n\n"
-        
-        md += "## 📊 Budget Summary\n"
-        total_cost = evaluation.total_cost
-        budget = trip_plan.budget
-
-        flight_and_hotel_cost = itinerary.selected_flight.price + itinerary.selected_hotel.total_price
-        total_daily_spending = total_cost - flight_and_hotel_cost
-
-        md += f"- **Flight + Hotel Cost:** €{flight_and_hotel_cost:,.2f}\n"
-        if total_daily_spending > 0:
-            md += f"- **Estimated Daily Spending (for {trip_plan.days} days):** €{total_daily_spending:,.2f}\n"
-        md += f"------------------------------------\n"
-        md += f"- **Total Estimated Cost:** €{total_cost:,.2f}\n"
-        md += f"- **Your Total Budget:** €{budget:,.2f}\n\n"
-        
-        if total_cost <= budget:
-            md += f"- **Status:** ✅ Plan is **€{budget - total_cost:,.2f} under budget**.\n\n"
-        else:
-            md += f"- **Status:** ⚠️ Plan is **€{total_cost - budget:,.2f} over budget**.\n\n"
-
-        md += "## ✈️ Flight Information\n"
-        flight = itinerary.selected_flight
-        dep_leg = flight.departure_leg
-        ret_leg = flight.return_leg
-        
-        md += f"**Airline:** {dep_leg.airline}\n"
-        md += f"**Total Price (for {trip_plan.person} people):** €{flight.price:,.2f}\n\n"
-        md += "|  | Time | Details | Airport |\n"
-        md += "|:---|:---|:---|:---|\n"
-        
-        aircraft_dep = f"({dep_leg.aircraft_type})" if dep_leg.aircraft_type else ""
-        details_depart = f"🛫 **{dep_leg.flight_number}** {aircraft_dep}"
-        md += f"| **Depart**<br>*{format_date(trip_plan.start_date)}* | **{dep_leg.departure_time}** | {details_depart} | **{dep_leg.departure_airport}** |\n"
-        md += f"| | *{format_duration(dep_leg.duration_minutes)}* | Total Journey | |\n"
-
-        if dep_leg.is_layover:
-            md += f"| | | *{format_duration(dep_leg.layover_duration_minutes)} Layover* | *at {dep_leg.layover_airport}* |\n"
-        md += f"| | **{dep_leg.arrival_time}** | 🛬 Arriving At | **{dep_leg.arrival_airport}** |\n"
-        md += "| | | | |\n"
-        
-        aircraft_ret = f"({ret_leg.aircraft_type})" if ret_leg.aircraft_type else ""
-        details_return = f"🛫 **{ret_leg.flight_number}** {aircraft_ret}"
-        md += f"| **Return**<br>*{format_date(trip_plan.end_date)}* | **{ret_leg.departure_time}** | {details_return} | **{ret_leg.departure_airport}** |\n"
-        md += f"| | *{format_duration(ret_leg.duration_minutes)}* | Total Journey | |\n"
-
-        if ret_leg.is_layover:
-            md += f"| | | *{format_duration(ret_leg.layover_duration_minutes)} Layover* | *at {ret_leg.layover_airport}* |\n"
-        md += f"| | **{ret_leg.arrival_time}** | 🛬 Arriving At | **{ret_leg.arrival_airport}** |\n\n"
-
-
-        num_nights = (datetime.strptime(trip_plan.end_date, "%Y-%m-%d") - datetime.strptime(trip_plan.start_date, "%Y-%m-%d")).days
-        hotel = itinerary.selected_hotel
-        
-        md += "## 🏨 Hotel Information\n"
-        
-        photo_url = hotel.main_photo_url
-        if photo_url and "square60" in photo_url:
-            photo_url = photo_url.replace("square60", "max500")
-            
-        if photo_url:
-            md += f"![{hotel.hotel_name}]({photo_url})\n\n"
-            
-        md += f"### {hotel.hotel_name}\n"
-        md += f"**Rating:** {hotel.rating} / 10.0 ({hotel.rating_word} based on {hotel.review_count} reviews)\n"
-        md += f"**Taxes and Fees:** ~€{hotel.price_per_night:,.2f}\n" 
-        md += f"**Total Price (for {num_nights} nights, {trip_plan.person} people):** €{hotel.total_price:,.2f}\n"
-        
-        google_maps_url = f"https://www.google.com/maps/search/?api=1&query={hotel.hotel_name.replace(' ', '+')}"
-        md += f"- **Location:** [{hotel.hotel_name} on Google Maps]({google_maps_url})\n\n"
-
-
-        if events:
-            md += "---\n\n## 🎫 Events & Concerts During Your Stay\n"
-            md += "| Date | Event | Venue |\n"
-            md += "|:---|:---|:---|\n"
-            for event in events:
-                md += f"| {event.date} | **[{event.name}]({event.url})** | {event.venue} |\n"
-            md += "\n"
-
-        
-        md += "---\n\n## 🗺️ Daily Itinerary\n"
-        if not itinerary.daily_plans:
-            md += "No specific activities planned for this trip."
-        else:
-            start_date_obj = datetime.strptime(trip_plan.start_date, "%Y-%m-%d")
-            activity_counter = 1
-            for day_plan in itinerary.daily_plans:
-                current_date = start_date_obj + timedelta(days=day_plan.day - 1)
-                md += f"\n### Day {day_plan.day} - {current_date.strftime('%B %d, %Y')}\n"
-                for activity in day_plan.activities:
-                    md += f"- **{activity.time_of_day}: {activity_counter}. {activity.name}**\n"
-                    md += f"  - *{activity.description}*\n"
-                
-                    if activity.latitude and activity.longitude:
-                        location_url = f"https://www.google.com/maps?q={activity.latitude},{activity.longitude}"
-                        md += f"  - Location: [{activity.name}]({location_url})\n"
-                    else:
-                        location_url = f"https://www.google.com/maps?q={activity.name.replace(' ', '+')}+{trip_plan.destination.replace(' ', '+')}"
-                        md += f"  - Location: [{activity.name}]({location_url})\n"
-                
-                    activity_counter += 1
+    map_html_ref = state.get("map_html_ref")
+
+    report = {
+        "trip_plan": trip_plan.model_dump() if trip_plan else None,
+        "itinerary": itinerary.model_dump() if itinerary else None,
+        "events": [event.model_dump() for event in events or []],
+        "total_cost": evaluation.total_cost if evaluation else None,
+        "has_flight_options": bool(state.get("flight_options")),
+        "has_hotel_options": bool(state.get("hotel_options")),
+        "date_grid": state.get("date_grid"),
+    }
 
-        final_report_md = md
+    degradations = []
+    if not has_time(state, deadlines.RENDER_MIN_SECONDS):
+        logger.warning("Deadline reached. Rendering the Markdown report in-process, without HTML.")
+        final_report_md, full_html = render_report_markdown(report), None
+        degradations.append(degradation("report_formatter", "HTML report left out"))
+    else:
+        try:
+            final_report_md, full_html = render_pool.run("report", render_report, report, timeout=remaining(state))
+        except Exception as e:
+            # A timeout, or a worker that died; the Markdown report doesn't need the pool.
+            logger.warning("Report rendering failed: %s Rendering the Markdown report in-process instead.", e)
+            final_report_md, full_html = render_report_markdown(report), None
+            if not has_time(state, 0):
+                degradations.append(degradation("report_formatter", "HTML report left out"))
 
     output_dir = "output"
     os.makedirs(output_dir, exist_ok=True)
     md_path = os.path.join(output_dir, "trip_itinerary.md")
     html_path = os.path.join(output_dir, "trip_itinerary.html")
 
+    report_html_ref = None
     try:
         with open(md_path, "w", encoding="utf-8") as f: f.write(final_report_md)
-        print(f"-> Markdown report saved to: {md_path}")
-        
-        css_style = """<style> 
-            body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif; line-height: 1.6; color: #333; max-width: 800px; margin: 2rem auto; padding: 2rem; background: linear-gradient(to right, #f8f9fa, #ffffff); border: 1px solid #e1e1e1; box-shadow: 0 2px 8px rgba(0,0,0,0.05); border-radius: 8px; } 
-            h1, h2, h3 { color: #2c3e50; border-bottom: 2px solid #f0f0f0; padding-bottom: 10px; } 
-            h1 { font-size: 2.5em; text-align: center; } 
-            h2 { font-size: 2em; } 
-            code { background-color: #ecf0f1; padding: 2px 5px; border-radius: 4px; font-size: 0.9em; } 
-            .map-container { margin-top: 30px; border-top: 2px solid #f0f0f0; padding-top: 20px; }
-            iframe { width: 100%; height: 500px; border: none; border-radius: 8px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
-        </style>"""
-
-        html_body = markdown2.markdown(final_report_md, extras=["tables", "fenced-code-blocks"])
-
-        full_html = f'<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>AI Trip Plan</title>{css_style}</head><body>{html_body}</body></html>'
-        with open(html_path, "w", encoding="utf-8") as f: f.write(full_html)
-        print(f"-> HTML report saved to: {html_path}")
+        logger.info("Markdown report saved to: %s", md_path)
+
+        if full_html:
+            with open(html_path, "w", encoding="utf-8") as f: f.write(full_html)
+            logger.info("HTML report saved to: %s", html_path)
+            report_html_ref = artifact_store.put(state.get("run_id"), "report.html", full_html)
     except Exception as e:
-        print(f"An error occurred while saving files: {e}")
+        logger.warning("An error occurred while saving files: %s", e)
 
     return {
         "markdown_report": final_report_md,
-        "map_html": map_html_content 
-    }
\ No newline at end of file
+        "report_html_ref": report_html_ref,
+        "map_html_ref": map_html_ref,
+        "degradations": degradations
+    }
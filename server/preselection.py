@@ -0,0 +1,84 @@
+"""
+Deterministic Pareto preselection for flight and hotel options.
+
+Before asking the LLM for a `best_option_index`, options that are no better than another
+option on every attribute (and worse on at least one) are dropped. If a single option
+survives it is used directly and the LLM call is skipped; otherwise only the frontier
+is sent to the LLM.
+"""
+import logging
+from typing import Callable, List, Optional, Sequence, Tuple, TypeVar
+from schemas import FlightInfo, HotelInfo
+from metrics import PRESELECTION_DECISIONS, PRESELECTION_FRONTIER_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+
+T = TypeVar("T")
+
+# {kind: [llm_skipped, total]} for this process, reported alongside each decision.
+_decision_counts = {}
+
+
+def flight_objectives(flight: FlightInfo) -> Tuple[float, ...]:
+    """Price, total duration and number of layovers; lower is better for all of them."""
+    layovers = int(flight.departure_leg.is_layover) + int(flight.return_leg.is_layover)
+    return (flight.price, flight.total_duration_minutes, layovers)
+
+
+def hotel_objectives(hotel: HotelInfo) -> Tuple[float, ...]:
+    """Total price and rating (negated so that lower is better)."""
+    return (hotel.total_price, -hotel.rating)
+
+
+def _dominates(a: Tuple[float, ...], b: Tuple[float, ...]) -> bool:
+    return all(x <= y for x, y in zip(a, b)) and a != b
+
+
+def pareto_frontier(options: Sequence[T], objectives: Callable[[T], Tuple[float, ...]]) -> List[T]:
+    """
+    Returns the non-dominated options in their original order. Options with identical
+    objective values are interchangeable, so only the first of them is kept.
+    """
+    scored = []
+    seen = set()
+    for option in options:
+        score = objectives(option)
+        if score in seen:
+            continue
+        seen.add(score)
+        scored.append((score, option))
+
+    return [
+        option for score, option in scored
+        if not any(_dominates(other, score) for other, _ in scored)
+    ]
+
+
+def preselect(kind: str, options: Sequence[T], objectives: Callable[[T], Tuple[float, ...]]) -> Tuple[List[T], Optional[T]]:
+    """
+    Returns `(candidates, chosen)`. `chosen` is set when one option dominates all the
+    others and no LLM call is needed; otherwise `candidates` is the frontier to choose from.
+    """
+    frontier = pareto_frontier(options, objectives)
+    skipped = len(frontier) == 1
+
+    PRESELECTION_FRONTIER_SIZE.labels(kind=kind).observe(len(frontier))
+    PRESELECTION_DECISIONS.labels(kind=kind, outcome="llm_skipped" if skipped else "llm_called").inc()
+    counts = _decision_counts.setdefault(kind, [0, 0])
+    counts[0] += int(skipped)
+    counts[1] += 1
+
+    if skipped:
+        logger.info("Pareto preselection: 1 of %s %s options dominates the rest. Skipping LLM selection (skip rate %.0f%%).", len(options), kind, skip_rate(kind) * 100)
+        return frontier, frontier[0]
+
+    logger.info("Pareto preselection: %s of %s %s options are on the frontier (skip rate %.0f%%).", len(frontier), len(options), kind, skip_rate(kind) * 100)
+    return frontier, None
+
+
+def skip_rate(kind: str) -> float:
+    """Fraction of `kind` selections in this process that didn't need the LLM."""
+    skipped, total = _decision_counts.get(kind, (0, 0))
+    return skipped / total if total else 0.0
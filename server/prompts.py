@@ -0,0 +1,168 @@
+"""
+Token accounting and budget enforcement for the LLM prompts built in nodes.py.
+
+A PromptBuilder collects the variable sections of a prompt (search results, option
+lists, events...). When rendering, it measures the fixed instructions and shrinks the
+variable sections to fit the node's token budget. Item lists lose their lowest-ranked
+items first, so callers pass items best-first. Plain text is cut at a line boundary.
+Estimated section sizes and the real prompt/completion token counts reported by the
+provider are exported per node.
+"""
+import os
+import logging
+from typing import Callable, Dict, List
+from metrics import LLM_PROMPT_TOKENS, LLM_COMPLETION_TOKENS, PROMPT_SECTION_TOKENS, PROMPT_TRUNCATIONS
+
+
+logger = logging.getLogger(__name__)
+
+
+# Token budget for each whole prompt, overridable with PROMPT_BUDGET_<NODE>=<tokens>.
+DEFAULT_PROMPT_BUDGETS = {
+    "planner": 1000,
+    "flight_selection": 1500,
+    "hotel_selection": 1500,
+    "event_selection": 3000,
+    "selector": 6000,
+    "activity_extractor": 6000,
+    "scheduler": 3000,
+    "evaluator": 2000,
+}
+
+TRUNCATION_MARKER = "\n[... truncated]"
+CHARS_PER_TOKEN = 4
+
+
+def prompt_budget(node: str) -> int:
+    return int(os.getenv(f"PROMPT_BUDGET_{node.upper()}", str(DEFAULT_PROMPT_BUDGETS.get(node, 4000))))
+
+
+def count_tokens(text: str) -> int:
+    """
+    Provider-independent estimate (~4 characters per token for English text). The exact
+    counts for each call come from the response's usage metadata, see invoke_llm().
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _allocate(sizes: Dict[str, int], available: int) -> Dict[str, int]:
+    """Splits `available` tokens between sections: small sections keep everything, large ones share the rest."""
+    allocation = {}
+    remaining = max(available, 0)
+    pending = sorted(sizes, key=sizes.get)
+    while pending:
+        name = pending.pop(0)
+        share = remaining // (len(pending) + 1)
+        allocation[name] = min(sizes[name], share)
+        remaining -= allocation[name]
+    return allocation
+
+
+class PromptBuilder:
+
+    def __init__(self, node: str, budget: int = None):
+        self.node = node
+        self.budget = budget if budget is not None else prompt_budget(node)
+        self._sections = {}
+
+    def items(self, name: str, items: List[str], min_items: int = 1):
+        """A list section rendered one item per line. Items must be ordered best-first."""
+        self._sections[name] = ("items", list(items), min_items)
+        return self
+
+    def text(self, name: str, text: str):
+        """A free-text section that is cut at a line boundary when over budget."""
+        self._sections[name] = ("text", text or "", 0)
+        return self
+
+    def _full(self, name: str) -> str:
+        kind, content, _ = self._sections[name]
+        return "\n".join(content) if kind == "items" else content
+
+    def _fit(self, name: str, max_tokens: int) -> str:
+        kind, content, min_items = self._sections[name]
+
+        if kind == "items":
+            kept, used = [], 0
+            for item in content:
+                cost = count_tokens(item) + 1
+                if used + cost > max_tokens and len(kept) >= min_items:
+                    break
+                kept.append(item)
+                used += cost
+            dropped = len(content) - len(kept)
+            if dropped:
+                PROMPT_TRUNCATIONS.labels(node=self.node, section=name).inc()
+                logger.info("Prompt budget (%s): kept %s of %s %s.", self.node, len(kept), len(content), name)
+            return "\n".join(kept)
+
+        if count_tokens(content) <= max_tokens:
+            return content
+        max_chars = max(max_tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARKER), 0)
+        cut = content[:max_chars]
+        line_end = cut.rfind("\n")
+        if line_end > max_chars * 0.8:
+            cut = cut[:line_end]
+        PROMPT_TRUNCATIONS.labels(node=self.node, section=name).inc()
+        logger.info("Prompt budget (%s): %s cut from ~%s to ~%s tokens.", self.node, name, count_tokens(content), max_tokens)
+        return cut + TRUNCATION_MARKER
+
+    def render(self, template: Callable[[Dict[str, str]], str]) -> str:
+        """
+        Builds the prompt with `template(sections)`, where `sections` maps each section
+        name to its (possibly shortened) text, and records the size of every section.
+        """
+        instructions = count_tokens(template({name: "" for name in self._sections}))
+        sizes = {name: count_tokens(self._full(name)) for name in self._sections}
+
+        if instructions + sum(sizes.values()) <= self.budget:
+            fitted = {name: self._full(name) for name in self._sections}
+        else:
+            allocation = _allocate(sizes, self.budget - instructions)
+            fitted = {name: self._fit(name, allocation[name]) for name in self._sections}
+
+        PROMPT_SECTION_TOKENS.labels(node=self.node, section="instructions").observe(instructions)
+        for name, text in fitted.items():
+            PROMPT_SECTION_TOKENS.labels(node=self.node, section=name).observe(count_tokens(text))
+
+        return template(fitted)
+
+
+def _record_usage(node: str, ai_message):
+    usage = getattr(ai_message, "usage_metadata", None) or {}
+    if usage.get("input_tokens") is not None:
+        LLM_PROMPT_TOKENS.labels(node=node).observe(usage["input_tokens"])
+    if usage.get("output_tokens") is not None:
+        LLM_COMPLETION_TOKENS.labels(node=node).observe(usage["output_tokens"])
+
+
+def invoke_llm(node: str, llm, prompt: str):
+    """Invokes `llm` and records the prompt and completion tokens the provider reports for `node`."""
+    ai_message = llm.invoke(prompt)
+    _record_usage(node, ai_message)
+    return ai_message
+
+
+def batch_llm(node: str, llm, prompts: List[str], max_concurrency: int):
+    """
+    Runs the prompts concurrently and returns one result per prompt, in order. A failed
+    call returns its exception instead of failing the whole batch.
+    """
+    results = llm.batch(prompts, config={"max_concurrency": max_concurrency}, return_exceptions=True)
+    for result in results:
+        if not isinstance(result, Exception):
+            _record_usage(node, result)
+    return results
+
+
+def rank_by_interests(items: list, describe: Callable[[object], str], interests: List[str]) -> list:
+    """Stable sort putting the items whose description mentions most of the user's interests first."""
+    keywords = [word.lower() for interest in interests or [] for word in interest.split() if len(word) > 2]
+    if not keywords:
+        return list(items)
+
+    def matches(item) -> int:
+        description = describe(item).lower()
+        return sum(1 for word in keywords if word in description)
+
+    return sorted(items, key=matches, reverse=True)
@@ -0,0 +1,102 @@
+"""
+Log of parsed trip requests, used to find the destinations worth keeping warm in the caches.
+
+Every TripRequest produced by the planner is appended to a small SQLite table
+(QUERY_LOG_PATH). popular_trips() aggregates the recent entries into the most
+requested destinations with their most common origin, interests and upcoming date windows.
+"""
+import os
+import logging
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List
+from schemas import TripRequest
+
+
+logger = logging.getLogger(__name__)
+
+
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG", "True") == "True"
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", "output/query_log.sqlite")
+
+_lock = threading.Lock()
+_connection = None
+
+
+def _connect() -> sqlite3.Connection:
+    global _connection
+    if _connection is None:
+        os.makedirs(os.path.dirname(QUERY_LOG_PATH) or ".", exist_ok=True)
+        _connection = sqlite3.connect(QUERY_LOG_PATH, check_same_thread=False)
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS trip_requests ("
+            "logged_at REAL, origin TEXT, destination TEXT, destination_key TEXT, "
+            "start_date TEXT, end_date TEXT, person INTEGER, interests TEXT)"
+        )
+        _connection.execute("CREATE INDEX IF NOT EXISTS trip_requests_logged_at ON trip_requests (logged_at)")
+    return _connection
+
+
+def record_trip_request(plan: TripRequest):
+    """Appends a parsed request to the log. Logging problems never fail the run."""
+    if not QUERY_LOG_ENABLED:
+        return
+    try:
+        with _lock:
+            connection = _connect()
+            connection.execute(
+                "INSERT INTO trip_requests VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), plan.origin, plan.destination, plan.destination.strip().lower(),
+                 plan.start_date, plan.end_date, plan.person, json.dumps(plan.interests or []))
+            )
+            connection.commit()
+    except Exception as e:
+        logger.warning("Could not log trip request: %s", e)
+
+
+def _most_common(connection, column: str, destination_key: str, since: float):
+    row = connection.execute(
+        f"SELECT {column} FROM trip_requests WHERE destination_key = ? AND logged_at >= ? "
+        f"GROUP BY {column} ORDER BY COUNT(*) DESC LIMIT 1",
+        (destination_key, since)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def popular_trips(top_n: int, lookback_days: int, windows_per_destination: int) -> List[dict]:
+    """
+    The `top_n` most requested destinations of the last `lookback_days`, most popular first:
+    `{"destination", "origin", "person", "interests", "requests", "date_windows": [(start, end), ...]}`.
+    Only date windows that haven't started yet are returned.
+    """
+    since = time.time() - lookback_days * 24 * 3600
+    today = datetime.now().strftime("%Y-%m-%d")
+
+    with _lock:
+        connection = _connect()
+        destinations = connection.execute(
+            "SELECT destination_key, COUNT(*) FROM trip_requests WHERE logged_at >= ? "
+            "GROUP BY destination_key ORDER BY COUNT(*) DESC LIMIT ?",
+            (since, top_n)
+        ).fetchall()
+
+        trips = []
+        for destination_key, requests in destinations:
+            windows = connection.execute(
+                "SELECT start_date, end_date FROM trip_requests "
+                "WHERE destination_key = ? AND logged_at >= ? AND start_date >= ? "
+                "GROUP BY start_date, end_date ORDER BY COUNT(*) DESC LIMIT ?",
+                (destination_key, since, today, windows_per_destination)
+            ).fetchall()
+            trips.append({
+                "destination": _most_common(connection, "destination", destination_key, since),
+                "origin": _most_common(connection, "origin", destination_key, since),
+                "person": _most_common(connection, "person", destination_key, since),
+                "interests": json.loads(_most_common(connection, "interests", destination_key, since) or "[]"),
+                "requests": requests,
+                "date_windows": [tuple(window) for window in windows],
+            })
+    return trips
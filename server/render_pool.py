@@ -0,0 +1,150 @@
+"""
+Bounded process pool for the CPU-heavy rendering functions in rendering.py.
+
+Workers are started with "spawn" (the orchestrator process runs threads) and import
+folium / markdown2 once in their initializer. warm_up() starts all of them ahead of
+the first request. Every task has a timeout. A timed-out or broken worker is
+replaced and warmed up again in the background, without touching the tasks of the
+other workers; the caller decides what to do without the result. RENDER_POOL_SIZE=0 renders in-process, as before.
+"""
+import os
+import logging
+import time
+import queue
+import threading
+import multiprocessing
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import rendering
+from common.log import configure_logging
+from common.profiling import active_profiler, profiled_call
+from metrics import RENDER_SECONDS, RENDER_FAILURES
+
+
+logger = logging.getLogger(__name__)
+
+
+RENDER_POOL_SIZE = int(os.getenv("RENDER_POOL_SIZE", "2"))
+RENDER_TIMEOUT_SECONDS = float(os.getenv("RENDER_TIMEOUT_SECONDS", "30"))
+
+
+class RenderTimeoutError(Exception):
+    pass
+
+
+def _init_worker():
+    configure_logging("render-worker")
+    rendering.warm_up()
+
+
+def _warm_task() -> int:
+    # Keeps the worker busy briefly so the executor starts a new process for the next one.
+    time.sleep(0.2)
+    return os.getpid()
+
+
+class RenderPool:
+    """
+    RENDER_POOL_SIZE workers, each a single-process executor. A task that times out
+    or kills its worker only costs that worker: it is replaced while the others keep
+    rendering for the other runs.
+    """
+
+    def __init__(self, size: int = RENDER_POOL_SIZE, timeout: float = RENDER_TIMEOUT_SECONDS):
+        self.size = size
+        self.timeout = timeout
+        # Idle workers; None stands for one that is started on first use.
+        self._idle = queue.Queue()
+        for _ in range(max(size, 0)):
+            self._idle.put(None)
+        self._workers = set()
+        self._lock = threading.Lock()
+
+    def _new_worker(self) -> ProcessPoolExecutor:
+        worker = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _replace(self, worker: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """Kills a stuck or dead worker and returns a new one, warming up in the background."""
+        with self._lock:
+            self._workers.discard(worker)
+        for process in list(getattr(worker, "_processes", {}).values()):
+            process.terminate()
+        worker.shutdown(wait=False, cancel_futures=True)
+        replacement = self._new_worker()
+        replacement.submit(_warm_task)
+        return replacement
+
+    def warm_up(self):
+        """Starts every worker process and loads the rendering libraries in them."""
+        if self.size <= 0:
+            rendering.warm_up()
+            return
+        workers = [self._idle.get() or self._new_worker() for _ in range(self.size)]
+        try:
+            pids = {future.result() for future in [worker.submit(_warm_task) for worker in workers]}
+        finally:
+            for worker in workers:
+                self._idle.put(worker)
+        logger.info("Render pool ready with %s worker processes.", len(pids))
+
+    def run(self, task: str, fn, *args, timeout: Optional[float] = None):
+        """
+        Runs `fn(*args)` in a worker and returns its result, or raises RenderTimeoutError /
+        the task's error. `timeout` can only shorten the pool's own timeout and covers the
+        wait for a free worker too.
+        """
+        started = time.perf_counter()
+        timeout = self.timeout if timeout is None else max(min(timeout, self.timeout), 0)
+        try:
+            if self.size <= 0:
+                return fn(*args)
+            if timeout <= 0:
+                # Nothing to wait for; no worker is tied up (or replaced) for it.
+                RENDER_FAILURES.labels(task=task, reason="timeout").inc()
+                raise RenderTimeoutError(f"No time left to render '{task}'.")
+
+            try:
+                worker = self._idle.get(timeout=timeout)
+            except queue.Empty:
+                RENDER_FAILURES.labels(task=task, reason="timeout").inc()
+                raise RenderTimeoutError(f"No render worker became free for '{task}' within {timeout:g}s.")
+            worker = worker or self._new_worker()
+            try:
+                # In a profiled run the worker samples itself and its stacks join the run's profile.
+                profiler = active_profiler.get()
+                future = worker.submit(profiled_call, fn, *args) if profiler else worker.submit(fn, *args)
+                left = max(timeout - (time.perf_counter() - started), 0)
+                if profiler is None:
+                    return future.result(timeout=left)
+                result, samples = future.result(timeout=left)
+                profiler.merge(samples, f"render-worker:{task}")
+                return result
+            except FutureTimeoutError:
+                RENDER_FAILURES.labels(task=task, reason="timeout").inc()
+                worker = self._replace(worker)
+                raise RenderTimeoutError(f"Rendering '{task}' took longer than {timeout:g}s.")
+            except BrokenProcessPool:
+                RENDER_FAILURES.labels(task=task, reason="broken_pool").inc()
+                worker = self._replace(worker)
+                raise
+            finally:
+                self._idle.put(worker)
+        finally:
+            RENDER_SECONDS.labels(task=task).observe(time.perf_counter() - started)
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._workers = self._workers, set()
+        for worker in workers:
+            worker.shutdown(wait=False, cancel_futures=True)
+
+
+render_pool = RenderPool()
@@ -0,0 +1,247 @@
+"""
+Rendering of the trip map (Folium) and report (Markdown -> HTML).
+
+These functions are CPU-bound and run in the render process pool (see render_pool.py),
+away from the event loop that serves the SSE streams. They take and return plain,
+picklable data only: the compact dicts built by the map and report nodes in, and
+HTML / Markdown strings out.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from schemas import TripRequest, Itinerary, EventInfo
+
+
+logger = logging.getLogger(__name__)
+
+
+REPORT_CSS = """<style>
+    body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif; line-height: 1.6; color: #333; max-width: 800px; margin: 2rem auto; padding: 2rem; background: linear-gradient(to right, #f8f9fa, #ffffff); border: 1px solid #e1e1e1; box-shadow: 0 2px 8px rgba(0,0,0,0.05); border-radius: 8px; } 
+    h1, h2, h3 { color: #2c3e50; border-bottom: 2px solid #f0f0f0; padding-bottom: 10px; } 
+    h1 { font-size: 2.5em; text-align: center; } 
+    h2 { font-size: 2em; } 
+    code { background-color: #ecf0f1; padding: 2px 5px; border-radius: 4px; font-size: 0.9em; } 
+    .map-container { margin-top: 30px; border-top: 2px solid #f0f0f0; padding-top: 20px; }
+    iframe { width: 100%; height: 500px; border: none; border-radius: 8px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
+</style>"""
+
+
+def warm_up():
+    """Imports the rendering libraries; runs once in every pool worker."""
+    import folium
+    from folium import plugins
+    import markdown2
+
+
+def render_map(days: List[dict]) -> Optional[str]:
+    """
+    `days` is `[{"day": 1, "activities": [[name, description, latitude, longitude], ...]}, ...]`
+    with geocoded activities only. Returns the map HTML, or None if there is nothing to plot.
+    """
+    import folium
+    from folium import plugins
+
+    all_coords = [(lat, lon) for day in days for _, _, lat, lon in day["activities"]]
+    if not all_coords:
+        return None
+
+    m = folium.Map(location=all_coords[0], zoom_start=13)
+
+    marker_cluster = folium.plugins.MarkerCluster().add_to(m)
+    
+    colors = ['blue', 'green', 'purple', 'orange', 'darkred', 'cadetblue', 'pink', 'lightgray']
+    
+    activity_counter = 1
+    for i, day_plan in enumerate(days):
+        day_color = colors[i % len(colors)] 
+        for name, description, latitude, longitude in day_plan["activities"]:
+            popup_html = f"<b>Day {day_plan['day']}: {name}</b><br>{description}"
+            folium.Marker(
+                [latitude, longitude],
+                popup=popup_html,
+                tooltip=f"Day {day_plan['day']} - {activity_counter}. {name}",
+                icon=folium.Icon(color=day_color, icon='info-sign')
+            ).add_to(marker_cluster) 
+            activity_counter += 1
+
+    m.fit_bounds(m.get_bounds())
+
+    return m._repr_html_()
+
+
+def _date_grid_section(grid: dict) -> str:
+    """Markdown section for the flexible-dates grid: flight + hotel totals, departures by returns."""
+    best, requested = grid["best"], grid["requested"]
+    md = "## 📅 Flexible Dates\n"
+    if (best["start_date"], best["end_date"]) == (requested["start_date"], requested["end_date"]):
+        md += "Your requested dates are already the cheapest nearby.\n\n"
+    else:
+        md += f"- **Cheapest dates:** {best['start_date']} - {best['end_date']} (€{best['total_price']:,.2f} for flight + hotel)\n"
+        if requested["total_price"] is not None:
+            md += f"- **Requested dates:** {requested['start_date']} - {requested['end_date']} (€{requested['total_price']:,.2f})\n"
+        md += "\n"
+
+    md += "| Depart \\ Return | " + " | ".join(day[5:] for day in grid["return_dates"]) + " |\n"
+    md += "|:---|" + "---:|" * len(grid["return_dates"]) + "\n"
+    for departure, row in zip(grid["departure_dates"], grid["total_prices"]):
+        cells = []
+        for return_date, price in zip(grid["return_dates"], row):
+            cell = "–" if price is None else f"€{price:,.0f}"
+            cells.append(f"**{cell}**" if (departure, return_date) == (best["start_date"], best["end_date"]) else cell)
+        md += f"| {departure[5:]} | " + " | ".join(cells) + " |\n"
+    return md + "\n"
+
+
+def render_report_markdown(report: dict) -> str:
+    """
+    `report` holds `trip_plan` and `itinerary` (model dumps or None), `events`,
+    `total_cost`, the `has_flight_options` / `has_hotel_options` flags and, for
+    flexible dates, the `date_grid` (see date_grid.py).
+    """
+    trip_plan = TripRequest(**report["trip_plan"]) if report["trip_plan"] else None
+    itinerary = Itinerary(**report["itinerary"]) if report["itinerary"] else None
+    events = [EventInfo(**event) for event in report["events"] or []]
+
+    if not itinerary or not trip_plan or not itinerary.selected_flight or not itinerary.selected_hotel:
+        final_report_md = "# Trip Plan Could Not Be Generated\n\n"
+        if not report["has_flight_options"]:
+            final_report_md += "- Sorry, no flights matching your criteria were found.\n"
+        if not report["has_hotel_options"]:
+            final_report_md += "- Sorry, no hotels matching your criteria were found.\n"
+        else:
+            final_report_md += "A valid trip plan could not be generated with the available options. Please try modifying your request."
+    else:
+        def format_duration(minutes: int) -> str:
+            if not minutes: return ""
+            hours, mins = divmod(minutes, 60)
+            return f"{hours}h {mins}m"
+            
+        def format_date(date_str: str) -> str:
+            dt_obj = datetime.strptime(date_str, "%Y-%m-%d")
+            return dt_obj.strftime("%B %d, %Y")
+
+        md = f"# Your Trip to {trip_plan.destination} ({format_date(trip_plan.start_date)} - {format_date(trip_plan.end_date)})\n\n"
+        
+        md += "## 📊 Budget Summary\n"
+        total_cost = report["total_cost"]
+        budget = trip_plan.budget
+
+        flight_and_hotel_cost = itinerary.selected_flight.price + itinerary.selected_hotel.total_price
+        total_daily_spending = total_cost - flight_and_hotel_cost
+
+        md += f"- **Flight + Hotel Cost:** €{flight_and_hotel_cost:,.2f}\n"
+        if total_daily_spending > 0:
+            md += f"- **Estimated Daily Spending (for {trip_plan.days} days):** €{total_daily_spending:,.2f}\n"
+        md += f"------------------------------------\n"
+        md += f"- **Total Estimated Cost:** €{total_cost:,.2f}\n"
+        md += f"- **Your Total Budget:** €{budget:,.2f}\n\n"
+        
+        if total_cost <= budget:
+            md += f"- **Status:** ✅ Plan is **€{budget - total_cost:,.2f} under budget**.\n\n"
+        else:
+            md += f"- **Status:** ⚠️ Plan is **€{total_cost - budget:,.2f} over budget**.\n\n"
+
+        if report.get("date_grid"):
+            md += _date_grid_section(report["date_grid"])
+
+        md += "## ✈️ Flight Information\n"
+        flight = itinerary.selected_flight
+        dep_leg = flight.departure_leg
+        ret_leg = flight.return_leg
+        
+        md += f"**Airline:** {dep_leg.airline}\n"
+        md += f"**Total Price (for {trip_plan.person} people):** €{flight.price:,.2f}\n\n"
+        md += "|  | Time | Details | Airport |\n"
+        md += "|:---|:---|:---|:---|\n"
+        
+        aircraft_dep = f"({dep_leg.aircraft_type})" if dep_leg.aircraft_type else ""
+        details_depart = f"🛫 **{dep_leg.flight_number}** {aircraft_dep}"
+        md += f"| **Depart**<br>*{format_date(trip_plan.start_date)}* | **{dep_leg.departure_time}** | {details_depart} | **{dep_leg.departure_airport}** |\n"
+        md += f"| | *{format_duration(dep_leg.duration_minutes)}* | Total Journey | |\n"
+
+        if dep_leg.is_layover:
+            md += f"| | | *{format_duration(dep_leg.layover_duration_minutes)} Layover* | *at {dep_leg.layover_airport}* |\n"
+        md += f"| | **{dep_leg.arrival_time}** | 🛬 Arriving At | **{dep_leg.arrival_airport}** |\n"
+        md += "| | | | |\n"
+        
+        aircraft_ret = f"({ret_leg.aircraft_type})" if ret_leg.aircraft_type else ""
+        details_return = f"🛫 **{ret_leg.flight_number}** {aircraft_ret}"
+        md += f"| **Return**<br>*{format_date(trip_plan.end_date)}* | **{ret_leg.departure_time}** | {details_return} | **{ret_leg.departure_airport}** |\n"
+        md += f"| | *{format_duration(ret_leg.duration_minutes)}* | Total Journey | |\n"
+
+        if ret_leg.is_layover:
+            md += f"| | | *{format_duration(ret_leg.layover_duration_minutes)} Layover* | *at {ret_leg.layover_airport}* |\n"
+        md += f"| | **{ret_leg.arrival_time}** | 🛬 Arriving At | **{ret_leg.arrival_airport}** |\n\n"
+
+
+        num_nights = (datetime.strptime(trip_plan.end_date, "%Y-%m-%d") - datetime.strptime(trip_plan.start_date, "%Y-%m-%d")).days
+        hotel = itinerary.selected_hotel
+        
+        md += "## 🏨 Hotel Information\n"
+        
+        photo_url = hotel.main_photo_url
+        if photo_url and "square60" in photo_url:
+            photo_url = photo_url.replace("square60", "max500")
+            
+        if photo_url:
+            md += f"![{hotel.hotel_name}]({photo_url})\n\n"
+            
+        md += f"### {hotel.hotel_name}\n"
+        md += f"**Rating:** {hotel.rating} / 10.0 ({hotel.rating_word} based on {hotel.review_count} reviews)\n"
+        md += f"**Taxes and Fees:** ~€{hotel.price_per_night:,.2f}\n" 
+        md += f"**Total Price (for {num_nights} nights, {trip_plan.person} people):** €{hotel.total_price:,.2f}\n"
+        
+        google_maps_url = f"https://www.google.com/maps/search/?api=1&query={hotel.hotel_name.replace(' ', '+')}"
+        md += f"- **Location:** [{hotel.hotel_name} on Google Maps]({google_maps_url})\n\n"
+
+
+        if events:
+            md += "---\n\n## 🎫 Events & Concerts During Your Stay\n"
+            md += "| Date | Event | Venue |\n"
+            md += "|:---|:---|:---|\n"
+            for event in events:
+                md += f"| {event.date} | **[{event.name}]({event.url})** | {event.venue} |\n"
+            md += "\n"
+
+        
+        md += "---\n\n## 🗺️ Daily Itinerary\n"
+        if not itinerary.daily_plans:
+            md += "No specific activities planned for this trip."
+        else:
+            start_date_obj = datetime.strptime(trip_plan.start_date, "%Y-%m-%d")
+            activity_counter = 1
+            for day_plan in itinerary.daily_plans:
+                current_date = start_date_obj + timedelta(days=day_plan.day - 1)
+                md += f"\n### Day {day_plan.day} - {current_date.strftime('%B %d, %Y')}\n"
+                for activity in day_plan.activities:
+                    md += f"- **{activity.time_of_day}: {activity_counter}. {activity.name}**\n"
+                    md += f"  - *{activity.description}*\n"
+                
+                    if activity.latitude and activity.longitude:
+                        location_url = f"https://www.google.com/maps?q={activity.latitude},{activity.longitude}"
+                        md += f"  - Location: [{activity.name}]({location_url})\n"
+                    else:
+                        location_url = f"https://www.google.com/maps?q={activity.name.replace(' ', '+')}+{trip_plan.destination.replace(' ', '+')}"
+                        md += f"  - Location: [{activity.name}]({location_url})\n"
+                
+                    activity_counter += 1
+
+        final_report_md = md
+
+
+    return final_report_md
+
+
+def render_report(report: dict) -> Tuple[str, Optional[str]]:
+    """Returns the Markdown report and its standalone HTML page (None if the HTML conversion failed)."""
+    import markdown2
+
+    final_report_md = render_report_markdown(report)
+    try:
+        html_body = markdown2.markdown(final_report_md, extras=["tables", "fenced-code-blocks"])
+    except Exception as e:
+        logger.warning("An error occurred while converting the report to HTML: %s", e)
+        return final_report_md, None
+
+    full_html = f'<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>AI Trip Plan</title>{REPORT_CSS}</head><body>{html_body}</body></html>'
+    return final_report_md, full_html
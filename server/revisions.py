@@ -0,0 +1,136 @@
+"""
+Incremental replanning for POST /plan-trip/{run_id}/revise.
+
+A revision is a new run that starts from the final state of a finished run, with a
+patch applied to its trip_plan. Only the nodes that depend on a changed field are
+executed again: directly (the field is in their NODE_INPUTS) or through the output
+of another node that runs again (NODE_OUTPUTS). The others are skipped and keep
+their outputs. The planner is always skipped; the evaluator, map and report always
+run, since they describe the revised plan as a whole. Examples:
+- budget: evaluator only (it re-checks the selection and refines it if needed);
+- interests: events, activity extraction, geocoding and scheduler;
+- dates: flights, hotels, events and scheduler, after the date grid for trips with
+  flexible dates (it may move the dates again).
+"""
+import functools
+import logging
+from typing import Any, Dict, List, Tuple
+from pydantic import ValidationError
+from schemas import TripRequest
+from checkpointing import NODE_INPUTS, reused, run_config
+
+
+logger = logging.getLogger(__name__)
+
+
+# The state keys each revisable node writes, in graph order.
+NODE_OUTPUTS = {
+    "date_grid": ["date_grid"],
+    "flight_agent": ["flight_options", "selected_flight"],
+    "hotel_agent": ["hotel_options", "selected_hotel"],
+    "event_agent": ["events", "event_options"],
+    "activity_extractor": ["extracted_activities", "activity_search_ref"],
+    "geocoding_agent": ["extracted_activities"],
+    "scheduler": ["final_itinerary"],
+}
+
+# TripRequest fields a node may rewrite; the nodes reading them run after it.
+PLAN_OUTPUTS = {
+    "date_grid": ["start_date", "end_date"],
+}
+
+# Fields that only steer the choice among options already fetched. Searches are not
+# repeated for them; the evaluator checks the selection against the new values.
+SELECTION_ONLY_FIELDS = {"budget", "daily_spending_budget"}
+
+# Outputs of the nodes that always run again.
+RESET_KEYS = ["evaluation_result", "map_html_ref", "report_html_ref", "markdown_report"]
+
+
+class RevisionError(Exception):
+    """The run can't be revised (unknown, unfinished or invalid patch)."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def skip_if_reused(node_name: str, node):
+    """Wraps a node so that revisions skip it when its previous output is reused."""
+    # wraps() keeps the node's identifier, which is part of its node cache namespace.
+    @functools.wraps(node)
+    def wrapper(state):
+        if reused(node_name, state):
+            logger.info("Reusing the output of %s from the revised run.", node_name)
+            return {}
+        return node(state)
+    return wrapper
+
+
+def affected_nodes(changed_fields, flexible_dates: bool = False) -> List[str]:
+    """
+    The nodes that have to run again when the TripRequest `changed_fields` change.
+    The date grid only matters for trips with flexible dates (before or after the change).
+    """
+    changed = set(changed_fields) - SELECTION_ONLY_FIELDS
+    changed_keys = set()
+    rerun = []
+    for node_name, outputs in NODE_OUTPUTS.items():
+        if node_name == "date_grid" and not flexible_dates:
+            continue
+        inputs = NODE_INPUTS[node_name]
+        if changed & set(inputs["trip_plan"]) or changed_keys & set(inputs["state"]):
+            rerun.append(node_name)
+            changed_keys.update(outputs)
+            changed.update(PLAN_OUTPUTS.get(node_name, []))
+    return rerun
+
+
+def revision_input(values: dict, changes: Dict[str, Any], run_id: str, deadline: float) -> Tuple[dict, List[str]]:
+    """
+    Graph input for revising the run with final state `values`: its state with the
+    patched trip_plan, the outputs of the rerun nodes cleared and the other nodes
+    marked as reused. Returns the input and the names of the nodes that run again.
+    """
+    old_plan = values["trip_plan"]
+    try:
+        trip_plan = TripRequest.model_validate({**old_plan.model_dump(), **changes})
+    except ValidationError as e:
+        raise RevisionError(f"Invalid revision: {e}", 422)
+    changed = [field for field in changes if getattr(trip_plan, field) != getattr(old_plan, field)]
+    rerun = affected_nodes(changed, flexible_dates=bool(trip_plan.flexible_days or old_plan.flexible_days))
+    requested = (values.get("date_grid") or {}).get("requested")
+    if "date_grid" in rerun and requested and not {"start_date", "end_date"} & set(changed):
+        # The grid is searched again around the dates the user asked for, not the ones it moved to.
+        trip_plan = trip_plan.model_copy(update={"start_date": requested["start_date"], "end_date": requested["end_date"]})
+
+    graph_input = dict(values)
+    graph_input.update({
+        "run_id": run_id,
+        "trip_plan": trip_plan,
+        "deadline": deadline,
+        "degradations": [],
+        "refinement_count": 0,
+        "reused_nodes": ["planner"] + [node_name for node_name in NODE_OUTPUTS if node_name not in rerun],
+    })
+    for node_name in rerun:
+        for key in NODE_OUTPUTS[node_name]:
+            graph_input[key] = None
+    for key in RESET_KEYS:
+        graph_input[key] = None
+    return graph_input, rerun
+
+
+async def build_revision(graph, previous_run_id: str, changes: Dict[str, Any], run_id: str, deadline: float) -> Tuple[dict, List[str]]:
+    """revision_input() for the finished run `previous_run_id`, read from the checkpointer."""
+    if graph.checkpointer is None:
+        raise RevisionError("Checkpointing is disabled on this server.", 409)
+    snapshot = await graph.aget_state(run_config(previous_run_id))
+    if not snapshot.values or not snapshot.values.get("trip_plan"):
+        raise RevisionError(f"No checkpoint found for run '{previous_run_id}'.", 404)
+    if snapshot.next:
+        raise RevisionError(f"Run '{previous_run_id}' has not finished; resume it first.", 409)
+    unknown = set(changes) - set(TripRequest.model_fields)
+    if unknown:
+        raise RevisionError(f"Unknown trip fields: {', '.join(sorted(unknown))}.", 422)
+    return revision_input(snapshot.values, changes, run_id, deadline)
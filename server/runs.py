@@ -0,0 +1,108 @@
+"""
+Execution of one trip-planning run, as a sequence of (event, data) pairs.
+
+The same events are sent to the client whether the graph runs in the web process
+(EXECUTION_MODE=inline, main.stream_graph_run formats them as SSE) or in a worker
+(EXECUTION_MODE=queue, worker.py publishes them to the job's event channel):
+`run`, `status` per finished node, `final_report` (a draft and the refined report)
+and `error`.
+"""
+import time
+import asyncio
+import logging
+from contextlib import nullcontext
+from typing import AsyncIterator, Optional, Tuple
+
+from artifacts import artifact_store
+from checkpointing import run_config
+from common.log import bind_run_id
+from common.profiling import profile_run
+from deadlines import new_deadline, DEADLINE_GRACE_SECONDS
+from drafts import DRAFT_REPORTS, build_draft
+from metrics import DEADLINE_EXCEEDED
+
+
+logger = logging.getLogger(__name__)
+
+
+async def graph_events(graph, graph_input: Optional[dict], run_id: str, profile: bool = False) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Runs (or, with `graph_input=None`, resumes) `graph` for `run_id` and yields its events.
+    The first event carries the run id so the client can resume the run after an error.
+    With `profile`, the run is sampled and its folded stacks are stored under the run id
+    (GET /admin/profiles/{run_id}).
+    New runs first get a draft `final_report` (version 1, `"draft": true`) built from
+    cached data as soon as the planner is done; the refined report follows with a
+    higher version and `"draft": false`; it also carries the flexible-dates grid
+    (`date_grid`, see date_grid.py) for trips with flexible dates.
+    The nodes degrade their work to finish before the run's deadline; if one overruns
+    it anyway, the run is given up DEADLINE_GRACE_SECONDS later with an error event.
+    """
+    bind_run_id(run_id)
+    with profile_run(run_id) if profile else nullcontext():
+        config = run_config(run_id)
+        yield "run", {"run_id": run_id, "profiled": profile}
+
+        deadline = (graph_input or {}).get("deadline")
+        if graph_input is None and graph.checkpointer is not None:
+            # Resumed runs: the deadline the caller just gave the checkpointed state.
+            deadline = (await graph.aget_state(config)).values.get("deadline")
+        deadline = deadline or new_deadline()
+        chunks = graph.astream(graph_input, config).__aiter__()
+        try:
+            node_output = {}
+            degradations = []
+            date_grid = None
+            version = 0
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(deadline + DEADLINE_GRACE_SECONDS - time.time(), 0))
+                except StopAsyncIteration:
+                    break
+                for node_name, value in chunk.items():
+                    if node_name.startswith("__"):
+                        continue
+                    node_output = value or {}
+                    degradations.extend(node_output.get("degradations") or [])
+                    date_grid = node_output.get("date_grid", date_grid)
+
+                    status_message = f"Working on: {node_name.replace('_', ' ').title()}"
+                    logger.debug("Streaming status: %s", status_message)
+
+                    yield "status", {"message": status_message}
+
+                    if node_name == "planner" and graph_input is not None and DRAFT_REPORTS and node_output.get("trip_plan"):
+                        draft = await asyncio.to_thread(build_draft, node_output["trip_plan"])
+                        if draft:
+                            version += 1
+                            yield "final_report", {"markdown_report": draft, "map_html": None, "version": version, "draft": True}
+                    await asyncio.sleep(0.1)
+
+            final_state = node_output
+            if graph.checkpointer is not None:
+                # Also covers resumed runs, whose earlier degradations were not streamed here.
+                final_state = (await graph.aget_state(config)).values
+                degradations = final_state.get("degradations") or []
+                date_grid = final_state.get("date_grid")
+
+            final_data = {
+                "markdown_report": final_state.get("markdown_report"),
+                "map_html": artifact_store.get(final_state.get("map_html_ref")),
+                "degradations": sorted(set(degradations)),
+                "date_grid": date_grid,
+                "version": version + 1,
+                "draft": False
+            }
+            yield "final_report", final_data
+            artifact_store.release_run(run_id)
+
+        except asyncio.TimeoutError:
+            DEADLINE_EXCEEDED.inc()
+            logger.error("Run %s overran its deadline by more than %ss. Giving up.", run_id, DEADLINE_GRACE_SECONDS)
+            yield "error", {"message": "The trip plan could not be finished in time. Please try again.", "run_id": run_id}
+        except Exception as e:
+            logger.exception("An error occurred during stream: %s", e)
+            error_message = f"An error occurred: {e}"
+            yield "error", {"message": error_message, "run_id": run_id}
+        finally:
+            await chunks.aclose()
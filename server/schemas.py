@@ -1,6 +1,11 @@
 from typing import List, Optional, Literal
 from datetime import datetime
 from pydantic import BaseModel, Field
+# Models exchanged with the microservices live in the shared, versioned schema module.
+from common.schemas import (
+    FlightLeg, FlightInfo, HotelInfo, EventInfo,
+    ActivityPassage, InterestSection, ActivitySearchResult, construct_trusted
+)
 
 
 class TripRequest(BaseModel):
@@ -13,6 +18,7 @@ class TripRequest(BaseModel):
     budget: Optional[float] = Field(description="The estimated budget for the trip.")
     interests: Optional[List[str]] = Field(description="A list of interests for the trip, e.g., ['art', 'history', 'food'].")
     daily_spending_budget: Optional[float] = Field(description="The estimated daily spending budget per person for activities, food, etc.")
+    flexible_days: Optional[int] = Field(default=None, ge=0, description="How many days earlier or later the user could leave and return, if their dates are flexible.")
 
     @property
     def days(self) -> int:
@@ -21,44 +27,12 @@ class TripRequest(BaseModel):
         return (end - start).days + 1
 
 
-class FlightLeg(BaseModel):
-    """Schema for a single leg of a flight (either departure or return)."""
-    departure_time: str = Field(description="Departure time in HH:MM format.")
-    arrival_time: str = Field(description="Arrival time in HH:MM format.")
-    departure_airport: str = Field(description="Full name and IATA code of the departure airport.")
-    arrival_airport: str = Field(description="Full name and IATA code of the arrival airport.")
-    duration_minutes: int = Field(description="Duration of this specific leg in minutes.")
-    airline: str = Field(description="The name of the airline for this leg.")
-    flight_number: str = Field(description="The flight number, e.g., 'TK1857'.")
-    aircraft_type: str = Field(description="The type of aircraft, e.g., 'Boeing 737'.")
-    is_layover: bool = Field(default=False, description="True if this journey has a layover.")
-    layover_airport: Optional[str] = Field(default=None, description="The airport where the layover occurs.")
-    layover_duration_minutes: Optional[int] = Field(default=None, description="The duration of the layover in minutes.")
-
-class FlightInfo(BaseModel):
-    """Schema for flight information, now with detailed legs."""
-    price: float = Field(description="The total price of the round-trip flight for all passengers.")
-    departure_leg: FlightLeg
-    return_leg: FlightLeg
-    total_duration_minutes: int = Field(description="The total round-trip duration in minutes.")
-
 class FlightSelection(BaseModel):
     """Schema for the selected flight."""
     best_option_index: int = Field(description="The index (starting from 0) of the best flight option from the provided list.")
     reasoning: str = Field(description="A brief explanation of why this option was chosen.")
 
 
-class HotelInfo(BaseModel):
-    """Schema for hotel information."""
-    hotel_name: str = Field(description="The name of the hotel.")
-    price_per_night: float = Field(description="The price per night.")
-    total_price: float = Field(description="The total price for the entire stay.")
-    rating: float = Field(description="The hotel's rating out of 9.")
-    review_count: int = Field(description="Total number of reviews for the hotel.")
-    rating_word: str = Field(description="The rating described as a word, e.g., 'Exceptional'.")
-    main_photo_url: Optional[str] = Field(default=None, description="URL of the hotel's main photo.")
-    static_map_url: Optional[str] = Field(default=None, description="URL of a static map image showing the hotel's location.")
-
 class HotelSelection(BaseModel):
     """Schema for the selected hotel."""
     best_option_index: int = Field(description="The index (starting from 0) of the best hotel option from the provided list.")
@@ -84,12 +58,6 @@ class DailyPlan(BaseModel):
 class ScheduledActivities(BaseModel):
     daily_plans: List[DailyPlan]
 
-class EventInfo(BaseModel):
-    name: str = Field(description="The name of the event.")
-    date: str = Field(description="The date of the event in YYYY-MM-DD format.")
-    venue: str = Field(description="The name of the venue where the event is held.")
-    url: str = Field(description="A direct URL to the event page for more details and tickets.")
-
 class SelectedEvents(BaseModel):
     events: List[EventInfo]
 
@@ -104,4 +72,5 @@ class EvaluationResult(BaseModel):
     """Schema for the evaluation result."""
     action: Literal["APPROVE", "REFINE_HOTEL", "REFINE_FLIGHT"] = Field(description="Action to take.")
     feedback: str = Field(description="Feedback on the plan, explaining the reason for the action.")
-    total_cost: float = Field(description="The calculated total cost of the trip.")
\ No newline at end of file
+    total_cost: float = Field(description="The calculated total cost of the trip.")
+
@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import logging
+import threading
+import requests
+from collections import deque
+from typing import Optional
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait, TimeoutError as FutureTimeoutError
+from common.cache import TTLCache, MISSING
+from common.log import run_id_var, RUN_ID_HEADER
+from common.profiling import active_profiler, PROFILE_HEADER, PROFILE_TOKEN
+from common.schemas import SCHEMA_VERSION, construct_trusted, is_compatible
+from common.wire import accept_header, decode_body, SCHEMA_VERSION_HEADER
+from common.upstream import DEADLINE_HEADER
+from metrics import (
+    SERVICE_LATENCY, SERVICE_HEDGED_REQUESTS, SERVICE_FAILURES,
+    SERVICE_CIRCUIT_OPEN, SERVICE_CACHE_LOOKUPS
+)
+
+
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+HEDGE_PERCENTILE = 95
+TIMEOUT_PERCENTILE = 99
+TIMEOUT_MULTIPLIER = 3.0
+MIN_TIMEOUT_SECONDS = 5.0
+# Calls with less time than this left before their deadline are not sent at all.
+MIN_DEADLINE_TIMEOUT_SECONDS = 1.0
+
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT_SECONDS = 30.0
+
+# Prices change quickly; flight and hotel searches (and the nodes built on them) are reused this long at most.
+PRICE_CACHE_TTL_SECONDS = 300
+
+# How long the last response to each payload is kept for draft reports (see drafts.py), fresh or not.
+LAST_KNOWN_TTL_SECONDS = float(os.getenv("LAST_KNOWN_TTL_SECONDS", str(24 * 3600)))
+
+# Responses of our own microservices are validated by their response_model already.
+TRUSTED_SERVICE_RESPONSES = os.getenv("TRUSTED_SERVICE_RESPONSES", "True") == "True"
+
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="service-client")
+_local = threading.local()
+
+logger = logging.getLogger(__name__)
+
+
+def _session() -> requests.Session:
+    """One keep-alive session per worker thread."""
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+class ServiceUnavailableError(requests.exceptions.RequestException):
+    """Raised when a call is rejected because the service's circuit is open."""
+
+
+class DeadlineExceededError(requests.exceptions.Timeout):
+    """Raised when the run's deadline leaves no time for the call."""
+
+
+class LatencyTracker:
+    """Rolling window of recent successful call latencies (in seconds)."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float):
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker.
+    Opens after `failure_threshold` consecutive failures and lets a single
+    trial call through once `reset_timeout` has passed.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+        SERVICE_CIRCUIT_OPEN.labels(self.name).set(0)
+
+    def release_trial(self):
+        """Ends a call that says nothing about the service's health."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                opened = True
+            else:
+                opened = False
+        if opened:
+            SERVICE_CIRCUIT_OPEN.labels(self.name).set(1)
+
+
+class ServiceClient:
+    """
+    Resilient JSON client for one orchestrator -> microservice endpoint.
+
+    - Adaptive timeout: p99 of observed latency x TIMEOUT_MULTIPLIER, clamped to
+      [MIN_TIMEOUT_SECONDS, max_timeout].
+    - Hedging: if the first request has not answered by the p95 latency, a second
+      identical request is sent and whichever succeeds first wins.
+    - Circuit breaker: after repeated failures the service is skipped entirely
+      (ServiceUnavailableError) so nodes fall back to empty results immediately.
+    - Shared lookups: identical payloads sent while a call is in flight wait for
+      that call, and successful responses are reused for `cache_ttl` seconds.
+      This is what lets concurrent trips (e.g. a batch) to the same destination
+      share their upstream searches.
+    - Deadlines: with `deadline` (epoch seconds) the timeout never runs past it, and
+      the deadline is forwarded in X-Request-Deadline so the service can cut its
+      own upstream calls short. Timeouts caused by a short deadline don't count
+      against the circuit breaker.
+    - Wire format: msgpack when both sides have it (JSON otherwise). post_models()
+      builds the shared schema models without validating them again, as long as the
+      service reports a compatible schema version.
+    - Last known responses: clients with a cache also keep the last response to each
+      payload for LAST_KNOWN_TTL_SECONDS; peek() returns it without calling the service.
+    """
+
+    def __init__(self, name: str, url: str, max_timeout: float, hedge: bool = True, cache_ttl: float = 0):
+        self.name = name
+        self.url = url
+        self.max_timeout = max_timeout
+        self.hedge = hedge
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(name)
+        self.cache = TTLCache(maxsize=1024, ttl=cache_ttl) if cache_ttl else None
+        self.last_known = TTLCache(maxsize=1024, ttl=LAST_KNOWN_TTL_SECONDS) if cache_ttl else None
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.trusted = TRUSTED_SERVICE_RESPONSES
+
+    @property
+    def timeout(self) -> float:
+        p99 = self.latency.percentile(TIMEOUT_PERCENTILE)
+        if p99 is None:
+            return self.max_timeout
+        return max(MIN_TIMEOUT_SECONDS, min(self.max_timeout, p99 * TIMEOUT_MULTIPLIER))
+
+    @property
+    def hedge_delay(self):
+        if not self.hedge:
+            return None
+        return self.latency.percentile(HEDGE_PERCENTILE)
+
+    def _send(self, payload: dict, timeout: float, headers: dict):
+        started = time.monotonic()
+        response = _session().post(self.url, json=payload, timeout=timeout, headers={"Accept": accept_header(), **headers})
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return response, time.monotonic() - started
+
+    def post_models(self, payload: dict, model, many: bool = False, deadline: Optional[float] = None):
+        """POSTs the payload and returns the response as `model` instances (a list of them with `many`)."""
+        data = self.post(payload, deadline=deadline)
+        build = construct_trusted if self.trusted else (lambda m, item: m.model_validate(item))
+        if many:
+            return [build(model, item) for item in data]
+        return build(model, data)
+
+    def is_cached(self, payload: dict) -> bool:
+        """True if post(payload) would be answered from the cache, without a service call."""
+        return self.cache is not None and json.dumps(payload, sort_keys=True) in self.cache
+
+    def peek(self, payload: dict):
+        """The last response to `payload` (possibly stale), or None. Never calls the service."""
+        if self.last_known is None:
+            return None
+        return self.last_known.get(json.dumps(payload, sort_keys=True))
+
+    def peek_models(self, payload: dict, model, many: bool = False):
+        """peek() as `model` instances, like post_models()."""
+        data = self.peek(payload)
+        if data is None:
+            return None
+        build = construct_trusted if self.trusted else (lambda m, item: m.model_validate(item))
+        if many:
+            return [build(model, item) for item in data]
+        return build(model, data)
+
+    def _decode(self, response: requests.Response):
+        version = response.headers.get(SCHEMA_VERSION_HEADER)
+        if self.trusted and not is_compatible(version):
+            # An older / newer service: its payloads are validated from now on.
+            self.trusted = False
+            logger.warning("%s service speaks schema %s (ours: %s); validating its responses.", self.name, version, SCHEMA_VERSION)
+        return decode_body(response.headers.get("Content-Type", ""), response.content)
+
+    def post(self, payload: dict, deadline: Optional[float] = None):
+        """
+        POSTs the payload and returns the decoded body (JSON or msgpack).
+        Raises requests.exceptions.RequestException (ServiceUnavailableError,
+        DeadlineExceededError) on failure.
+        """
+        if self.cache is None:
+            return self._post(payload, deadline)
+
+        key = json.dumps(payload, sort_keys=True)
+        cached = self.cache.get(key, MISSING)
+        if cached is not MISSING:
+            SERVICE_CACHE_LOOKUPS.labels(self.name, "hit").inc()
+            return cached
+
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if not leader:
+            SERVICE_CACHE_LOOKUPS.labels(self.name, "coalesced").inc()
+            wait_seconds = None if deadline is None else max(deadline - time.time(), 0)
+            try:
+                return future.result(timeout=wait_seconds)
+            except FutureTimeoutError:
+                raise DeadlineExceededError(f"{self.name} call did not finish before the deadline.")
+
+        SERVICE_CACHE_LOOKUPS.labels(self.name, "miss").inc()
+        try:
+            result = self._post(payload, deadline)
+            self.cache.set(key, result)
+            self.last_known.set(key, result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def _post(self, payload: dict, deadline: Optional[float] = None):
+        timeout = self.timeout
+        deadline_bound = False
+        if deadline is not None:
+            left = deadline - time.time()
+            if left < MIN_DEADLINE_TIMEOUT_SECONDS:
+                SERVICE_FAILURES.labels(self.name, "deadline").inc()
+                raise DeadlineExceededError(f"No time left before the deadline for the {self.name} service.")
+            deadline_bound = left < timeout
+            timeout = min(timeout, left)
+
+        if not self.breaker.allow_request():
+            SERVICE_FAILURES.labels(self.name, "circuit_open").inc()
+            raise ServiceUnavailableError(f"{self.name} service circuit is open; skipping call.")
+
+        hedge_delay = self.hedge_delay
+        # The executor threads don't inherit the caller's context, so the run id is passed explicitly.
+        run_id = run_id_var.get()
+        headers = {RUN_ID_HEADER: run_id} if run_id else {}
+        if deadline is not None:
+            headers[DEADLINE_HEADER] = f"{deadline:.3f}"
+        if active_profiler.get() is not None and PROFILE_TOKEN:
+            headers[PROFILE_HEADER] = PROFILE_TOKEN
+
+        pending = {_executor.submit(self._send, payload, timeout, headers)}
+        if hedge_delay is not None and hedge_delay < timeout:
+            done, _ = wait(pending, timeout=hedge_delay)
+            if not done:
+                SERVICE_HEDGED_REQUESTS.labels(self.name).inc()
+                pending.add(_executor.submit(self._send, payload, timeout, headers))
+
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response, elapsed = future.result()
+                except requests.exceptions.RequestException as e:
+                    error = e
+                    continue
+
+                self.breaker.record_success()
+                self.latency.record(elapsed)
+                SERVICE_LATENCY.labels(self.name).observe(elapsed)
+                response.raise_for_status()
+                return self._decode(response)
+
+        if deadline_bound and isinstance(error, requests.exceptions.Timeout):
+            # Our deadline was shorter than the service's normal latency; not the service's fault.
+            self.breaker.release_trial()
+        else:
+            self.breaker.record_failure()
+        SERVICE_FAILURES.labels(self.name, type(error).__name__).inc()
+        raise error
+
+
+# Prices move, so flight and hotel results are only shared for a few minutes;
+# events, web search results and coordinates are stable for much longer.
+flight_service = ServiceClient("flight", "http://flight-service:8000/search", max_timeout=60, cache_ttl=PRICE_CACHE_TTL_SECONDS)
+hotel_service = ServiceClient("hotel", "http://hotel-service:8001/search", max_timeout=60, cache_ttl=PRICE_CACHE_TTL_SECONDS)
+event_service = ServiceClient("event", "http://event-service:8004/search_events", max_timeout=30, cache_ttl=1800)
+activity_service = ServiceClient("activity", "http://activity-service:8002/search_activities", max_timeout=60, cache_ttl=6 * 3600)
+# Used by the cache warmer to resolve airport codes / location ids ahead of time; never hedged.
+flight_warm_service = ServiceClient("flight_warm", "http://flight-service:8000/warm", max_timeout=120, hedge=False)
+hotel_warm_service = ServiceClient("hotel_warm", "http://hotel-service:8001/warm", max_timeout=120, hedge=False)
+# Nominatim behind the geocoding service is rate limited, so duplicate requests would only queue up.
+geocoding_service = ServiceClient("geocoding", "http://geocoding-service:8003/geocode", max_timeout=30, hedge=False, cache_ttl=7 * 24 * 3600)
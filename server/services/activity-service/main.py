@@ -1,54 +1,76 @@
 import os
-from fastapi import FastAPI, HTTPException
-from langchain_tavily import TavilySearch
-from schemas import ActivitySearchRequest
+import logging
+import asyncio
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from typing import List
+from schemas import ActivitySearchRequest, ActivitySearchResult
+from passages import build_sections
+from common.upstream import upstream, lifespan, deadline_middleware
+from common.log import configure_logging, run_id_middleware
+from common.profiling import install_profiling
+from common.wire import wire_response
 from prometheus_fastapi_instrumentator import Instrumentator
 
-app = FastAPI()
+configure_logging("activity-service")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(lifespan=lifespan)
+app.middleware("http")(run_id_middleware)
+app.middleware("http")(deadline_middleware)
+install_profiling(app)
+# The orchestrator's requests session accepts gzip; small responses are sent as-is.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 Instrumentator().instrument(app).expose(app)
 
-@app.post("/search_activities", response_model=str)
-def search_activities(request: ActivitySearchRequest):
-    print(f"--- Processing Activity Search for {request.destination} ---")
-    
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+
+
+async def search_interest(interest: str, destination: str, api_key: str) -> List[dict]:
+    query = f"specific and famous '{interest}' places, landmarks, or experiences in {destination}. Give me names of places, not tours."
+    logger.info("Searching Tavily for: %s", interest)
+
+    try:
+        response_data = await upstream.post_json(
+            TAVILY_SEARCH_URL,
+            json={"query": query, "max_results": 4},
+            headers={"Authorization": f"Bearer {api_key}"}
+        )
+    except Exception as e:
+        logger.warning("Tavily Error for '%s': %s", interest, e)
+        return []
+
+    search_results = []
+    if isinstance(response_data, dict):
+        search_results = response_data.get('results', [])
+    elif isinstance(response_data, list):
+        search_results = response_data
+
+    return [result for result in search_results if isinstance(result, dict)]
+
+
+@app.post("/search_activities", response_model=ActivitySearchResult)
+async def search_activities(request: ActivitySearchRequest, http_request: Request):
+    return wire_response(http_request, await find_activities(request))
+
+
+async def find_activities(request: ActivitySearchRequest) -> ActivitySearchResult:
+    logger.info("Processing Activity Search for %s", request.destination)
+
     tavily_api_key = os.getenv("TAVILY_API_KEY")
     if not tavily_api_key:
         raise HTTPException(status_code=500, detail="TAVILY_API_KEY not found in environment")
 
-    all_results_summary = ""
-    tavily_search = TavilySearch(max_results=4, api_key=tavily_api_key)
-    
-    for interest in request.interests:
-        query = f"specific and famous '{interest}' places, landmarks, or experiences in {request.destination}. Give me names of places, not tours."
-        print(f"-> Searching Tavily for: {interest}")
-        
-        try:
-            response_data = tavily_search.invoke(query)
-            
-            search_results = []
-            if isinstance(response_data, dict):
-                search_results = response_data.get('results', [])
-            elif isinstance(response_data, list):
-                search_results = response_data
-            
-            all_results_summary += f"\n--- Search Results for '{interest}' in {request.destination} ---\n"
-
-            if not search_results:
-                all_results_summary += "No specific results found for this interest.\n\n"
-                continue
-
-            for result in search_results:
-                if isinstance(result, dict):
-                    title = result.get('title', 'N/A')
-                    content = result.get('content', 'No content')
-                    all_results_summary += f"Title: {title}\nContent: {content}\n\n"
-        
-        except Exception as e:
-            print(f"Tavily Error for '{interest}': {e}")
-            continue
-
-    if not all_results_summary.strip():
-        return "No relevant activities found from web search."
-         
-    return all_results_summary
\ No newline at end of file
+    results = await asyncio.gather(*[
+        search_interest(interest, request.destination, tavily_api_key)
+        for interest in request.interests
+    ])
+    results_by_interest = dict(zip(request.interests, results))
+
+    sections = build_sections(results_by_interest)
+    raw_count = sum(len(r) for r in results)
+    kept_count = sum(len(section.passages) for section in sections)
+    logger.info("Kept %s of %s search results after deduplication.", kept_count, raw_count)
+
+    return ActivitySearchResult(destination=request.destination, sections=sections)
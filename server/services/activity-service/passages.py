@@ -0,0 +1,162 @@
+"""
+Turns raw Tavily results into compact, per-interest sections of candidate passages.
+
+Results from all interests are deduplicated by normalized URL. Boilerplate lines and
+markup are stripped, and passages that are near-duplicates of one already kept
+(Jaccard similarity of word shingles) are dropped. Their interests are merged into
+the passage that was kept.
+"""
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from schemas import ActivityPassage, InterestSection
+
+
+SHINGLE_SIZE = 5
+NEAR_DUPLICATE_THRESHOLD = 0.6
+MAX_PASSAGE_CHARS = 700
+MIN_PASSAGE_CHARS = 60
+# A line that shows up in this many different results is site chrome, not content.
+REPEATED_LINE_MIN_RESULTS = 3
+
+TRACKING_PARAMS = {"fbclid", "gclid", "ref", "ref_src"}
+
+BOILERPLATE_PATTERNS = re.compile(
+    r"cookie|privacy policy|terms of (use|service)|all rights reserved|subscribe|newsletter|"
+    r"sign (up|in)|log ?in|create an account|click here|read more|see more|show more|"
+    r"advertisement|sponsored|skip to (main )?content|share (this|on)|follow us|"
+    r"book now|check availability|download (the|our) app|javascript|©",
+    re.IGNORECASE
+)
+MARKDOWN_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+MARKDOWN_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+BARE_URL = re.compile(r"https?://\S+")
+HTML_TAG = re.compile(r"<[^>]+>")
+MARKUP_CHARS = re.compile(r"[#*_|>`]+")
+WHITESPACE = re.compile(r"[ \t\xa0]+")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+WORD = re.compile(r"\w+")
+
+
+def normalize_url(url: str) -> str:
+    """Lowercased scheme and host, no fragment, trailing slash or tracking parameters."""
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    query = urlencode([
+        (key, value) for key, value in parse_qsl(parts.query)
+        if not (key.lower().startswith("utm_") or key.lower() in TRACKING_PARAMS)
+    ])
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return urlunsplit((parts.scheme.lower() or "https", host, parts.path.rstrip("/"), query, ""))
+
+
+def _clean_line(line: str) -> str:
+    line = MARKDOWN_IMAGE.sub("", line)
+    line = MARKDOWN_LINK.sub(r"\1", line)
+    line = HTML_TAG.sub(" ", line)
+    line = BARE_URL.sub("", line)
+    line = MARKUP_CHARS.sub(" ", line)
+    return WHITESPACE.sub(" ", line).strip(" -–•")
+
+
+def _lines(content: str) -> List[str]:
+    return [line for line in (_clean_line(raw) for raw in (content or "").splitlines()) if line]
+
+
+def _shorten(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    kept = ""
+    for sentence in SENTENCE_END.split(text):
+        if len(kept) + len(sentence) + 1 > max_chars:
+            break
+        kept = f"{kept} {sentence}".strip()
+    return kept or text[:max_chars].rsplit(" ", 1)[0]
+
+
+def strip_boilerplate(content: str, repeated_lines: Set[str]) -> str:
+    kept = []
+    for line in _lines(content):
+        if line.lower() in repeated_lines:
+            continue
+        # Short lines with navigation / marketing wording are chrome; long ones are kept.
+        if len(line) < 160 and BOILERPLATE_PATTERNS.search(line):
+            continue
+        if len(WORD.findall(line)) < 3:
+            continue
+        kept.append(line)
+    return _shorten(" ".join(kept), MAX_PASSAGE_CHARS)
+
+
+def shingles(text: str) -> Set[int]:
+    words = WORD.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))} if words else set()
+    return {
+        zlib.crc32(" ".join(words[i:i + SHINGLE_SIZE]).encode("utf-8"))
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def jaccard(a: Set[int], b: Set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def build_sections(results_by_interest: Dict[str, List[dict]]) -> List[InterestSection]:
+    """
+    `results_by_interest` maps each interest to its Tavily results, best first. Returns
+    one section per interest with its passages in the same order. A passage found by
+    several interests only appears in the section of the first one.
+    """
+    line_counts = Counter()
+    seen_urls = set()
+    for results in results_by_interest.values():
+        for result in results:
+            url = normalize_url(result.get("url", ""))
+            if url and url in seen_urls:
+                continue
+            seen_urls.add(url)
+            for line in set(line.lower() for line in _lines(result.get("content", ""))):
+                line_counts[line] += 1
+    repeated_lines = {line for line, count in line_counts.items() if count >= REPEATED_LINE_MIN_RESULTS}
+
+    sections = [InterestSection(interest=interest, passages=[]) for interest in results_by_interest]
+    kept: List[Tuple[Set[int], ActivityPassage]] = []
+    by_url: Dict[str, ActivityPassage] = {}
+
+    for section, results in zip(sections, results_by_interest.values()):
+        interest = section.interest
+        for result in results:
+            url = normalize_url(result.get("url", ""))
+            existing: Optional[ActivityPassage] = by_url.get(url) if url else None
+            if existing is None:
+                content = strip_boilerplate(result.get("content", ""), repeated_lines)
+                if len(content) < MIN_PASSAGE_CHARS:
+                    continue
+                fingerprint = shingles(content)
+                existing = next((p for s, p in kept if jaccard(fingerprint, s) >= NEAR_DUPLICATE_THRESHOLD), None)
+
+                if existing is None:
+                    passage = ActivityPassage(
+                        title=_clean_line(result.get("title", "")) or "N/A",
+                        url=url,
+                        content=content,
+                        interests=[interest],
+                    )
+                    section.passages.append(passage)
+                    kept.append((fingerprint, passage))
+                    if url:
+                        by_url[url] = passage
+                    continue
+
+            if interest not in existing.interests:
+                existing.interests.append(interest)
+
+    return [section for section in sections if section.passages]
@@ -1,6 +1,8 @@
 from typing import List
 from pydantic import BaseModel
+# The response models are shared with the orchestrator (common/schemas.py).
+from common.schemas import ActivityPassage, InterestSection, ActivitySearchResult
 
 class ActivitySearchRequest(BaseModel):
     destination: str
-    interests: List[str]
\ No newline at end of file
+    interests: List[str]
@@ -0,0 +1,56 @@
+"""
+Maps free-text trip interests to Ticketmaster classifications.
+
+Ticketmaster's `classificationName` filter matches a segment ("Music"), genre
+("Jazz") or sub-genre name, so the interests are translated into the most specific
+of those names. Interests without an equivalent (e.g. "history", "food") are left
+out; if none has one, or the filtered searches find no events, the event service
+searches without a filter.
+"""
+import re
+from typing import List, Optional
+
+
+# (pattern on the normalized interest, classification name), most specific first.
+INTEREST_CLASSIFICATIONS = [
+    (r"\bjazz|\bblues", "Jazz"),
+    (r"\bclassical|orchestra|symphon|\bchamber music", "Classical"),
+    (r"\bopera", "Opera"),
+    (r"\brock\b|\bmetal\b|\bpunk", "Rock"),
+    (r"\bpop\b", "Pop"),
+    (r"hip ?hop|\brap\b", "Hip-Hop/Rap"),
+    (r"electronic|techno|\bhouse music|\bedm\b|\bdj\b|clubbing", "Dance/Electronic"),
+    (r"\bfolk\b", "Folk"),
+    (r"\bcountry music", "Country"),
+    (r"\bmusicals?\b|broadway", "Musical"),
+    (r"\bballet|\bdance\b|\bdancing", "Dance"),
+    (r"comedy|stand ?up", "Comedy"),
+    (r"theat(re|er)|\bplays?\b", "Theatre"),
+    (r"football|soccer", "Soccer"),
+    (r"basketball", "Basketball"),
+    (r"tennis", "Tennis"),
+    (r"\bmusic|concerts?|\bgigs?\b|\blive music|festivals?", "Music"),
+    (r"\bsports?\b|\bmatch(es)?\b|\bgames?\b", "Sports"),
+    (r"\bfilms?\b|cinema|\bmovies?\b", "Film"),
+    (r"\bfamily|\bkids\b|children", "Family"),
+    (r"\barts?\b|\bculture|\bcultural|performing", "Arts & Theatre"),
+]
+_PATTERNS = [(re.compile(pattern), name) for pattern, name in INTEREST_CLASSIFICATIONS]
+
+
+def classification_for(interest: str) -> Optional[str]:
+    normalized = " ".join((interest or "").lower().replace("-", " ").split())
+    for pattern, name in _PATTERNS:
+        if pattern.search(normalized):
+            return name
+    return None
+
+
+def classifications_for(interests: List[str]) -> List[str]:
+    """The classification names for `interests`, without duplicates, in interest order."""
+    names = []
+    for interest in interests:
+        name = classification_for(interest)
+        if name and name not in names:
+            names.append(name)
+    return names
@@ -1,62 +1,174 @@
 import os
-import requests
-from typing import List
-from fastapi import FastAPI, HTTPException
+import logging
+import asyncio
+from datetime import date, timedelta
+from itertools import zip_longest
+from typing import List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.gzip import GZipMiddleware
 from schemas import EventSearchRequest, EventInfo
+from classifications import classifications_for
+from common.cache import TTLCache, async_cached
+from common.upstream import upstream, lifespan, deadline_middleware
+from common.log import configure_logging, run_id_middleware
+from common.profiling import install_profiling
+from common.wire import wire_response
 from prometheus_fastapi_instrumentator import Instrumentator
 
-app = FastAPI()
+configure_logging("event-service")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(lifespan=lifespan)
+app.middleware("http")(run_id_middleware)
+app.middleware("http")(deadline_middleware)
+install_profiling(app)
+# The orchestrator's requests session accepts gzip; small responses are sent as-is.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 Instrumentator().instrument(app).expose(app)
 
+TICKETMASTER_URL = "https://app.ticketmaster.com/discovery/v2/events.json"
+TICKETMASTER_HOST = "app.ticketmaster.com"
+PAGE_SIZE = 50
+# Pages fetched per shard at most; later ones are only fetched while events are missing.
+SHARD_MAX_PAGES = 3
+# Trips up to SHARD_DAYS long are one shard; longer ones are split into at most
+# MAX_SHARDS windows of SHARD_DAYS days or more.
+SHARD_DAYS = 7
+MAX_SHARDS = 6
+SHARD_CONCURRENCY = int(os.getenv("EVENT_SHARD_CONCURRENCY", "4"))
+
+# Ticketmaster allows 5 requests per second per API key: requests start 0.2 s apart,
+# with up to SHARD_CONCURRENCY of them in flight.
+upstream.configure_host(TICKETMASTER_HOST, concurrency=SHARD_CONCURRENCY, min_interval=0.2)
+
+# Pages of one (city, window, classification) shard, shared by all trips that include it.
+page_cache = TTLCache(maxsize=4096, ttl=int(os.getenv("EVENT_PAGE_CACHE_TTL_SECONDS", "3600")))
+
 @app.post("/search_events", response_model=List[EventInfo])
-def search_events(request: EventSearchRequest):
-    print(f"--- Processing Event Search for {request.city} ---")
-    
-    api_key = os.getenv("TICKETMASTER_API_KEY")
-    if not api_key:
-        raise HTTPException(status_code=500, detail="TICKETMASTER_API_KEY missing")
+async def search_events(request: EventSearchRequest, http_request: Request):
+    return wire_response(http_request, await find_events(request))
+
 
-    start_datetime = f"{request.start_date}T00:00:00Z"
-    end_datetime = f"{request.end_date}T23:59:59Z"
-    
-    url = "https://app.ticketmaster.com/discovery/v2/events.json"
-    
+def _to_event(event_data: dict) -> EventInfo:
+    venue_info = event_data.get('_embedded', {}).get('venues', [{}])[0]
+    return EventInfo(
+        name=event_data.get('name', 'Unknown Event'),
+        date=event_data.get('dates', {}).get('start', {}).get('localDate', ''),
+        venue=venue_info.get('name', 'Venue details not available'),
+        url=event_data.get('url', '#')
+    )
+
+
+@async_cached(page_cache, key=lambda city, window, classification, page: (city.strip().lower(), window, classification, page),
+              cache_if=lambda result: result is not None)
+async def shard_page(city: str, window: Tuple[str, str], classification: Optional[str], page: int) -> Optional[Tuple[List[EventInfo], int]]:
+    """
+    One page of a shard's events, most relevant first, and the shard's number of
+    pages. None if Ticketmaster failed; that is not cached.
+    """
     params = {
-        'apikey': api_key,
-        'city': request.city,
-        'startDateTime': start_datetime,
-        'endDateTime': end_datetime,
-        'sort': 'relevance,desc', 
-        'size': 50 
+        'apikey': os.getenv("TICKETMASTER_API_KEY"),
+        'city': city,
+        'startDateTime': f"{window[0]}T00:00:00Z",
+        'endDateTime': f"{window[1]}T23:59:59Z",
+        'sort': 'relevance,desc',
+        'size': PAGE_SIZE,
+        'page': page
     }
-
+    if classification:
+        params['classificationName'] = classification
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-
-        if not data.get('_embedded') or not data['_embedded'].get('events'):
-            print(f"-> No events found in {request.city}.")
-            return []
-
-        events = []
-        for event_data in data['_embedded']['events']:
-            venue_info = event_data.get('_embedded', {}).get('venues', [{}])[0]
-            
-            local_date = event_data.get('dates', {}).get('start', {}).get('localDate', '')
-            
-            event = EventInfo(
-                name=event_data.get('name', 'Unknown Event'),
-                date=local_date,
-                venue=venue_info.get('name', 'Venue details not available'),
-                url=event_data.get('url', '#')
-            )
-            events.append(event)
-        
-        print(f"-> Found {len(events)} events.")
-        return events
-
+        data = await upstream.get_json(TICKETMASTER_URL, params=params)
     except Exception as e:
-        print(f"Ticketmaster API Error: {e}")
-        return []
\ No newline at end of file
+        logger.warning("Ticketmaster API Error (%s, %s, %s): %s", city, window, classification, e)
+        return None
+    events = [_to_event(event_data) for event_data in data.get('_embedded', {}).get('events', [])]
+    return events, data.get('page', {}).get('totalPages', 1)
+
+
+def date_windows(start_date: str, end_date: str) -> List[Tuple[str, str]]:
+    """The trip window split into shards; short trips are a single shard."""
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    days = (end - start).days + 1
+    shard_days = max(SHARD_DAYS, -(-days // MAX_SHARDS))
+    return [
+        ((start + timedelta(days=offset)).isoformat(), min(start + timedelta(days=offset + shard_days - 1), end).isoformat())
+        for offset in range(0, max(days, 1), shard_days)
+    ]
+
+
+def spread_by_day(ranked_lists: List[List[EventInfo]], limit: int) -> List[EventInfo]:
+    """
+    Up to `limit` distinct events from relevance-ordered lists (one per shard and
+    classification): the lists are interleaved by rank, then the events are taken
+    round-robin over the days, so every day of the trip gets its most relevant ones.
+    """
+    by_day = {}
+    seen = set()
+    for ranked in zip_longest(*ranked_lists):
+        for event in ranked:
+            # An event can be in several classifications (e.g. "Music" and "Jazz").
+            key = (event.name, event.date, event.venue) if event else None
+            if key is None or key in seen:
+                continue
+            seen.add(key)
+            by_day.setdefault(event.date, []).append(event)
+
+    events = []
+    for rank in range(max((len(day_events) for day_events in by_day.values()), default=0)):
+        for day in sorted(by_day):
+            if rank < len(by_day[day]):
+                events.append(by_day[day][rank])
+    return events[:limit]
+
+
+async def search_shards(city: str, windows: List[Tuple[str, str]], classifications: List[Optional[str]], max_events: int) -> List[EventInfo]:
+    """
+    Up to `max_events` events from one shard per window and classification. The
+    first page of every shard is fetched; more pages only while fewer than
+    `max_events` distinct events have been found.
+    """
+    shards = [(window, classification) for window in windows for classification in classifications]
+    pages = {shard: [] for shard in shards}
+    total_pages = {shard: 1 for shard in shards}
+    for page in range(SHARD_MAX_PAGES):
+        pending = [shard for shard in shards if page < total_pages[shard]]
+        if not pending:
+            break
+        results = await asyncio.gather(*(shard_page(city, window, classification, page) for window, classification in pending))
+        for shard, result in zip(pending, results):
+            if result is None:
+                total_pages[shard] = 0
+                continue
+            shard_events, total_pages[shard] = result
+            pages[shard].extend(shard_events)
+        if len(spread_by_day(list(pages.values()), max_events)) >= max_events:
+            break
+
+    events = spread_by_day(list(pages.values()), max_events)
+    logger.info("Found %s events in %s shards.", len(events), len(shards))
+    return events
+
+
+async def find_events(request: EventSearchRequest) -> List[EventInfo]:
+    """
+    Searches the trip's date windows (see date_windows()) filtered by the
+    classifications of the request's interests. Without a matching classification,
+    or when the filtered searches find nothing, all events are searched.
+    """
+    logger.info("Processing Event Search for %s", request.city)
+
+    if not os.getenv("TICKETMASTER_API_KEY"):
+        raise HTTPException(status_code=500, detail="TICKETMASTER_API_KEY missing")
+
+    windows = date_windows(request.start_date, request.end_date)
+    classifications = classifications_for(request.interests or [])
+    if classifications:
+        events = await search_shards(request.city, windows, classifications, request.max_events)
+        if events:
+            return events
+        logger.info("No events in the classifications %s; searching all events.", classifications)
+    elif request.interests:
+        logger.info("No event classification matches the interests %s; searching all events.", request.interests)
+    return await search_shards(request.city, windows, [None], request.max_events)
@@ -1,13 +1,12 @@
+from typing import List, Optional
 from pydantic import BaseModel, Field
+# EventInfo is shared with the orchestrator (common/schemas.py).
+from common.schemas import EventInfo
 
 class EventSearchRequest(BaseModel):
     city: str
     start_date: str
     end_date: str
-
-class EventInfo(BaseModel):
-    """Schema for a single event."""
-    name: str = Field(description="The name of the event.")
-    date: str = Field(description="The date of the event.")
-    venue: str = Field(description="The name of the venue.")
-    url: str = Field(description="A direct URL to the event page.")
\ No newline at end of file
+    # Mapped to Ticketmaster classifications; without them, events of any kind are returned.
+    interests: Optional[List[str]] = None
+    max_events: int = Field(default=20, ge=1, le=200)
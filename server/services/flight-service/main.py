@@ -1,14 +1,28 @@
 import os
-import requests
-import concurrent.futures
+import logging
+import asyncio
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Request
+from fastapi.middleware.gzip import GZipMiddleware
 from datetime import datetime
 from pydantic import BaseModel
 from schemas import FlightInfo, FlightLeg
+from common.upstream import upstream, lifespan, deadline_middleware
+from common.log import configure_logging, run_id_middleware
+from common.profiling import install_profiling
+from common.wire import wire_response
+from common.cache import TTLCache, async_cached
 from prometheus_fastapi_instrumentator import Instrumentator
 
-app = FastAPI()
+configure_logging("flight-service")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(lifespan=lifespan)
+app.middleware("http")(run_id_middleware)
+app.middleware("http")(deadline_middleware)
+install_profiling(app)
+# The orchestrator's requests session accepts gzip; small responses are sent as-is.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 Instrumentator().instrument(app).expose(app)
 
@@ -20,9 +34,14 @@ class FlightSearchRequest(BaseModel):
     person: int
 
 
-def find_iata_codes(city_name: str) -> List[str]:
+# Airport codes for a city practically never change; cache them for a day.
+iata_cache = TTLCache(maxsize=2048, ttl=24 * 3600)
+
+
+@async_cached(iata_cache, key=lambda city_name: city_name.strip().lower())
+async def find_iata_codes(city_name: str) -> List[str]:
   
-    print(f"--- Calling Booking.com auto-complete API for {city_name} ---")
+    logger.info("Calling Booking.com auto-complete API for %s", city_name)
     url = "https://booking-com18.p.rapidapi.com/flights/v2/auto-complete"
     querystring = {"query": city_name}
     headers = {
@@ -30,9 +49,7 @@ def find_iata_codes(city_name: str) -> List[str]:
         "x-rapidapi-host": "booking-com18.p.rapidapi.com"
     }
     try:
-        response = requests.get(url, headers=headers, params=querystring)
-        response.raise_for_status()
-        data = response.json()
+        data = await upstream.get_json(url, headers=headers, params=querystring)
         iata_codes = []
         if data.get('data'):
             for location in data['data']:
@@ -40,9 +57,22 @@ def find_iata_codes(city_name: str) -> List[str]:
                     iata_codes.append(location['code'])
         return iata_codes
     except Exception as e:
-        print(f"Error finding IATA for {city_name}: {e}")
+        logger.warning("Error finding IATA for %s: %s", city_name, e)
         return []
 
+class WarmRequest(BaseModel):
+    cities: List[str]
+
+
+@app.post("/warm")
+async def warm_iata_codes(request: WarmRequest, http_request: Request):
+    """Resolves the airport codes of the given cities ahead of time (called by the orchestrator's cache warmer)."""
+    # One city at a time: warming must never compete with live searches for the API quota.
+    resolved = {}
+    for city in request.cities:
+        resolved[city] = await find_iata_codes(city)
+    return wire_response(http_request, resolved)
+
 def parse_journey_segment(segment: dict) -> Optional[FlightLeg]:
     try:
         legs = segment.get('legs', [])
@@ -93,32 +123,36 @@ def parse_journey_segment(segment: dict) -> Optional[FlightLeg]:
             layover_airport=layover_airport,
             layover_duration_minutes=layover_duration_minutes
         )
-    except Exception as e:
+    except Exception:
         return None
 
-def fetch_flight_data(origin, dest, start_date, end_date, person, headers):
+async def fetch_flight_data(origin, dest, start_date, end_date, person, headers):
     url = "https://booking-com18.p.rapidapi.com/flights/v2/search-roundtrip"
     querystring = {
         "departId": origin, "arrivalId": dest, 
         "departDate": start_date, "returnDate": end_date, 
         "adults": str(person), "sort": "CHEAPEST", "currency_code": "EUR"
     }
-    print(f"🚀 Parallel Request: {origin} -> {dest}")
+    logger.debug("Parallel request: %s -> %s", origin, dest)
     try:
-        response = requests.get(url, headers=headers, params=querystring, timeout=20)
-        response.raise_for_status()
-        return response.json()
+        return await upstream.get_json(url, headers=headers, params=querystring)
     except Exception as e:
-        print(f"API Error for {origin}->{dest}: {e}")
+        logger.warning("API Error for %s->%s: %s", origin, dest, e)
         return None
 
 
 @app.post("/search", response_model=List[FlightInfo])
-def search_flights(request: FlightSearchRequest):
-    print(f"Processing flight search request: {request.origin} -> {request.destination}")
+async def search_flights(request: FlightSearchRequest, http_request: Request):
+    return wire_response(http_request, await find_flights(request))
+
+
+async def find_flights(request: FlightSearchRequest) -> List[FlightInfo]:
+    logger.info("Processing flight search request: %s -> %s", request.origin, request.destination)
     
-    origin_iata_list = find_iata_codes(request.origin)
-    destination_iata_list = find_iata_codes(request.destination)
+    origin_iata_list, destination_iata_list = await asyncio.gather(
+        find_iata_codes(request.origin),
+        find_iata_codes(request.destination)
+    )
     
     if not origin_iata_list or not destination_iata_list:
         return []
@@ -128,40 +162,37 @@ def search_flights(request: FlightSearchRequest):
     headers = { "x-rapidapi-key": rapid_key, "x-rapidapi-host": "booking-com18.p.rapidapi.com" }
 
 
-    tasks = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        for origin in origin_iata_list:
-            for dest in destination_iata_list:
-                tasks.append(
-                    executor.submit(fetch_flight_data, origin, dest, request.start_date, request.end_date, request.person, headers)
-                )
+    tasks = [
+        fetch_flight_data(origin, dest, request.start_date, request.end_date, request.person, headers)
+        for origin in origin_iata_list
+        for dest in destination_iata_list
+    ]
+
+    for data in await asyncio.gather(*tasks):
+        if not data: continue
         
-        for future in concurrent.futures.as_completed(tasks):
-            data = future.result()
-            if not data: continue
+        offers = data.get('data', {}).get('flightOffers', []) or data.get('data', {}).get('flights', [])
+        for offer in offers:
+            price_info = offer.get('priceBreakdown', {}).get('total', {})
+            total_price = price_info.get('units', 0) + price_info.get('nanos', 0) / 1e9
+            segments = offer.get('segments')
+            if not segments or len(segments) < 2: continue
+
+            departure_leg = parse_journey_segment(segments[0])
+            return_leg = parse_journey_segment(segments[1])
+            
+            if not departure_leg or not return_leg: continue
             
-            offers = data.get('data', {}).get('flightOffers', []) or data.get('data', {}).get('flights', [])
-            for offer in offers:
-                price_info = offer.get('priceBreakdown', {}).get('total', {})
-                total_price = price_info.get('units', 0) + price_info.get('nanos', 0) / 1e9
-                segments = offer.get('segments')
-                if not segments or len(segments) < 2: continue
-
-                departure_leg = parse_journey_segment(segments[0])
-                return_leg = parse_journey_segment(segments[1])
-                
-                if not departure_leg or not return_leg: continue
-                
-                total_duration = departure_leg.duration_minutes + return_leg.duration_minutes
-                all_flight_options.append(FlightInfo(
-                    price=total_price, departure_leg=departure_leg,
-                    return_leg=return_leg, total_duration_minutes=total_duration
-                ))
+            total_duration = departure_leg.duration_minutes + return_leg.duration_minutes
+            all_flight_options.append(FlightInfo(
+                price=total_price, departure_leg=departure_leg,
+                return_leg=return_leg, total_duration_minutes=total_duration
+            ))
 
     if not all_flight_options:
         return []
 
     all_flight_options.sort(key=lambda x: x.price + (x.total_duration_minutes * 0.5))
     
-    print(f"Found {len(all_flight_options)} flights. Returning top 10.")
+    logger.info("Found %s flights. Returning top 10.", len(all_flight_options))
     return all_flight_options[:10]
\ No newline at end of file
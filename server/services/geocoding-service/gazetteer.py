@@ -0,0 +1,188 @@
+"""
+Local gazetteer: the first geocoding tier, in front of Nominatim.
+
+A gazetteer is a CSV file of places with the columns `name,city,latitude,longitude`
+and the optional `address` and `aliases` (separated by "|"). `city` scopes a place
+to a city, e.g. "Colosseum" in "Rome"; leave it empty for places looked up on their
+own, like cities and countries. A small gazetteer of landmarks is bundled
+(data/landmarks.csv); larger ones can be imported from any source with these
+columns:
+
+    python gazetteer.py build data/landmarks.csv more_places.csv -o gazetteer.idx
+    python gazetteer.py lookup gazetteer.idx "Colosseum, Rome"
+
+The index is a compact binary file that is memory-mapped, so lookups read just a few
+pages of it and workers share it through the page cache:
+
+    header   MAGIC, record count (uint32)
+    records  sorted by key: key (uint64), latitude, longitude (float32),
+             address offset (uint32), address length (uint32)
+    strings  UTF-8 addresses
+
+The key is a 64-bit hash of the normalized city and name, and a lookup is a binary
+search over the records. Queries are parsed like the orchestrator sends them,
+"<place>, <city>", and also looked up unscoped.
+"""
+import os
+import re
+import sys
+import csv
+import mmap
+import struct
+import hashlib
+import argparse
+import unicodedata
+from typing import Iterable, List, Optional, Tuple
+
+
+MAGIC = b"GZT1"
+HEADER = struct.Struct("<4sI")
+RECORD = struct.Struct("<QffII")
+
+LEADING_ARTICLE = re.compile(r"^(the|la|le|il|el|der|die|das) ")
+NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase ASCII words without accents, punctuation or a leading article."""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    text = NON_WORD.sub(" ", text.lower()).strip()
+    return LEADING_ARTICLE.sub("", text)
+
+
+def place_key(name: str, city: str = "") -> int:
+    digest = hashlib.blake2b(f"{normalize(city)}\x00{normalize(name)}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def query_keys(query: str) -> List[int]:
+    """
+    Keys to try for a free-text query, most specific first: "<place>, <city>" scoped
+    (the city may be followed by more parts, as in "Colosseum, Rome, Italy"), then the
+    whole query unscoped.
+    """
+    keys = []
+    parts = query.split(",")
+    for i in range(1, len(parts)):
+        name = ",".join(parts[:i])
+        for city in (",".join(parts[i:]), parts[i]):
+            key = place_key(name, city)
+            if normalize(name) and normalize(city) and key not in keys:
+                keys.append(key)
+    keys.append(place_key(query))
+    return keys
+
+
+class Gazetteer:
+    """Read-only view of an index file built by build_index()."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a gazetteer index.")
+
+    @classmethod
+    def open(cls, path: str) -> Optional["Gazetteer"]:
+        """The index at `path`, or None if there is none."""
+        if not path or not os.path.exists(path):
+            return None
+        return cls(path)
+
+    def _record(self, index: int) -> Tuple[int, float, float, int, int]:
+        return RECORD.unpack_from(self._map, HEADER.size + index * RECORD.size)
+
+    def _find(self, key: int) -> Optional[Tuple[int, float, float, int, int]]:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            record = self._record(middle)
+            if record[0] < key:
+                low = middle + 1
+            elif record[0] > key:
+                high = middle
+            else:
+                return record
+        return None
+
+    def lookup(self, query: str) -> Optional[Tuple[float, float, Optional[str]]]:
+        """(latitude, longitude, address) for the query, or None if the gazetteer doesn't know it."""
+        for key in query_keys(query):
+            record = self._find(key)
+            if record is not None:
+                _, latitude, longitude, offset, length = record
+                address = self._map[offset:offset + length].decode("utf-8") if length else None
+                # float32 keeps ~1 m of precision; drop the noise digits.
+                return round(latitude, 6), round(longitude, 6), address
+        return None
+
+    def close(self):
+        self._map.close()
+
+
+def read_places(paths: Iterable[str]) -> Iterable[Tuple[str, str, float, float, str]]:
+    """(name, city, latitude, longitude, address) for every name and alias in the CSV files."""
+    for path in paths:
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                city = row.get("city") or ""
+                latitude, longitude = float(row["latitude"]), float(row["longitude"])
+                address = row.get("address") or ", ".join(part for part in (row["name"], city) if part)
+                for name in [row["name"]] + [alias for alias in (row.get("aliases") or "").split("|") if alias.strip()]:
+                    yield name, city, latitude, longitude, address
+
+
+def build_index(places: Iterable[Tuple[str, str, float, float, str]], output_path: str) -> int:
+    """Writes the index for `places` to `output_path` (atomically); returns the number of keys."""
+    entries = {}
+    for name, city, latitude, longitude, address in places:
+        # Later files win, so an import can correct the bundled gazetteer.
+        entries[place_key(name, city)] = (latitude, longitude, address)
+
+    strings = bytearray()
+    addresses = {}
+    records = []
+    strings_start = HEADER.size + len(entries) * RECORD.size
+    for key in sorted(entries):
+        latitude, longitude, address = entries[key]
+        if address not in addresses:
+            encoded = address.encode("utf-8")
+            addresses[address] = (strings_start + len(strings), len(encoded))
+            strings += encoded
+        records.append(RECORD.pack(key, latitude, longitude, *addresses[address]))
+
+    temp_path = f"{output_path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(records)))
+        f.writelines(records)
+        f.write(strings)
+    os.replace(temp_path, output_path)
+    return len(records)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Builds and queries the local gazetteer index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build an index from gazetteer CSV files.")
+    build.add_argument("sources", nargs="+", help="CSV files with name,city,latitude,longitude[,address][,aliases].")
+    build.add_argument("-o", "--output", default="gazetteer.idx")
+    lookup = commands.add_parser("lookup", help="Look a query up in an index.")
+    lookup.add_argument("index")
+    lookup.add_argument("query")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        count = build_index(read_places(args.sources), args.output)
+        print(f"Wrote {count} places to {args.output} ({os.path.getsize(args.output)} bytes).")
+    else:
+        result = Gazetteer(args.index).lookup(args.query)
+        if result is None:
+            print("Not found.")
+            sys.exit(1)
+        print("%.6f, %.6f  %s" % result)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,88 @@
-from fastapi import FastAPI
+import os
+import logging
+from fastapi import FastAPI, Request
+from fastapi.middleware.gzip import GZipMiddleware
 from schemas import GeocodeRequest, GeocodeResponse
-from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
+from common.upstream import upstream, lifespan, deadline_middleware
+from common.log import configure_logging, run_id_middleware
+from common.profiling import install_profiling
+from common.wire import wire_response
 from prometheus_fastapi_instrumentator import Instrumentator
+from prometheus_client import Counter
+from gazetteer import Gazetteer
 
-app = FastAPI()
+configure_logging("geocoding-service")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(lifespan=lifespan)
+app.middleware("http")(run_id_middleware)
+app.middleware("http")(deadline_middleware)
+install_profiling(app)
+# The orchestrator's requests session accepts gzip; small responses are sent as-is.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 Instrumentator().instrument(app).expose(app)
 
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+NOMINATIM_HOST = "nominatim.openstreetmap.org"
+USER_AGENT = "ai_travel_agent_microservice_v2"
+
+# Nominatim's usage policy: one request at a time, spaced out across the whole process.
+upstream.configure_host(NOMINATIM_HOST, concurrency=1, min_interval=2.0)
+
+# Local first tier, built from the gazetteer CSVs with `python gazetteer.py build`.
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", "gazetteer.idx")
+gazetteer = Gazetteer.open(GAZETTEER_PATH)
+if gazetteer is None:
+    logger.warning("No gazetteer index at %s; every lookup goes to Nominatim.", GAZETTEER_PATH)
+else:
+    logger.info("Loaded %s gazetteer places from %s.", gazetteer.count, GAZETTEER_PATH)
+
+# Tier hit rate: rate(geocode_lookups_total{tier="gazetteer"}) / rate(geocode_lookups_total).
+GEOCODE_LOOKUPS = Counter(
+    "geocode_lookups_total",
+    "Geocoding lookups by the tier that answered them (`none`: no tier found the place).",
+    ["tier"]
+)
+
+
 @app.post("/geocode", response_model=GeocodeResponse)
-def geocode_location(request: GeocodeRequest):
-    print(f"--- Processing Geocoding Request: {request.query} ---")
+async def geocode_location(request: GeocodeRequest, http_request: Request):
+    return wire_response(http_request, await find_location(request))
+
+
+async def find_location(request: GeocodeRequest) -> GeocodeResponse:
+    logger.info("Processing Geocoding Request: %s", request.query)
+    if gazetteer is not None:
+        place = gazetteer.lookup(request.query)
+        if place is not None:
+            GEOCODE_LOOKUPS.labels("gazetteer").inc()
+            latitude, longitude, address = place
+            return GeocodeResponse(latitude=latitude, longitude=longitude, address=address)
+
     try:
-        geolocator = Nominatim(user_agent="ai_travel_agent_microservice_v2")
-        
-        geocode = RateLimiter(geolocator.geocode, min_delay_seconds=2.0)
-
-        location = geocode(request.query, timeout=15)
-        
-        
-        if location:
-            print(f"-> Found: {location.latitude}, {location.longitude}")
+        results = await upstream.get_json(
+            NOMINATIM_URL,
+            params={"q": request.query, "format": "json", "limit": 1},
+            headers={"User-Agent": USER_AGENT},
+            timeout=15
+        )
+
+        if results:
+            GEOCODE_LOOKUPS.labels("nominatim").inc()
+            location = results[0]
+            logger.debug("Found: %s, %s", location['lat'], location['lon'])
             return GeocodeResponse(
-                latitude=location.latitude, 
-                longitude=location.longitude,
-                address=location.address
+                latitude=float(location['lat']),
+                longitude=float(location['lon']),
+                address=location.get('display_name')
             )
         else:
-            print("-> Location not found.")
+            GEOCODE_LOOKUPS.labels("none").inc()
+            logger.info("Location not found.")
             return GeocodeResponse(latitude=None, longitude=None, address=None)
-            
+
     except Exception as e:
-        print(f"Geocoding Internal Error: {e}")
-        return GeocodeResponse(latitude=None, longitude=None, address=None)
\ No newline at end of file
+        GEOCODE_LOOKUPS.labels("error").inc()
+        logger.warning("Geocoding Internal Error: %s", e)
+        return GeocodeResponse(latitude=None, longitude=None, address=None)
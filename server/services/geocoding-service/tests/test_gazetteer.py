@@ -0,0 +1,74 @@
+import pytest
+from gazetteer import Gazetteer, build_index, normalize, place_key, query_keys, read_places
+
+
+PLACES = """name,city,latitude,longitude,address,aliases
+Rome,,41.8933,12.4829,"Rome, Lazio, Italy",Roma
+Colosseum,Rome,41.890251,12.492373,"Piazza del Colosseo, Rome",Colosseo|Flavian Amphitheatre
+The Louvre,Paris,48.8606,2.3376,,
+"""
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    source = tmp_path / "places.csv"
+    source.write_text(PLACES, encoding="utf-8")
+    path = str(tmp_path / "gazetteer.idx")
+    assert build_index(read_places([str(source)]), path) == 6
+    index = Gazetteer(path)
+    yield index
+    index.close()
+
+
+def test_normalize():
+    assert normalize("  The Café de Flore! ") == "cafe de flore"
+    assert normalize("Sagrada-Família") == "sagrada familia"
+
+
+def test_query_keys_most_specific_first():
+    keys = query_keys("Colosseum, Rome, Italy")
+    assert keys[0] == place_key("Colosseum", "Rome, Italy")
+    assert keys[1] == place_key("Colosseum", "Rome")
+    assert keys[-1] == place_key("Colosseum, Rome, Italy")
+    assert len(keys) == len(set(keys))
+
+
+def test_query_keys_unscoped():
+    assert query_keys("Rome") == [place_key("Rome")]
+    assert query_keys("Rome,") == [place_key("Rome,")]
+
+
+def test_lookup_scoped(gazetteer):
+    latitude, longitude, address = gazetteer.lookup("Colosseum, Rome, Italy")
+    assert (latitude, longitude) == pytest.approx((41.890251, 12.492373), abs=1e-5)
+    assert address == "Piazza del Colosseo, Rome"
+    assert gazetteer.lookup("the colosseo, ROME")[:2] == (latitude, longitude)
+    assert gazetteer.lookup("Flavian Amphitheatre, Rome") is not None
+
+
+def test_lookup_unscoped_and_default_address(gazetteer):
+    latitude, longitude, address = gazetteer.lookup("Roma")
+    assert (latitude, longitude) == pytest.approx((41.8933, 12.4829), abs=1e-5)
+    assert address == "Rome, Lazio, Italy"
+    assert gazetteer.lookup("Louvre, Paris")[2] == "The Louvre, Paris"
+
+
+def test_lookup_unknown(gazetteer):
+    assert gazetteer.lookup("Colosseum") is None
+    assert gazetteer.lookup("Colosseum, Paris") is None
+    assert gazetteer.lookup("Atlantis") is None
+
+
+def test_later_files_win(tmp_path):
+    first, second = tmp_path / "a.csv", tmp_path / "b.csv"
+    first.write_text("name,city,latitude,longitude\nRome,,1.0,2.0\n", encoding="utf-8")
+    second.write_text("name,city,latitude,longitude\nRome,,41.5,12.5\n", encoding="utf-8")
+    path = str(tmp_path / "gazetteer.idx")
+    build_index(read_places([str(first), str(second)]), path)
+    index = Gazetteer(path)
+    assert index.lookup("Rome")[:2] == pytest.approx((41.5, 12.5), abs=1e-5)
+    index.close()
+
+
+def test_open_missing_index(tmp_path):
+    assert Gazetteer.open(str(tmp_path / "missing.idx")) is None
@@ -1,12 +1,26 @@
 import os
-import requests
+import logging
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Request
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
 from schemas import HotelInfo
+from common.upstream import upstream, lifespan, deadline_middleware
+from common.log import configure_logging, run_id_middleware
+from common.profiling import install_profiling
+from common.wire import wire_response
+from common.cache import TTLCache, async_cached
 from prometheus_fastapi_instrumentator import Instrumentator
 
-app = FastAPI()
+configure_logging("hotel-service")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(lifespan=lifespan)
+app.middleware("http")(run_id_middleware)
+app.middleware("http")(deadline_middleware)
+install_profiling(app)
+# The orchestrator's requests session accepts gzip; small responses are sent as-is.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 Instrumentator().instrument(app).expose(app)
 
@@ -16,8 +30,13 @@ class HotelSearchRequest(BaseModel):
     end_date: str
     person: int
 
-def find_location_id(city_name: str) -> Optional[str]:
-    print(f"--- Finding Location ID for {city_name} ---")
+# Booking.com location ids are stable; cache them for a day.
+location_id_cache = TTLCache(maxsize=2048, ttl=24 * 3600)
+
+
+@async_cached(location_id_cache, key=lambda city_name: city_name.strip().lower())
+async def find_location_id(city_name: str) -> Optional[str]:
+    logger.info("Finding Location ID for %s", city_name)
     url = "https://booking-com18.p.rapidapi.com/stays/auto-complete"
     querystring = {"query": city_name}
     headers = {
@@ -25,26 +44,41 @@ def find_location_id(city_name: str) -> Optional[str]:
         "x-rapidapi-host": "booking-com18.p.rapidapi.com"
     }
     try:
-        response = requests.get(url, headers=headers, params=querystring)
-        response.raise_for_status()
-        data = response.json()
+        data = await upstream.get_json(url, headers=headers, params=querystring)
         if data.get('data') and len(data['data']) > 0:
             return data['data'][0].get('id')
         return None
     except Exception as e:
-        print(f"Location ID Error: {e}")
+        logger.warning("Location ID Error: %s", e)
         return None
 
+class WarmRequest(BaseModel):
+    destinations: List[str]
+
+
+@app.post("/warm")
+async def warm_location_ids(request: WarmRequest, http_request: Request):
+    """Resolves the location ids of the given destinations ahead of time (called by the orchestrator's cache warmer)."""
+    # One destination at a time: warming must never compete with live searches for the API quota.
+    resolved = {}
+    for destination in request.destinations:
+        resolved[destination] = await find_location_id(destination)
+    return wire_response(http_request, resolved)
+
 @app.post("/search", response_model=List[HotelInfo])
-def search_hotels(request: HotelSearchRequest):
-    print(f"Processing hotel search for: {request.destination}")
+async def search_hotels(request: HotelSearchRequest, http_request: Request):
+    return wire_response(http_request, await find_hotels(request))
+
+
+async def find_hotels(request: HotelSearchRequest) -> List[HotelInfo]:
+    logger.info("Processing hotel search for: %s", request.destination)
     
-    location_id = find_location_id(request.destination)
+    location_id = await find_location_id(request.destination)
     if not location_id:
-        print("Location ID not found.")
+        logger.info("Location ID not found.")
         return []
 
-    print(f"Searching hotels with ID: {location_id}")
+    logger.info("Searching hotels with ID: %s", location_id)
     url = "https://booking-com18.p.rapidapi.com/stays/search"
     querystring = {
         "locationId": location_id,
@@ -60,9 +94,7 @@ def search_hotels(request: HotelSearchRequest):
     }
 
     try:
-        response = requests.get(url, headers=headers, params=querystring)
-        response.raise_for_status()
-        data = response.json()
+        data = await upstream.get_json(url, headers=headers, params=querystring)
 
         if not data.get('data'):
             return []
@@ -96,9 +128,9 @@ def search_hotels(request: HotelSearchRequest):
                 )
             )
         
-        print(f"Found {len(results)} hotels.")
+        logger.info("Found %s hotels.", len(results))
         return results
 
     except Exception as e:
-        print(f"Hotel API Error: {e}")
+        logger.warning("Hotel API Error: %s", e)
         return []
\ No newline at end of file
@@ -1,11 +1,13 @@
+import operator
 from typing_extensions import TypedDict
-from typing import Optional, List
+from typing import Annotated, Optional, List
 from schemas import (
     TripRequest, FlightInfo, HotelInfo, Activity, EventInfo, 
     Itinerary, EvaluationResult
 )
 
 class TripState(TypedDict):
+    run_id: str
     user_request: str
     trip_plan: Optional[TripRequest]
     selected_flight: Optional[FlightInfo] 
@@ -14,8 +16,20 @@ class TripState(TypedDict):
     hotel_options: List[HotelInfo]
     extracted_activities: Optional[List[Activity]]
     events: Optional[List[EventInfo]]
+    event_options: Optional[List[EventInfo]]
     final_itinerary: Optional[Itinerary]
     evaluation_result: Optional[EvaluationResult] 
     refinement_count: int 
-    map_html: Optional[str]
-    markdown_report: Optional[str]
\ No newline at end of file
+    # Large artifacts live in artifacts.artifact_store; the state only keeps their references.
+    activity_search_ref: Optional[str]
+    map_html_ref: Optional[str]
+    report_html_ref: Optional[str]
+    markdown_report: Optional[str]
+    # Absolute deadline of the run (epoch seconds), see deadlines.py.
+    deadline: Optional[float]
+    # Steps cut down to meet the deadline; parallel nodes may both add entries.
+    degradations: Annotated[List[str], operator.add]
+    # Nodes whose outputs are carried over from the run being revised, see revisions.py.
+    reused_nodes: Optional[List[str]]
+    # Flexible-dates price grid, see date_grid.py.
+    date_grid: Optional[dict]
\ No newline at end of file
@@ -0,0 +1,46 @@
+import operator
+from typing import Annotated, List
+from typing_extensions import TypedDict
+from langgraph.cache.memory import InMemoryCache
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import CachePolicy
+from checkpointing import ConditionalCache, has_activities
+
+
+class State(TypedDict):
+    destination: str
+    activities: List[str]
+    degradations: Annotated[List[str], operator.add]
+
+
+def test_degraded_writes_are_not_memoized():
+    calls = []
+
+    def node(state):
+        calls.append(state["destination"])
+        if len(calls) == 1:
+            return {"activities": [], "degradations": ["activity_extractor: activity search failed"]}
+        return {"activities": ["Colosseum"], "degradations": []}
+
+    workflow = StateGraph(State)
+    workflow.add_node("activity_extractor", node, cache_policy=CachePolicy(key_func=lambda state: state["destination"]))
+    workflow.add_edge(START, "activity_extractor")
+    workflow.add_edge("activity_extractor", END)
+    app = workflow.compile(cache=ConditionalCache(InMemoryCache()))
+
+    assert app.invoke({"destination": "Rome"})["activities"] == []
+    assert app.invoke({"destination": "Rome"})["activities"] == ["Colosseum"]
+    assert app.invoke({"destination": "Rome"})["activities"] == ["Colosseum"]
+    assert len(calls) == 2
+
+
+def test_warm_runs_only_store_activities():
+    cache = InMemoryCache()
+    warm_cache = ConditionalCache(cache, cache_if=has_activities)
+    key = (("activity_extractor",), "Rome")
+    warm_cache.set({key: ([("extracted_activities", [])], None)})
+    assert cache.get([key]) == {}
+    warm_cache.set({key: ([("extracted_activities", ["Colosseum"]), ("degradations", ["geocoding_agent: failed"])], None)})
+    assert cache.get([key]) == {}
+    warm_cache.set({key: ([("extracted_activities", ["Colosseum"])], None)})
+    assert key in cache.get([key])
@@ -0,0 +1,62 @@
+from datetime import date, timedelta
+import numpy as np
+import date_grid
+from schemas import TripRequest
+from service_client import flight_service, hotel_service
+
+
+def trip(start: date, nights: int, flexible_days: int = 1) -> TripRequest:
+    return TripRequest(
+        origin="Istanbul", destination="Rome", start_date=start.isoformat(),
+        end_date=(start + timedelta(days=nights)).isoformat(), person=2, budget=2000,
+        interests=["art"], daily_spending_budget=50, flexible_days=flexible_days
+    )
+
+
+def test_candidate_pairs_nearest_first():
+    pairs = date_grid.candidate_pairs(1, 3, -1)
+    assert len(pairs) == 9
+    assert pairs[0] == (0, 0)
+    assert set(pairs[1:5]) == {(-1, 0), (0, -1), (0, 1), (1, 0)}
+    assert [abs(dep) + abs(ret) for dep, ret in pairs] == sorted(abs(dep) + abs(ret) for dep, ret in pairs)
+
+
+def test_candidate_pairs_keep_a_night_at_the_destination():
+    pairs = date_grid.candidate_pairs(2, 1, -2)
+    assert all(1 + ret - dep >= 1 for dep, ret in pairs)
+    assert (1, -1) not in pairs and (0, 0) in pairs
+
+
+def test_candidate_pairs_skip_past_departures():
+    pairs = date_grid.candidate_pairs(2, 3, 0)
+    assert pairs and all(dep >= 0 for dep, _ in pairs)
+
+
+def test_search_date_grid_picks_the_cheapest_pair(monkeypatch):
+    start = date.today() + timedelta(days=30)
+    plan = trip(start, 3)
+    cheapest = ((start + timedelta(days=1)).isoformat(), (start + timedelta(days=3)).isoformat())
+
+    def price_pair(trip_plan, start_date, end_date, deadline):
+        if (start_date, end_date) == cheapest:
+            return 100.0, 150.0
+        if end_date == plan.end_date and start_date < plan.start_date:
+            return np.nan, 200.0  # no flight found: left out of the arg-min
+        return 300.0, 200.0
+
+    monkeypatch.setattr(date_grid, "_price_pair", price_pair)
+    monkeypatch.setattr(flight_service, "is_cached", lambda payload: True)
+    monkeypatch.setattr(hotel_service, "is_cached", lambda payload: True)
+
+    grid = date_grid.search_date_grid(plan)
+    assert grid["best"] == {
+        "start_date": cheapest[0], "end_date": cheapest[1],
+        "flight_price": 100.0, "hotel_price": 150.0, "total_price": 250.0,
+    }
+    assert grid["requested"]["total_price"] == 500.0
+    assert grid["total_prices"][0][1] is None
+    assert grid["calls"] == 0 and grid["unpriced_pairs"] == 0
+
+
+def test_search_date_grid_without_flexible_days():
+    assert date_grid.search_date_grid(trip(date.today() + timedelta(days=30), 3, flexible_days=0)) is None
@@ -0,0 +1,11 @@
+import time
+from deadlines import new_deadline, service_deadline, MIN_SERVICE_BUDGET_SECONDS
+
+
+def test_shortest_deadline_leaves_time_for_service_calls():
+    deadline = new_deadline(1)
+    assert service_deadline({"deadline": deadline}) - time.time() >= MIN_SERVICE_BUDGET_SECONDS - 1
+
+
+def test_runs_without_deadline():
+    assert service_deadline({}) is None
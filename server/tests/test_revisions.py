@@ -0,0 +1,35 @@
+from revisions import affected_nodes
+
+
+def test_selection_only_fields_rerun_nothing():
+    # The evaluator always runs again and re-checks the selection against the budget.
+    assert affected_nodes(["budget"]) == []
+    assert affected_nodes(["budget", "daily_spending_budget"], flexible_dates=True) == []
+
+
+def test_interests_propagate_through_extracted_activities():
+    assert affected_nodes(["interests"]) == ["event_agent", "activity_extractor", "geocoding_agent", "scheduler"]
+
+
+def test_dates():
+    assert affected_nodes(["start_date"]) == ["flight_agent", "hotel_agent", "event_agent", "scheduler"]
+
+
+def test_origin_propagates_through_the_selected_flight():
+    assert affected_nodes(["origin"]) == ["flight_agent", "scheduler"]
+
+
+def test_destination_reruns_every_search_in_graph_order():
+    assert affected_nodes(["destination"]) == [
+        "flight_agent", "hotel_agent", "event_agent", "activity_extractor", "geocoding_agent", "scheduler"
+    ]
+
+
+def test_date_grid_only_for_flexible_dates():
+    assert affected_nodes(["person"]) == ["flight_agent", "hotel_agent", "scheduler"]
+    # The grid may move the dates, so everything reading them runs after it.
+    assert affected_nodes(["person"], flexible_dates=True) == [
+        "date_grid", "flight_agent", "hotel_agent", "event_agent", "scheduler"
+    ]
+    assert affected_nodes(["flexible_days"], flexible_dates=True)[0] == "date_grid"
+    assert affected_nodes(["flexible_days"]) == []
@@ -0,0 +1,161 @@
+"""
+Worker process for EXECUTION_MODE=queue: `python worker.py`.
+
+Claims jobs from the job queue (jobs.py), executes the agent graph for them and
+publishes the run's events to the job's channel, from where the web process streams
+them to the client. Runs WORKER_CONCURRENCY jobs at a time and exposes its metrics
+(job_queue_depth for autoscaling) on WORKER_METRICS_PORT.
+
+On SIGTERM the worker stops claiming jobs, gives the running ones
+WORKER_DRAIN_SECONDS to finish and hands the rest back to the queue; another worker
+resumes them from their last checkpoint. Jobs of a worker that dies without doing
+so are taken over once their lease runs out. Taking over a run from a worker on
+another host needs a checkpointer both can reach.
+"""
+import os
+import time
+import signal
+import socket
+import asyncio
+import logging
+
+from common.log import configure_logging, bind_run_id
+from checkpointing import open_checkpointer, build_node_cache, run_config
+from deadlines import new_deadline
+from jobs import build_job_queue, DONE_EVENT, JOB_LEASE_SECONDS
+from metrics import JOBS, JOB_QUEUE_DEPTH, JOB_QUEUE_WAIT_SECONDS
+from runs import graph_events
+from revisions import RevisionError, build_revision
+from startup import startup_phase
+
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+WORKER_DRAIN_SECONDS = float(os.getenv("WORKER_DRAIN_SECONDS", "20"))
+JOB_POLL_SECONDS = 0.5
+PURGE_INTERVAL_SECONDS = 300
+
+logger = logging.getLogger(__name__)
+
+
+async def _keep_lease(queue, job, worker_id: str):
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            await asyncio.to_thread(queue.heartbeat, job, worker_id)
+        except Exception as e:
+            logger.warning("Could not renew the lease of job %s: %s", job.job_id, e)
+
+
+async def execute_job(graph, queue, job, worker_id: str):
+    """Runs the job's graph and publishes its events, then marks the job done."""
+    bind_run_id(job.run_id)
+    if job.attempts == 1:
+        JOB_QUEUE_WAIT_SECONDS.observe(max(time.time() - job.created_at, 0))
+    lease = asyncio.create_task(_keep_lease(queue, job, worker_id))
+    try:
+        graph_input = job.payload.get("graph_input")
+        revision = job.payload.get("revision")
+        if revision is not None:
+            try:
+                graph_input, _ = await build_revision(graph, revision["run_id"], revision["changes"], job.run_id, revision["deadline"])
+            except RevisionError as e:
+                await asyncio.to_thread(queue.publish, job.job_id, "error", {"message": str(e), "run_id": job.run_id})
+                await asyncio.to_thread(queue.publish, job.job_id, DONE_EVENT, {})
+                await asyncio.to_thread(queue.finish, job)
+                return
+        if graph_input is not None and job.attempts > 1 and graph.checkpointer is not None:
+            if (await graph.aget_state(run_config(job.run_id))).values:
+                logger.info("Job %s was interrupted before; resuming run %s from its checkpoint.", job.job_id, job.run_id)
+                graph_input = None
+                # Like POST /plan-trip/{run_id}/resume: the resumed run gets a fresh time budget.
+                await graph.aupdate_state(run_config(job.run_id), {"deadline": new_deadline()})
+
+        async for event, data in graph_events(graph, graph_input, job.run_id, profile=job.payload.get("profile", False)):
+            await asyncio.to_thread(queue.publish, job.job_id, event, data)
+        await asyncio.to_thread(queue.publish, job.job_id, DONE_EVENT, {})
+        await asyncio.to_thread(queue.finish, job)
+        JOBS.labels("completed").inc()
+    finally:
+        lease.cancel()
+
+
+async def run_workers(graph, queue, stop: asyncio.Event, concurrency: int = WORKER_CONCURRENCY):
+    """Claims and executes jobs until `stop` is set."""
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    running = {}
+    last_purge = 0.0
+    logger.info("Worker %s started (concurrency %s).", worker_id, concurrency)
+    try:
+        while not stop.is_set():
+            for task in [task for task in running if task.done()]:
+                job = running.pop(task)
+                if not task.cancelled() and task.exception() is not None:
+                    # The lease runs out and the job is retried, up to JOB_MAX_ATTEMPTS.
+                    JOBS.labels("failed").inc()
+                    logger.error("Job %s (run %s) failed: %s", job.job_id, job.run_id, task.exception())
+
+            if len(running) < concurrency:
+                job = await asyncio.to_thread(queue.claim, worker_id)
+                if job is not None:
+                    logger.info("Claimed job %s (run %s, attempt %s).", job.job_id, job.run_id, job.attempts)
+                    running[asyncio.create_task(execute_job(graph, queue, job, worker_id))] = job
+                    continue
+
+            if time.monotonic() - last_purge > PURGE_INTERVAL_SECONDS:
+                last_purge = time.monotonic()
+                JOB_QUEUE_DEPTH.set(await asyncio.to_thread(queue.depth))
+                await asyncio.to_thread(queue.purge)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await _drain(queue, running)
+
+
+async def _drain(queue, running: dict):
+    """Lets running jobs finish for WORKER_DRAIN_SECONDS, then hands the others back to the queue."""
+    if not running:
+        return
+    logger.info("Stopping: waiting up to %ss for %s running job(s).", WORKER_DRAIN_SECONDS, len(running))
+    _, unfinished = await asyncio.wait(running, timeout=WORKER_DRAIN_SECONDS)
+    for task in unfinished:
+        task.cancel()
+    await asyncio.gather(*unfinished, return_exceptions=True)
+    for task in unfinished:
+        job = running[task]
+        logger.info("Handing job %s (run %s) back to the queue.", job.job_id, job.run_id)
+        await asyncio.to_thread(queue.release, job)
+        JOBS.labels("released").inc()
+
+
+async def main():
+    from prometheus_client import start_http_server
+
+    configure_logging("worker")
+    start_http_server(WORKER_METRICS_PORT)
+
+    with startup_phase("import agent graph"):
+        from agent import compile_app
+        import nodes
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    queue = build_job_queue()
+    async with open_checkpointer() as checkpointer:
+        with startup_phase("compile graph"):
+            graph = compile_app(checkpointer=checkpointer, cache=build_node_cache())
+        warm_up = asyncio.create_task(asyncio.to_thread(nodes.warm_up))
+        try:
+            await run_workers(graph, queue, stop)
+        finally:
+            warm_up.cancel()
+            nodes.render_pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
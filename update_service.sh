@@ -28,7 +28,9 @@ if [ "$SHORT_SERVICE_NAME" == "orchestrator" ]; then
 elif [ "$SHORT_SERVICE_NAME" == "frontend" ]; then
     DOCKER_CONTEXT="client"
 else
-    DOCKER_CONTEXT="server/services/$SHORT_SERVICE_NAME"
+    # Microservices are built from the server/ context so they can include server/common.
+    DOCKER_CONTEXT="server"
+    DOCKERFILE="server/services/$SHORT_SERVICE_NAME/Dockerfile"
 fi
 
 IMAGE_NAME="$DOCKER_USER/$FULL_SERVICE_NAME:$NEW_TAG"
@@ -43,6 +45,8 @@ if [ "$SHORT_SERVICE_NAME" == "frontend" ]; then
     BACKEND_URL="http://$(oc get route travel-orchestrator-route -o jsonpath='{.spec.host}')"
     echo "Backend URL: $BACKEND_URL"
     docker build --build-arg VITE_API_URL=$BACKEND_URL -t $IMAGE_NAME $DOCKER_CONTEXT
+elif [ -n "$DOCKERFILE" ]; then
+    docker build -t $IMAGE_NAME -f $DOCKERFILE $DOCKER_CONTEXT
 else
     docker build -t $IMAGE_NAME $DOCKER_CONTEXT
 fi